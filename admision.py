@@ -0,0 +1,247 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+
+from metricas import Contador, Histograma, Indicador, registrar
+
+# ==========================================
+# CONTROL DE ADMISIÓN DE LLAMADAS A LOS MODELOS
+# ==========================================
+# Todas las llamadas a DeepSeek (chat) y a Whisper en Replicate
+# (transcripción) pasan por un limitador por recurso:
+#   - concurrencia máxima de llamadas en curso;
+#   - presupuesto por minuto (cubeta de tokens): tokens de DeepSeek para
+#     chat, segundos de audio para transcripción;
+#   - cola de espera acotada y en orden de llegada.
+# Con la cola llena, o si la espera supera ADMISION_ESPERA_MAXIMA, la
+# llamada falla enseguida con Saturado, que main.py convierte en un 429
+# con Retry-After. Así, ante una ráfaga, unos pedidos se atienden rápido y
+# el resto reintenta más tarde, en vez de ir todos lentos y chocar con los
+# límites del proveedor. El tiempo en cola queda en /metrics.
+# Los límites son por proceso (cada worker de uvicorn tiene los suyos).
+
+ADMISION_CHAT_CONCURRENCIA = int(os.environ.get("ADMISION_CHAT_CONCURRENCIA", "16"))
+ADMISION_CHAT_TOKENS_POR_MINUTO = int(os.environ.get("ADMISION_CHAT_TOKENS_POR_MINUTO", "300000"))
+ADMISION_TRANSCRIPCION_CONCURRENCIA = int(os.environ.get("ADMISION_TRANSCRIPCION_CONCURRENCIA", "8"))
+# Segundos de audio que se mandan a Whisper por minuto
+ADMISION_TRANSCRIPCION_SEGUNDOS_POR_MINUTO = int(os.environ.get("ADMISION_TRANSCRIPCION_SEGUNDOS_POR_MINUTO", "7200"))
+ADMISION_MAX_COLA = int(os.environ.get("ADMISION_MAX_COLA", "100"))
+ADMISION_ESPERA_MAXIMA = float(os.environ.get("ADMISION_ESPERA_MAXIMA", "120"))
+# Tokens de respuesta que se reservan por llamada de chat (se ajusta con el uso real)
+ADMISION_TOKENS_RESPUESTA = int(os.environ.get("ADMISION_TOKENS_RESPUESTA", "1000"))
+
+# Para estimar la duración de un audio que no se midió (aprox. un MP3 de 128 kbps)
+BYTES_POR_SEGUNDO_AUDIO = 16000
+
+espera_admision = registrar(Histograma(
+    "biodeco_admision_espera_segundos", "Tiempo en la cola de admisión antes de llamar al modelo.", ("recurso",)
+))
+en_cola_admision = registrar(Indicador(
+    "biodeco_admision_en_cola", "Llamadas esperando turno.", ("recurso",)
+))
+en_curso_admision = registrar(Indicador(
+    "biodeco_admision_en_curso", "Llamadas admitidas en curso.", ("recurso",)
+))
+rechazos_admision = registrar(Contador(
+    "biodeco_admision_rechazos_total", "Llamadas rechazadas por saturación.", ("recurso", "motivo")
+))
+
+
+class Saturado(Exception):
+    """No hay capacidad para el recurso; reintentar en 'reintentar_en' segundos."""
+
+    def __init__(self, recurso, reintentar_en, motivo):
+        super().__init__(f"Servicio saturado ({recurso}); reintenta en {reintentar_en} s.")
+        self.recurso = recurso
+        self.reintentar_en = reintentar_en
+        self.motivo = motivo
+
+
+class Reserva:
+    def __init__(self, limitador, costo):
+        self.limitador = limitador
+        self.costo = costo
+        self.inicio = time.monotonic()
+
+    def ajustar(self, costo_real):
+        """Corrige la cubeta con el costo real (p. ej. tokens que informó la API)."""
+        self.limitador._cobrar(costo_real - self.costo)
+        self.costo = costo_real
+
+
+class Limitador:
+    def __init__(self, recurso, concurrencia, por_minuto, max_cola=ADMISION_MAX_COLA, espera_maxima=ADMISION_ESPERA_MAXIMA):
+        self.recurso = recurso
+        self.concurrencia = max(1, concurrencia)
+        self.por_minuto = max(0, por_minuto)    # 0 = sin presupuesto por minuto
+        self.max_cola = max_cola
+        self.espera_maxima = espera_maxima
+        self._loop = None
+
+    def _atar_loop(self):
+        # Igual que los clientes de IA: el estado vive en el loop que lo usa
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._cola = deque()
+            self._en_curso = 0
+            self._disponible = float(self.por_minuto)
+            self._ultima_recarga = time.monotonic()
+            self._duracion_media = 1.0
+            self._cambio = loop.create_future()
+
+    def _avisar(self):
+        """Despierta a los que esperan para que revisen si ya es su turno."""
+        if not self._cambio.done():
+            self._cambio.set_result(None)
+        self._cambio = self._loop.create_future()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        if self.por_minuto:
+            self._disponible = min(
+                float(self.por_minuto),
+                self._disponible + (ahora - self._ultima_recarga) * self.por_minuto / 60,
+            )
+        self._ultima_recarga = ahora
+
+    def _cobrar(self, cantidad):
+        if not self.por_minuto or self._loop is None:
+            return
+        self._recargar()
+        self._disponible -= cantidad
+        if cantidad < 0:
+            self._avisar()
+
+    def _segundos_para(self, costo):
+        """Cuánto falta para que la cubeta tenga 'costo' disponible."""
+        if not self.por_minuto or self._disponible >= costo:
+            return 0.0
+        return (costo - self._disponible) * 60 / self.por_minuto
+
+    def _reintentar_en(self, costo):
+        # Lo que tarda en vaciarse la cola delante más lo que falta de presupuesto
+        por_cola = self._duracion_media * (len(self._cola) + 1) / self.concurrencia
+        return max(1, math.ceil(max(por_cola, self._segundos_para(costo))))
+
+    def _rechazar(self, costo, motivo):
+        rechazos_admision.inc(recurso=self.recurso, motivo=motivo)
+        print(f"🚦 Admisión rechazada ({self.recurso}, {motivo}).")
+        return Saturado(self.recurso, self._reintentar_en(costo), motivo)
+
+    async def adquirir(self, costo=0):
+        self._atar_loop()
+        costo = min(max(costo, 0), self.por_minuto) if self.por_minuto else 0
+        if len(self._cola) >= self.max_cola:
+            raise self._rechazar(costo, "cola_llena")
+        self._recargar()
+        if self._segundos_para(costo) > self.espera_maxima:
+            # Ni esperando todo lo permitido alcanzaría el presupuesto: mejor avisar ya
+            raise self._rechazar(costo, "presupuesto")
+
+        turno = object()
+        self._cola.append(turno)
+        en_cola_admision.fijar(len(self._cola), recurso=self.recurso)
+        inicio = time.monotonic()
+        limite = inicio + self.espera_maxima
+        try:
+            while True:
+                self._recargar()
+                primero = self._cola[0] is turno
+                hay_lugar = self._en_curso < self.concurrencia
+                if primero and hay_lugar and self._segundos_para(costo) == 0:
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise self._rechazar(costo, "espera_agotada")
+                # Si solo falta presupuesto, nadie avisa: se despierta cuando se recargue
+                espera = min(restante, self._segundos_para(costo)) if primero and hay_lugar else restante
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._cambio), espera)
+                except asyncio.TimeoutError:
+                    pass
+            self._disponible -= costo
+            self._en_curso += 1
+        finally:
+            self._cola.remove(turno)
+            en_cola_admision.fijar(len(self._cola), recurso=self.recurso)
+            # Cambió la cabeza de la cola
+            self._avisar()
+
+        espera_admision.observar(time.monotonic() - inicio, recurso=self.recurso)
+        en_curso_admision.fijar(self._en_curso, recurso=self.recurso)
+        return Reserva(self, costo)
+
+    def liberar(self, reserva):
+        self._en_curso -= 1
+        en_curso_admision.fijar(self._en_curso, recurso=self.recurso)
+        # Media móvil de cuánto dura una llamada, para calcular el Retry-After
+        self._duracion_media = 0.8 * self._duracion_media + 0.2 * (time.monotonic() - reserva.inicio)
+        self._avisar()
+
+    @asynccontextmanager
+    async def reservar(self, costo=0):
+        reserva = await self.adquirir(costo)
+        try:
+            yield reserva
+        finally:
+            self.liberar(reserva)
+
+
+limitador_chat = Limitador("chat", ADMISION_CHAT_CONCURRENCIA, ADMISION_CHAT_TOKENS_POR_MINUTO)
+limitador_transcripcion = Limitador(
+    "transcripcion", ADMISION_TRANSCRIPCION_CONCURRENCIA, ADMISION_TRANSCRIPCION_SEGUNDOS_POR_MINUTO
+)
+
+
+def segundos_de_audio(audio, duracion=None):
+    """Duración conocida, o una estimación por tamaño (archivo abierto o ruta)."""
+    if duracion:
+        return duracion
+    try:
+        if isinstance(audio, (str, os.PathLike)):
+            tamano = os.path.getsize(audio)
+        else:
+            posicion = audio.tell()
+            tamano = audio.seek(0, os.SEEK_END)
+            audio.seek(posicion)
+    except (OSError, AttributeError, ValueError):
+        return 0
+    return max(1, tamano // BYTES_POR_SEGUNDO_AUDIO)
+
+
+# --- CÓDIGO SÍNCRONO (CONSOLA Y SCRIPTS) ---
+# El estado de cada limitador vive en el loop que lo usa. Con un
+# asyncio.run por llamada cada una tendría un loop nuevo y vería la cola
+# vacía y la cubeta llena, así que todo el código síncrono comparte un
+# único loop que corre en un hilo aparte.
+
+_loop_sincrono = None
+_lock_loop_sincrono = threading.Lock()
+
+
+def _loop_compartido():
+    global _loop_sincrono
+    with _lock_loop_sincrono:
+        if _loop_sincrono is None:
+            _loop_sincrono = asyncio.new_event_loop()
+            threading.Thread(target=_loop_sincrono.run_forever, name="loop-sincrono", daemon=True).start()
+    return _loop_sincrono
+
+
+def correr_sincrono(corutina):
+    """Como asyncio.run, pero siempre en el mismo loop: los límites se acumulan entre llamadas."""
+    return asyncio.run_coroutine_threadsafe(corutina, _loop_compartido()).result()
+
+
+def llamar_con_admision(limitador, costo, funcion, *args, **kwargs):
+    """Para código síncrono (consola): espera turno y corre 'funcion' en un hilo."""
+    async def llamar():
+        async with limitador.reservar(costo):
+            return await asyncio.to_thread(funcion, *args, **kwargs)
+
+    return correr_sincrono(llamar())
@@ -0,0 +1,133 @@
+import re
+import shutil
+import asyncio
+
+# ==========================================
+# UTILIDADES DE AUDIO (FFMPEG)
+# ==========================================
+# Todo pasa por los binarios ffmpeg/ffprobe del sistema, lanzados como
+# subprocesos async para no bloquear el event loop. Si no están instalados,
+# quien llama debe caer al camino sin procesamiento de audio.
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+
+
+class ErrorAudio(Exception):
+    """ffmpeg/ffprobe falló o no está disponible."""
+
+
+def ffmpeg_disponible():
+    return FFMPEG is not None and FFPROBE is not None
+
+
+async def _ejecutar(*args):
+    proceso = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    salida, errores = await proceso.communicate()
+    if proceso.returncode != 0:
+        raise ErrorAudio(errores.decode("utf-8", "replace")[-500:])
+    return salida.decode("utf-8", "replace"), errores.decode("utf-8", "replace")
+
+
+async def medir_duracion(ruta):
+    """Duración en segundos según ffprobe."""
+    if not ffmpeg_disponible():
+        raise ErrorAudio("ffprobe no está instalado.")
+    salida, _ = await _ejecutar(
+        FFPROBE, "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        ruta,
+    )
+    try:
+        return float(salida.strip())
+    except ValueError:
+        # "N/A" en contenedores sin duración en la cabecera (p. ej. webm de MediaRecorder)
+        raise ErrorAudio(f"ffprobe no informó la duración: {salida.strip()[:100]!r}")
+
+
+async def detectar_silencios(ruta, umbral_db=-35, minimo=0.5):
+    """Lista de (inicio, fin) en segundos de los tramos en silencio."""
+    if not ffmpeg_disponible():
+        raise ErrorAudio("ffmpeg no está instalado.")
+    _, errores = await _ejecutar(
+        FFMPEG, "-hide_banner", "-nostats", "-i", ruta,
+        "-af", f"silencedetect=noise={umbral_db}dB:d={minimo}",
+        "-f", "null", "-",
+    )
+    inicios = [float(x) for x in re.findall(r"silence_start: (-?[\d.]+)", errores)]
+    fines = [float(x) for x in re.findall(r"silence_end: ([\d.]+)", errores)]
+    return list(zip(inicios, fines))
+
+
+async def recortar(ruta, inicio, fin, destino):
+    """Extrae [inicio, fin] a 'destino' en FLAC mono 16 kHz (lo que usa Whisper)."""
+    if not ffmpeg_disponible():
+        raise ErrorAudio("ffmpeg no está instalado.")
+    await _ejecutar(
+        FFMPEG, "-hide_banner", "-nostats", "-y",
+        "-ss", f"{inicio:.3f}", "-t", f"{fin - inicio:.3f}", "-i", ruta,
+        "-vn", "-ac", "1", "-ar", "16000", "-c:a", "flac",
+        destino,
+    )
+    return destino
+
+
+def _duracion_de_salida(errores):
+    """Duración que ffmpeg imprime al abrir la entrada ("Duration: 00:01:02.34")."""
+    encontrada = re.search(r"Duration: (\d+):(\d+):([\d.]+)", errores)
+    if not encontrada:
+        return None
+    horas, minutos, segundos = encontrada.groups()
+    return int(horas) * 3600 + int(minutos) * 60 + float(segundos)
+
+
+async def tramo_con_voz(ruta, umbral_db=-45, minimo=0.3):
+    """(inicio, fin, duracion): el audio sin el silencio del principio y del final.
+
+    Solo necesita ffmpeg. Los silencios del medio se respetan (son pausas
+    del paciente, no basura).
+    """
+    if FFMPEG is None:
+        raise ErrorAudio("ffmpeg no está instalado.")
+    _, errores = await _ejecutar(
+        FFMPEG, "-hide_banner", "-nostats", "-i", ruta,
+        "-vn", "-ac", "1", "-af", f"silencedetect=noise={umbral_db}dB:d={minimo}",
+        "-f", "null", "-",
+    )
+    duracion = _duracion_de_salida(errores)
+    inicios = [float(x) for x in re.findall(r"silence_start: (-?[\d.]+)", errores)]
+    fines = [float(x) for x in re.findall(r"silence_end: ([\d.]+)", errores)]
+    if duracion is None:
+        # Sin duración en la cabecera (p. ej. webm de MediaRecorder): la da el último silencio
+        duracion = max(fines + inicios, default=0.0)
+    inicio, fin = 0.0, duracion
+    if inicios and inicios[0] <= 0.05 and fines:
+        inicio = fines[0]
+    # El silencio final llega hasta el final del archivo; según la versión
+    # de ffmpeg viene sin silence_end o con uno igual a la duración
+    if inicios and inicios[-1] > inicio and (len(inicios) > len(fines) or fines[-1] >= duracion - 0.1):
+        fin = inicios[-1]
+    return inicio, fin, duracion
+
+
+async def normalizar(ruta, destino, inicio=0.0, fin=None, codec="libopus", bitrate="24k"):
+    """Reescribe [inicio, fin] en mono 16 kHz con un códec compacto (Opus por defecto)."""
+    if FFMPEG is None:
+        raise ErrorAudio("ffmpeg no está instalado.")
+    tramo = ["-ss", f"{inicio:.3f}"]
+    if fin is not None:
+        tramo += ["-t", f"{fin - inicio:.3f}"]
+    calidad = ["-b:a", bitrate] if codec != "flac" else []
+    await _ejecutar(
+        FFMPEG, "-hide_banner", "-nostats", "-y",
+        *tramo, "-i", ruta,
+        "-vn", "-map_metadata", "-1", "-ac", "1", "-ar", "16000",
+        "-c:a", codec, *calidad,
+        destino,
+    )
+    return destino
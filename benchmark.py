@@ -0,0 +1,314 @@
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import wave
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+import httpx
+
+from servidores_falsos import crear_app_deepseek, crear_app_replicate, ServidorEnHilo
+
+# ==========================================
+# BENCHMARK CONTRA DEEPSEEK Y REPLICATE FALSOS
+# ==========================================
+# Levanta los servidores falsos y el servicio real (uvicorn en un hilo),
+# siembra la base con N reportes y lanza carga contra cada escenario.
+# Por escenario informa throughput, latencia p50/p95/p99 y memoria (RSS).
+#
+#   python benchmark.py --peticiones 200 --concurrencia 20 --reportes 5000
+#   python benchmark.py --json actual.json --comparar base.json
+#
+# Con --comparar sale con código 1 si algún escenario empeora más que
+# --tolerancia respecto de la corrida base: así se ve la regresión antes
+# del deploy. Todo corre en un solo proceso, así que los números sirven
+# para comparar corridas entre sí, no como capacidad absoluta.
+
+ESCENARIOS = ("analyze_text", "analyze_audio", "design_assistant", "historial")
+
+
+def _configurar_entorno(args, deepseek, replicate):
+    """Variables que leen los módulos del servicio al importarse."""
+    os.environ["DEEPSEEK_BASE_URL"] = deepseek.url
+    os.environ["REPLICATE_BASE_URL"] = replicate.url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "falsa")
+    os.environ.setdefault("REPLICATE_API_TOKEN", "falso")
+    os.environ["REPLICATE_POLL_INTERVAL"] = "0.05"
+    os.environ["LOG_ESTRUCTURADO"] = "0"
+    if not args.db:
+        carpeta = tempfile.mkdtemp(prefix="benchmark_")
+        args.db = f"sqlite:///{os.path.join(carpeta, 'benchmark.db')}"
+    os.environ["DATABASE_URL"] = args.db
+
+
+def _sembrar_reportes(cantidad):
+    """Inserta 'cantidad' reportes de ejemplo en lotes."""
+    from database import SessionLocal, engine
+    from migraciones import aplicar_migraciones
+    from servidores_falsos import REPORTE_FALSO
+    from procesamiento import construir_reporte
+
+    aplicar_migraciones(engine)
+    db = SessionLocal()
+    try:
+        for inicio in range(0, cantidad, 1000):
+            db.add_all([
+                construir_reporte({**REPORTE_FALSO, "motivo_consulta": f"Reporte sembrado {i}"})
+                for i in range(inicio, min(cantidad, inicio + 1000))
+            ])
+            db.commit()
+    finally:
+        db.close()
+
+
+def _audio_wav(segundos=5, frecuencia=16000):
+    """WAV mono con ruido leve; cada llamada da bytes distintos (otro SHA-256)."""
+    muestras = bytes(b % 8 for b in os.urandom(segundos * frecuencia * 2))
+    salida = io.BytesIO()
+    with wave.open(salida, "wb") as archivo:
+        archivo.setnchannels(1)
+        archivo.setsampwidth(2)
+        archivo.setframerate(frecuencia)
+        archivo.writeframes(muestras)
+    return salida.getvalue()
+
+
+# --- PETICIONES DE CADA ESCENARIO ---
+# Cada una devuelve True si la respuesta fue un éxito.
+# Los análisis llevan una Idempotency-Key única: sin ella, los audios que se
+# repiten saldrían del registro de idempotencia y no medirían el pipeline.
+
+def _clave(estado, i):
+    return {"Idempotency-Key": f"benchmark-{estado['corrida']}-{i}"}
+
+
+async def _pedir_analyze_text(cliente, i, estado, args):
+    texto = f"Sesión de prueba {i}. " + "El paciente habla de su trabajo y de su padre. " * args.repeticiones_texto
+    r = await cliente.post(
+        "/analyze_text", json={"texto": texto, "usar_cache": args.con_cache}, headers=_clave(estado, i)
+    )
+    return r.status_code == 200 and "error" not in r.json()
+
+
+async def _pedir_analyze_audio(cliente, i, estado, args):
+    archivos = {"file": (f"sesion_{i}.wav", estado["audios"][i % len(estado["audios"])], "audio/wav")}
+    r = await cliente.post(
+        "/analyze_audio",
+        files=archivos,
+        params={"usar_cache": str(args.con_cache).lower(), "modo_transcripcion": "completa"},
+        headers=_clave(estado, i),
+    )
+    return r.status_code == 200 and "error" not in r.json()
+
+
+async def _pedir_design_assistant(cliente, i, estado, args):
+    r = await cliente.post("/design_assistant", json={"descripcion": f"Terapeuta {i}", "contexto": {"enfoque": "ecléctico"}})
+    return r.status_code == 200
+
+
+async def _pedir_historial(cliente, i, estado, args):
+    # Cada petición sigue el cursor de la anterior; al llegar al final vuelve a empezar
+    params = {"limit": args.limit_historial, "fields": "resumen"}
+    if estado.get("cursor"):
+        params["cursor"] = estado["cursor"]
+    r = await cliente.get("/historial", params=params)
+    estado["cursor"] = r.headers.get("X-Siguiente-Cursor")
+    return r.status_code == 200
+
+
+PETICIONES = {
+    "analyze_text": _pedir_analyze_text,
+    "analyze_audio": _pedir_analyze_audio,
+    "design_assistant": _pedir_design_assistant,
+    "historial": _pedir_historial,
+}
+
+
+# --- MEDICIÓN ---
+
+def _rss_mb():
+    """RSS actual del proceso en MB (Linux); None si no se puede leer."""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+        return round(paginas * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _pico_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+async def correr_escenario(url, nombre, args):
+    pedir = PETICIONES[nombre]
+    estado = {"corrida": uuid.uuid4().hex[:8]}
+    if nombre == "analyze_audio":
+        estado["audios"] = [_audio_wav(args.segundos_audio) for _ in range(min(args.peticiones, 8))]
+
+    latencias = []
+    errores = 0
+    contador = iter(range(args.peticiones))
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limites) as cliente:
+        async def usuario():
+            nonlocal errores
+            estado_usuario = dict(estado)
+            for i in contador:
+                inicio = time.perf_counter()
+                try:
+                    ok = await pedir(cliente, i, estado_usuario, args)
+                except Exception:
+                    ok = False
+                latencias.append(time.perf_counter() - inicio)
+                if not ok:
+                    errores += 1
+
+        rss_inicio = _rss_mb()
+        inicio = time.perf_counter()
+        await asyncio.gather(*[usuario() for _ in range(args.concurrencia)])
+        duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+
+    def ms(valor):
+        return round(valor * 1000, 1) if valor is not None else None
+
+    return {
+        "escenario": nombre,
+        "peticiones": len(latencias),
+        "errores": errores,
+        "concurrencia": args.concurrencia,
+        "duracion_s": round(duracion, 3),
+        "throughput_rps": round(len(latencias) / duracion, 2) if duracion else None,
+        "p50_ms": ms(percentil(latencias, 50)),
+        "p95_ms": ms(percentil(latencias, 95)),
+        "p99_ms": ms(percentil(latencias, 99)),
+        "max_ms": ms(latencias[-1] if latencias else None),
+        "rss_inicio_mb": rss_inicio,
+        "rss_fin_mb": _rss_mb(),
+        "rss_pico_mb": _pico_rss_mb(),
+    }
+
+
+def imprimir_tabla(resultados):
+    columnas = ("escenario", "peticiones", "errores", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "rss_fin_mb", "rss_pico_mb")
+    anchos = [max(len(c), *(len(str(r[c])) for r in resultados)) for c in columnas]
+    print("  ".join(c.ljust(a) for c, a in zip(columnas, anchos)))
+    for r in resultados:
+        print("  ".join(str(r[c]).ljust(a) for c, a in zip(columnas, anchos)))
+
+
+def comparar(resultados, base, tolerancia):
+    """Lista de regresiones respecto de 'base' (mismo formato que --json)."""
+    base = {r["escenario"]: r for r in base}
+    regresiones = []
+    for r in resultados:
+        anterior = base.get(r["escenario"])
+        if not anterior:
+            continue
+        for campo in ("p50_ms", "p95_ms", "p99_ms"):
+            if anterior.get(campo) and r[campo] > anterior[campo] * (1 + tolerancia):
+                regresiones.append(f"{r['escenario']}: {campo} {anterior[campo]} -> {r[campo]}")
+        if anterior.get("throughput_rps") and r["throughput_rps"] < anterior["throughput_rps"] * (1 - tolerancia):
+            regresiones.append(f"{r['escenario']}: throughput_rps {anterior['throughput_rps']} -> {r['throughput_rps']}")
+        # Con errores simulados el conteo varía entre corridas; solo se compara sin ellos
+        if not r.get("tasa_error_simulada") and r["errores"] > anterior.get("errores", 0):
+            regresiones.append(f"{r['escenario']}: errores {anterior.get('errores', 0)} -> {r['errores']}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del backend.")
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--peticiones", type=int, default=100, help="Peticiones por escenario")
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--reportes", type=int, default=1000, help="Reportes sembrados para /historial")
+    parser.add_argument("--latencia", type=float, default=0.2, help="Segundos por llamada de chat falsa")
+    parser.add_argument("--latencia-whisper", type=float, default=1.0, help="Segundos por transcripción falsa")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--errores", type=float, default=0.0, help="Probabilidad de error de los servidores falsos")
+    parser.add_argument("--con-cache", action="store_true", help="Deja activo el cache de reportes/transcripciones")
+    parser.add_argument("--repeticiones-texto", type=int, default=50, help="Largo del texto de /analyze_text")
+    parser.add_argument("--segundos-audio", type=int, default=5)
+    parser.add_argument("--limit-historial", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--db", default=None, help="DATABASE_URL (por defecto un SQLite temporal)")
+    parser.add_argument("--json", default=None, help="Guarda los resultados en este archivo")
+    parser.add_argument("--comparar", default=None, help="Resultados base (--json de otra corrida)")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    parser.add_argument("--verboso", action="store_true", help="Muestra los logs del servicio")
+    args = parser.parse_args()
+
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    desconocidos = [e for e in escenarios if e not in PETICIONES]
+    if desconocidos:
+        parser.error(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+
+    deepseek = ServidorEnHilo(crear_app_deepseek(args.latencia, args.jitter, args.errores)).iniciar()
+    replicate = ServidorEnHilo(crear_app_replicate(args.latencia_whisper, args.jitter, args.errores)).iniciar()
+    _configurar_entorno(args, deepseek, replicate)
+
+    salida = contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())
+    with salida:
+        # Se importa recién ahora: los módulos leen el entorno al cargarse
+        import main as servicio
+        _sembrar_reportes(args.reportes)
+    servidor = ServidorEnHilo(servicio.app).iniciar()
+
+    print(f"🧪 Benchmark: {args.peticiones} peticiones x escenario, concurrencia {args.concurrencia}, "
+          f"{args.reportes} reportes sembrados, latencia falsa {args.latencia}s ± {args.jitter}s, errores {args.errores}")
+
+    resultados = []
+    try:
+        for nombre in escenarios:
+            print(f"⏱️ {nombre}...")
+            with (contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())):
+                resultado = asyncio.run(correr_escenario(servidor.url, nombre, args))
+            resultado["tasa_error_simulada"] = args.errores
+            resultados.append(resultado)
+    finally:
+        servidor.detener()
+        deepseek.detener()
+        replicate.detener()
+
+    imprimir_tabla(resultados)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.json}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        if regresiones:
+            print("❌ Regresiones:")
+            for r in regresiones:
+                print(f"   - {r}")
+            sys.exit(1)
+        print("✅ Sin regresiones respecto de la base.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import re
+import json
+import base64
+from typing import List, Optional
+
+from pydantic import TypeAdapter
+from sqlalchemy import select, func, text, literal_column, table, column
+
+import models
+from historial import ReporteHistorial, CAMPOS, CAMPOS_RESUMEN
+from metricas import medir
+
+# ==========================================
+# BÚSQUEDA DE TEXTO COMPLETO EN EL HISTORIAL
+# ==========================================
+# Índice de texto completo sobre los campos clínicos de cada reporte:
+#   Postgres: columna tsvector generada (configuración 'spanish', con
+#             stemming) + índice GIN. La calcula Postgres en cada INSERT.
+#   SQLite:   tabla FTS5 de contenido externo sobre 'reportes', mantenida
+#             por triggers en INSERT/UPDATE/DELETE.
+# En los dos casos el índice se actualiza en la misma transacción que el
+# reporte, sin reindexar la tabla. Los resultados van ordenados por
+# relevancia (ts_rank_cd / bm25) y paginados con un cursor opaco.
+
+BUSQUEDA_LIMIT_DEFECTO = 20
+BUSQUEDA_LIMIT_MAXIMO = 100
+IDIOMA = "spanish"
+
+# Campos indexados; los primeros cuatro pesan más que los textos largos
+CAMPOS_INDEXADOS = (
+    "motivo_consulta", "emocion_base", "organo_afectado", "conflicto_biologico",
+    "hallazgos_clinicos", "resumen_sesion",
+)
+PESOS = {
+    "motivo_consulta": "A", "emocion_base": "A", "organo_afectado": "A", "conflicto_biologico": "A",
+    "hallazgos_clinicos": "B", "resumen_sesion": "B",
+}
+PESOS_BM25 = {"A": 2.0, "B": 1.0}
+
+MARCA_INICIO, MARCA_FIN = "<b>", "</b>"
+
+# La tabla FTS5 de SQLite no está en models (no la maneja el ORM)
+tabla_fts = table("reportes_fts", column("rowid"))
+
+
+# --- ÍNDICE (lo crea la migración 3, ver migraciones.py) ---
+
+def _crear_indice_postgres(conexion):
+    vector = " || ".join(
+        f"setweight(to_tsvector('{IDIOMA}', coalesce({c}, '')), '{PESOS[c]}')" for c in CAMPOS_INDEXADOS
+    )
+    conexion.execute(text(
+        f"ALTER TABLE reportes ADD COLUMN IF NOT EXISTS busqueda tsvector "
+        f"GENERATED ALWAYS AS ({vector}) STORED"
+    ))
+    conexion.execute(text("CREATE INDEX IF NOT EXISTS ix_reportes_busqueda ON reportes USING GIN (busqueda)"))
+
+
+def _crear_indice_sqlite(conexion):
+    columnas = ", ".join(CAMPOS_INDEXADOS)
+    nuevos = ", ".join(f"new.{c}" for c in CAMPOS_INDEXADOS)
+    viejos = ", ".join(f"old.{c}" for c in CAMPOS_INDEXADOS)
+    existia = conexion.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reportes_fts'"
+    )).first()
+    conexion.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS reportes_fts USING fts5({columnas}, "
+        f"content='reportes', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    # Con contenido externo, borrar del índice es insertar el comando 'delete' con los valores viejos
+    conexion.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS reportes_fts_insert AFTER INSERT ON reportes BEGIN "
+        f"INSERT INTO reportes_fts(rowid, {columnas}) VALUES (new.id, {nuevos}); END"
+    ))
+    conexion.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS reportes_fts_delete AFTER DELETE ON reportes BEGIN "
+        f"INSERT INTO reportes_fts(reportes_fts, rowid, {columnas}) VALUES ('delete', old.id, {viejos}); END"
+    ))
+    conexion.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS reportes_fts_update AFTER UPDATE ON reportes BEGIN "
+        f"INSERT INTO reportes_fts(reportes_fts, rowid, {columnas}) VALUES ('delete', old.id, {viejos}); "
+        f"INSERT INTO reportes_fts(rowid, {columnas}) VALUES (new.id, {nuevos}); END"
+    ))
+    if not existia:
+        # Indexa los reportes que ya estaban (una sola vez)
+        conexion.execute(text("INSERT INTO reportes_fts(reportes_fts) VALUES ('rebuild')"))
+
+
+def crear_indice(conexion):
+    if conexion.dialect.name == "postgresql":
+        _crear_indice_postgres(conexion)
+    elif conexion.dialect.name == "sqlite":
+        _crear_indice_sqlite(conexion)
+    else:
+        print(f"⚠️ Búsqueda de texto completo no disponible en {conexion.dialect.name}.")
+
+
+# --- CONSULTA ---
+
+class ConsultaInvalida(ValueError):
+    pass
+
+
+class ResultadoBusqueda(ReporteHistorial):
+    relevancia: Optional[float] = None
+    fragmento: Optional[str] = None
+
+
+_adaptador_resultados = TypeAdapter(List[ResultadoBusqueda])
+
+
+def codificar_cursor(desplazamiento):
+    return base64.urlsafe_b64encode(json.dumps({"o": desplazamiento}).encode("utf-8")).decode("ascii")
+
+
+def decodificar_cursor(cursor):
+    try:
+        desplazamiento = int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["o"])
+    except Exception:
+        raise ConsultaInvalida("Cursor inválido.")
+    if desplazamiento < 0:
+        raise ConsultaInvalida("Cursor inválido.")
+    return desplazamiento
+
+
+def _terminos(q):
+    return re.findall(r"\w+", q or "")
+
+
+def _consulta_fts5(q):
+    """Texto libre -> expresión MATCH de FTS5: cada palabra como prefijo, todas obligatorias.
+
+    El prefijo suple en parte la falta de stemming ('ansied' encuentra 'ansiedad').
+    """
+    return " ".join(f'"{t}"*' for t in _terminos(q))
+
+
+def _seleccion_postgres(columnas, q):
+    # La configuración va literal: como parámetro asyncpg no sabría que es un regconfig
+    idioma = literal_column(f"'{IDIOMA}'::regconfig")
+    consulta_ts = func.websearch_to_tsquery(idioma, q)
+    vector = literal_column("reportes.busqueda")
+    relevancia = func.ts_rank_cd(vector, consulta_ts)
+    texto = func.concat_ws(" … ", *[getattr(models.Reporte, c) for c in CAMPOS_INDEXADOS])
+    fragmento = func.ts_headline(
+        idioma, texto, consulta_ts,
+        f"StartSel={MARCA_INICIO}, StopSel={MARCA_FIN}, MaxWords=30, MinWords=10",
+    )
+    return (
+        select(*columnas, relevancia.label("relevancia"), fragmento.label("fragmento"))
+        .where(vector.op("@@")(consulta_ts))
+        .order_by(relevancia.desc(), models.Reporte.id.desc())
+    )
+
+
+def _seleccion_sqlite(columnas, q):
+    fts = literal_column("reportes_fts")
+    pesos = [PESOS_BM25[PESOS[c]] for c in CAMPOS_INDEXADOS]
+    bm25 = func.bm25(fts, *pesos)   # más negativo = más relevante
+    fragmento = func.snippet(fts, -1, MARCA_INICIO, MARCA_FIN, "…", 16)
+    return (
+        select(*columnas, (-bm25).label("relevancia"), fragmento.label("fragmento"))
+        .select_from(models.Reporte)
+        .join(tabla_fts, tabla_fts.c.rowid == models.Reporte.id)
+        .where(fts.op("MATCH")(_consulta_fts5(q)))
+        .order_by(bm25, models.Reporte.id.desc())
+    )
+
+
+async def buscar(db, q, limit=BUSQUEDA_LIMIT_DEFECTO, cursor=None, campos=CAMPOS_RESUMEN):
+    """Devuelve (lista de ResultadoBusqueda, siguiente_cursor o None). 'db' es una AsyncSession."""
+    if not _terminos(q):
+        raise ConsultaInvalida("La búsqueda necesita al menos una palabra.")
+    limit = max(1, min(limit, BUSQUEDA_LIMIT_MAXIMO))
+    desplazamiento = decodificar_cursor(cursor) if cursor else 0
+
+    columnas = {"id": models.Reporte.id, "fecha": models.Reporte.created_at}
+    columnas.update({c: CAMPOS[c] for c in campos})
+    columnas = [col.label(nombre) for nombre, col in columnas.items()]
+
+    dialecto = db.bind.dialect.name
+    if dialecto == "postgresql":
+        consulta = _seleccion_postgres(columnas, q)
+    elif dialecto == "sqlite":
+        consulta = _seleccion_sqlite(columnas, q)
+    else:
+        raise ConsultaInvalida(f"Búsqueda no disponible en {dialecto}.")
+
+    with medir("historial_busqueda"):
+        filas = (await db.execute(consulta.limit(limit + 1).offset(desplazamiento))).all()
+
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        siguiente = codificar_cursor(desplazamiento + limit)
+
+    return [ResultadoBusqueda.model_validate(f) for f in filas], siguiente
+
+
+def serializar_resultados(resultados, campos):
+    with medir("historial_serializacion"):
+        return _adaptador_resultados.dump_json(
+            resultados, include={"__all__": set(campos) | {"relevancia", "fragmento"}}
+        )
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import unicodedata
+from collections import OrderedDict
+
+from database import SessionLocal
+import models
+import audio
+from servicios_ia import (
+    generar_reporte_con_etapas, firma_reporte, MODO_REPORTE_POR_DEFECTO,
+    transcribir_sesion_async, firma_transcripcion,
+)
+from segmentacion import transcribir_segmentado, SEGMENTOS_DESDE
+from normalizacion import normalizar_para_whisper
+
+# ==========================================
+# CACHE DE DOS NIVELES (MEMORIA + TABLA)
+# ==========================================
+# Nivel 1: LRU en memoria del proceso (milisegundos).
+# Nivel 2: tabla 'cache_entradas', compartida entre workers y reinicios.
+# Ambos niveles tienen TTL y un máximo de entradas.
+
+CACHE_REPORTES_MAX_MEMORIA = int(os.environ.get("CACHE_REPORTES_MAX_MEMORIA", "256"))
+CACHE_REPORTES_MAX_DB = int(os.environ.get("CACHE_REPORTES_MAX_DB", "5000"))
+CACHE_REPORTES_TTL = int(os.environ.get("CACHE_REPORTES_TTL", str(7 * 24 * 3600)))
+
+CACHE_TRANSCRIPCIONES_MAX_MEMORIA = int(os.environ.get("CACHE_TRANSCRIPCIONES_MAX_MEMORIA", "128"))
+CACHE_TRANSCRIPCIONES_MAX_DB = int(os.environ.get("CACHE_TRANSCRIPCIONES_MAX_DB", "2000"))
+CACHE_TRANSCRIPCIONES_TTL = int(os.environ.get("CACHE_TRANSCRIPCIONES_TTL", str(30 * 24 * 3600)))
+
+# Cada cuántas escrituras se poda la tabla (expirados + exceso de tamaño)
+PODA_CADA = 50
+
+
+class CacheLRU:
+    def __init__(self, max_entradas, ttl):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def obtener(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        expira_en, valor = entrada
+        if expira_en < time.time():
+            del self._datos[clave]
+            return None
+        self._datos.move_to_end(clave)
+        return valor
+
+    def guardar(self, clave, valor, expira_en=None):
+        self._datos[clave] = (expira_en or time.time() + self.ttl, valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+
+    def eliminar(self, clave):
+        return self._datos.pop(clave, None) is not None
+
+
+class CacheDosNiveles:
+    def __init__(self, espacio, max_memoria, max_db, ttl):
+        self.espacio = espacio
+        self.max_db = max_db
+        self.ttl = ttl
+        self._memoria = CacheLRU(max_memoria, ttl)
+        self._escrituras = 0
+        self.contadores = {"aciertos_memoria": 0, "aciertos_db": 0, "fallos": 0, "omitidos": 0}
+
+    async def obtener(self, clave):
+        """Devuelve el valor guardado (ya deserializado) o None."""
+        valor = self._memoria.obtener(clave)
+        if valor is not None:
+            self.contadores["aciertos_memoria"] += 1
+            return json.loads(valor)
+
+        fila = await asyncio.to_thread(self._leer_db, clave)
+        if fila is None:
+            self.contadores["fallos"] += 1
+            return None
+
+        expira_en, valor = fila
+        self.contadores["aciertos_db"] += 1
+        self._memoria.guardar(clave, valor, expira_en)
+        return json.loads(valor)
+
+    async def guardar(self, clave, valor):
+        serializado = json.dumps(valor, ensure_ascii=False)
+        expira_en = time.time() + self.ttl
+        self._memoria.guardar(clave, serializado, expira_en)
+
+        self._escrituras += 1
+        podar = self._escrituras % PODA_CADA == 0
+        await asyncio.to_thread(self._escribir_db, clave, serializado, expira_en, podar)
+
+    def omitido(self):
+        """Registra una petición que pidió saltarse el cache."""
+        self.contadores["omitidos"] += 1
+
+    def estadisticas(self):
+        consultas = self.contadores["aciertos_memoria"] + self.contadores["aciertos_db"] + self.contadores["fallos"]
+        aciertos = self.contadores["aciertos_memoria"] + self.contadores["aciertos_db"]
+        return {
+            **self.contadores,
+            "tasa_aciertos": round(aciertos / consultas, 3) if consultas else 0.0,
+            "entradas_memoria": len(self._memoria),
+            "ttl_segundos": self.ttl,
+        }
+
+    # --- Nivel 2 (síncrono, se ejecuta en un hilo) ---
+
+    def _leer_db(self, clave):
+        db = SessionLocal()
+        try:
+            entrada = db.get(models.EntradaCache, (self.espacio, clave))
+            if entrada is None:
+                return None
+            if entrada.expira_en < time.time():
+                db.delete(entrada)
+                db.commit()
+                return None
+            return entrada.expira_en, entrada.valor
+        finally:
+            db.close()
+
+    def _escribir_db(self, clave, valor, expira_en, podar):
+        db = SessionLocal()
+        try:
+            db.merge(models.EntradaCache(espacio=self.espacio, clave=clave, valor=valor, expira_en=expira_en))
+            db.commit()
+            if podar:
+                self._podar_db(db)
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Error escribiendo cache '{self.espacio}': {e}")
+        finally:
+            db.close()
+
+    def _podar_db(self, db):
+        tabla = models.EntradaCache
+        db.query(tabla).filter(
+            tabla.espacio == self.espacio, tabla.expira_en < time.time()
+        ).delete(synchronize_session=False)
+
+        sobrantes = (
+            db.query(tabla.clave)
+            .filter(tabla.espacio == self.espacio)
+            .order_by(tabla.created_at.desc())
+            .offset(self.max_db)
+            .subquery()
+        )
+        db.query(tabla).filter(
+            tabla.espacio == self.espacio, tabla.clave.in_(sobrantes.select())
+        ).delete(synchronize_session=False)
+        db.commit()
+
+
+# ==========================================
+# CACHE DE REPORTES CLÍNICOS
+# ==========================================
+
+cache_reportes = CacheDosNiveles(
+    "reportes",
+    max_memoria=CACHE_REPORTES_MAX_MEMORIA,
+    max_db=CACHE_REPORTES_MAX_DB,
+    ttl=CACHE_REPORTES_TTL,
+)
+
+
+def normalizar_texto(texto):
+    """Unifica espacios y forma Unicode para que reenvíos idénticos den la misma clave."""
+    return " ".join(unicodedata.normalize("NFC", texto).split())
+
+
+def clave_reporte(texto_transcrito, modo=None):
+    material = {"texto": normalizar_texto(texto_transcrito), **firma_reporte(modo)}
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _metadatos_reporte(reporte, modo, etapas, desde_cache):
+    """Metadatos del reporte; el modo y si se degradó también quedan en el reporte (y en la base).
+
+    Si la Fase 2 falla el pipeline completo termina en modo rápido: 'modo'
+    es el que de verdad armó el reporte, no el pedido.
+    """
+    degradado_a = next((e["degradado"] for e in etapas if "degradado" in e), None)
+    metadatos = {
+        "desde_cache": desde_cache, "modo": degradado_a or modo,
+        "degradado": degradado_a is not None, "etapas": etapas,
+    }
+    if isinstance(reporte, dict):
+        reporte["modo_reporte"] = metadatos["modo"]
+        reporte["degradado"] = metadatos["degradado"]
+    return reporte, metadatos
+
+
+async def generar_reporte_cacheado(texto_transcrito, usar_cache=True, modo=None):
+    """Reporte clínico con cache. Devuelve (reporte, metadatos).
+
+    metadatos: {"desde_cache", "modo", "degradado", "etapas"}; 'etapas' viene vacío si hubo acierto.
+    """
+    modo = modo or MODO_REPORTE_POR_DEFECTO
+    if not usar_cache:
+        cache_reportes.omitido()
+        reporte, etapas = await generar_reporte_con_etapas(texto_transcrito, modo)
+        return _metadatos_reporte(reporte, modo, etapas, desde_cache=False)
+
+    clave = clave_reporte(texto_transcrito, modo)
+    reporte = await cache_reportes.obtener(clave)
+    if reporte is not None:
+        print("⚡ Reporte servido desde cache.")
+        return _metadatos_reporte(reporte, modo, [], desde_cache=True)
+
+    reporte, etapas = await generar_reporte_con_etapas(texto_transcrito, modo)
+    # Solo guardamos reportes completos; los errores (y los reportes degradados
+    # porque falló una etapa) se reintentan la próxima vez
+    etapas_ok = not any("error" in e or "degradado" in e for e in etapas)
+    if isinstance(reporte, dict) and reporte and not reporte.get("error") and etapas_ok:
+        await cache_reportes.guardar(clave, reporte)
+    return _metadatos_reporte(reporte, modo, etapas, desde_cache=False)
+
+
+# ==========================================
+# CACHE DE TRANSCRIPCIONES (POR HASH DEL AUDIO)
+# ==========================================
+
+cache_transcripciones = CacheDosNiveles(
+    "transcripciones",
+    max_memoria=CACHE_TRANSCRIPCIONES_MAX_MEMORIA,
+    max_db=CACHE_TRANSCRIPCIONES_MAX_DB,
+    ttl=CACHE_TRANSCRIPCIONES_TTL,
+)
+
+
+def clave_transcripcion(sha256_audio):
+    material = {"audio": sha256_audio, **firma_transcripcion()}
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def _transcribir(audio_ingerido, modo):
+    """Normaliza el audio y lo transcribe; la normalización queda en los metadatos."""
+    a_transcribir, normalizacion = await normalizar_para_whisper(audio_ingerido)
+    try:
+        texto, metadatos = await _transcribir_normalizado(a_transcribir, modo)
+    finally:
+        if a_transcribir is not audio_ingerido:
+            a_transcribir.cerrar()
+    return texto, {**metadatos, "normalizacion": normalizacion}
+
+
+async def _transcribir_normalizado(audio_ingerido, modo):
+    """Elige entre una sola llamada a Whisper o la transcripción segmentada."""
+    if modo != "completa" and audio.ffmpeg_disponible():
+        ruta = audio_ingerido.asegurar_en_disco()
+        try:
+            duracion = audio_ingerido.duracion or await audio.medir_duracion(ruta)
+            if modo == "segmentada" or duracion > SEGMENTOS_DESDE:
+                return await transcribir_segmentado(ruta, duracion)
+        except audio.ErrorAudio as e:
+            # ffmpeg no pudo medir o cortar el archivo; Whisper puede leerlo entero igual
+            print(f"⚠️ No se pudo segmentar el audio ({e}); se transcribe completo.")
+    elif modo == "segmentada":
+        print("⚠️ ffmpeg no está instalado; se transcribe el audio completo.")
+
+    inicio = time.perf_counter()
+    texto = await transcribir_sesion_async(audio_ingerido.abrir(), audio_ingerido.duracion)
+    return texto, {"modo": "completa", "segmentos": 1, "tiempo_total": round(time.perf_counter() - inicio, 3)}
+
+
+async def transcribir_cacheado(audio_ingerido, usar_cache=True, modo="auto"):
+    """Transcribe un AudioIngerido con cache. Devuelve (texto, metadatos).
+
+    modo: "auto" (segmenta los audios largos), "completa" o "segmentada".
+    """
+    if not usar_cache:
+        cache_transcripciones.omitido()
+        texto, metadatos = await _transcribir(audio_ingerido, modo)
+        return texto, {**metadatos, "desde_cache": False}
+
+    clave = clave_transcripcion(audio_ingerido.sha256)
+    texto = await cache_transcripciones.obtener(clave)
+    if texto is not None:
+        print("⚡ Transcripción servida desde cache (Whisper omitido).")
+        return texto, {"modo": "cache", "desde_cache": True}
+
+    texto, metadatos = await _transcribir(audio_ingerido, modo)
+    if texto:
+        await cache_transcripciones.guardar(clave, texto)
+    return texto, {**metadatos, "desde_cache": False}
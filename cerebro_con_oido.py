@@ -1,6 +1,6 @@
 import os
+import functools
 from dotenv import load_dotenv
-from openai import OpenAI
 import replicate  # <--- IMPORTAMOS LA NUEVA LIBRERÍA
 
 # 1. CARGAMOS LAS VARIABLES
@@ -8,41 +8,48 @@ load_dotenv()
 
 # --- CONFIGURACIÓN DE LOS CLIENTES ---
 
-# Cliente A: EL CEREBRO (DeepSeek)
-client_deepseek = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# El CEREBRO (DeepSeek) usa el cliente compartido de servicios_ia
+from dialogo import pensar_respuesta_async
+# El OÍDO pasa por el mismo control de admisión que el servidor
+from admision import limitador_transcripcion, segundos_de_audio, llamar_con_admision, correr_sincrono
 
 # Nota: Replicate se configura solo automáticamente al leer 
 # la variable REPLICATE_API_TOKEN del archivo .env
 
 # --- MEMORIA DEL TERAPEUTA ---
-SYSTEM_PROMPT = """
-Eres un terapeuta experto en Biodecodificación. Tu objetivo es dialogar,
-hacer preguntas cortas para indagar y encontrar el conflicto emocional.
-Sé cálido y empático.
-"""
-historial = [{"role": "system", "content": SYSTEM_PROMPT}]
+# Cada conversación tiene su propia memoria con presupuesto de tokens
+# (ver dialogo.py); la consola usa siempre la misma sesión.
+SESION_CONSOLA = "consola"
 
 # --- FUNCIONES ---
 
-def transcribir_audio_replicate(ruta_archivo):
+@functools.lru_cache(maxsize=1)
+def version_whisper():
+    """Versión más reciente de openai/whisper, buscada una sola vez por proceso.
+
+    Se devuelve el objeto Version (no el string "openai/whisper:id") para que
+    replicate.run no vuelva a consultarla en cada llamada.
+    """
     print("🎤 Conectando con Replicate para buscar la última versión de Whisper...")
+    # En lugar de pegar el código raro, le pedimos a Replicate:
+    # "¿Cuál es la última versión de openai/whisper?"
+    model = replicate.models.get("openai/whisper")
+    return model.versions.list()[0]  # La primera de la lista es la más nueva
+
+
+def transcribir_audio_replicate(ruta_archivo):
     try:
         input_audio = open(ruta_archivo, "rb")
         
-        # 1. BUSCAMOS LA VERSIÓN MÁS RECIENTE AUTOMÁTICAMENTE
-        # En lugar de pegar el código raro, le pedimos a Replicate:
-        # "¿Cuál es la última versión de openai/whisper?"
-        model = replicate.models.get("openai/whisper")
-        latest_version = model.versions.list()[0] # Tomamos la primera de la lista (la más nueva)
-        
-        print(f"   (Usando versión: {latest_version.id[:10]}...)")
+        # 1. VERSIÓN DE WHISPER (se busca solo la primera vez)
+        version = version_whisper()
+        print(f"   (Usando versión: {version.id[:10]}...)")
 
-        # 2. EJECUTAMOS ESA VERSIÓN
-        output = replicate.run(
-            f"openai/whisper:{latest_version.id}", # Usamos el ID que acabamos de encontrar
+        # 2. EJECUTAMOS ESA VERSIÓN (cuando haya turno en el limitador)
+        output = llamar_con_admision(
+            limitador_transcripcion, segundos_de_audio(ruta_archivo),
+            replicate.run,
+            version, # La versión ya resuelta
             input={
                 "audio": input_audio,
                 "model": "large-v3",
@@ -66,23 +73,12 @@ def transcribir_audio_replicate(ruta_archivo):
         print(f"❌ Error en Replicate: {e}")
         return ""
     
-def pensar_respuesta(texto_usuario):
-    print("🧠 Analizando conflicto (DeepSeek)...")
-    
-    # Agregamos lo que dijo el usuario a la memoria
-    historial.append({"role": "user", "content": texto_usuario})
-    
+def pensar_respuesta(texto_usuario, sesion_id=SESION_CONSOLA):
     try:
-        response = client_deepseek.chat.completions.create(
-            model="deepseek-chat",
-            messages=historial,
-            temperature=0.7
+        resultado = correr_sincrono(
+            pensar_respuesta_async(texto_usuario, sesion_id, resumir_en_segundo_plano=False)
         )
-        respuesta = response.choices[0].message.content
-        
-        # Agregamos la respuesta de la IA a la memoria
-        historial.append({"role": "assistant", "content": respuesta})
-        return respuesta
+        return resultado["respuesta"]
     except Exception as e:
         return f"Error pensando: {e}"
 
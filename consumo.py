@@ -0,0 +1,274 @@
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, insert, update, func, case
+
+import models
+from database import AsyncSessionLocal
+from metricas import Contador, registrar, id_peticion, id_interno, ruta_peticion, medir
+
+# ==========================================
+# REGISTRO DE CONSUMO DE TOKENS (LEDGER)
+# ==========================================
+# Cada llamada de chat a DeepSeek deja una fila en consumo_llamadas con
+# los tokens de prompt, de respuesta y de prompt servidos del cache del
+# proveedor, la latencia (con reintentos), el modelo, la etapa, el
+# endpoint y el X-Request-ID (para cruzar con los logs). Al guardar un
+# reporte, las llamadas con el mismo ID interno (lo genera el servidor por
+# petición, o por texto en un lote) quedan vinculadas a su ID.
+# Las filas se juntan en memoria y se escriben por tandas cada
+# CONSUMO_INTERVALO segundos, fuera del camino de la petición. Solo se
+# escriben con el servidor en marcha (los scripts de consola no registran).
+# Si la escritura falla o se cancela, las filas vuelven al buffer para la
+# próxima tanda; solo se pierden si el buffer se llena.
+# De las copias de cobertura (plazos.py) se registra la que gana: la
+# cancelada no informa sus tokens.
+# /consumo suma las filas por día, endpoint y etapa.
+
+CONSUMO_ACTIVO = os.environ.get("CONSUMO_ACTIVO", "1") == "1"
+CONSUMO_INTERVALO = float(os.environ.get("CONSUMO_INTERVALO", "5"))
+CONSUMO_MAX_PENDIENTES = int(os.environ.get("CONSUMO_MAX_PENDIENTES", "10000"))
+# USD por millón de tokens, para estimar el costo en /consumo (0 = sin costo)
+CONSUMO_PRECIO_ENTRADA = float(os.environ.get("CONSUMO_PRECIO_ENTRADA", "0"))
+CONSUMO_PRECIO_ENTRADA_CACHE = float(os.environ.get("CONSUMO_PRECIO_ENTRADA_CACHE", "0"))
+CONSUMO_PRECIO_SALIDA = float(os.environ.get("CONSUMO_PRECIO_SALIDA", "0"))
+
+CONSUMO_DIAS_DEFECTO = 7
+CONSUMO_DIAS_MAXIMO = 366
+
+tabla = models.LlamadaModelo.__table__
+
+tokens_chat = registrar(Contador(
+    "biodeco_chat_tokens_total", "Tokens de DeepSeek por etapa y tipo (prompt, completion, cached).", ("etapa", "tipo")
+))
+filas_descartadas = registrar(Contador(
+    "biodeco_consumo_descartadas_total", "Llamadas que no llegaron a consumo_llamadas (buffer lleno)."
+))
+
+
+def tokens_en_cache(usage):
+    """DeepSeek informa prompt_cache_hit_tokens; la API de OpenAI, prompt_tokens_details.cached_tokens."""
+    if usage is None:
+        return 0
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    return cached or 0
+
+
+def costo_usd(prompt_tokens, completion_tokens, cached_tokens):
+    if not (CONSUMO_PRECIO_ENTRADA or CONSUMO_PRECIO_ENTRADA_CACHE or CONSUMO_PRECIO_SALIDA):
+        return None
+    costo = (
+        (prompt_tokens - cached_tokens) * CONSUMO_PRECIO_ENTRADA
+        + cached_tokens * CONSUMO_PRECIO_ENTRADA_CACHE
+        + completion_tokens * CONSUMO_PRECIO_SALIDA
+    ) / 1_000_000
+    return round(costo, 6)
+
+
+class RegistroConsumo:
+    def __init__(self, intervalo=CONSUMO_INTERVALO, max_pendientes=CONSUMO_MAX_PENDIENTES):
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self._pendientes = []
+        self._vinculos = {}     # id_interno -> reporte_id
+        self._tarea = None
+
+    def pendientes(self):
+        return len(self._pendientes)
+
+    def anotar(self, etapa, modelo, usage, segundos, intentos=None, resultado="ok"):
+        """Registra una llamada de chat. 'usage' es el objeto de la API (o None si falló)."""
+        prompt = (usage.prompt_tokens or 0) if usage else 0
+        completion = (usage.completion_tokens or 0) if usage else 0
+        cached = tokens_en_cache(usage)
+        tokens_chat.inc(prompt, etapa=etapa, tipo="prompt")
+        tokens_chat.inc(completion, etapa=etapa, tipo="completion")
+        tokens_chat.inc(cached, etapa=etapa, tipo="cached")
+        if self._tarea is None:
+            return
+
+        ahora = datetime.now(timezone.utc)
+        self._pendientes.append({
+            "created_at": ahora,
+            "dia": ahora.date(),
+            "id_interno": id_interno(),
+            "request_id": id_peticion(),
+            "reporte_id": None,
+            "endpoint": ruta_peticion() or "interno",
+            "etapa": etapa,
+            "modelo": modelo,
+            "resultado": resultado,
+            "intentos": intentos,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "cached_tokens": cached,
+            "segundos": round(segundos, 4),
+        })
+        self._recortar()
+
+    def _recortar(self):
+        # La base no da abasto: se pierden las más viejas, no la petición
+        sobran = len(self._pendientes) - self.max_pendientes
+        if sobran > 0:
+            del self._pendientes[:sobran]
+            filas_descartadas.inc(sobran)
+
+    def vincular_reporte(self, reporte_id, clave=None):
+        """Asocia al reporte recién guardado las llamadas con ese ID interno (por defecto, el actual)."""
+        clave = clave or id_interno()
+        if self._tarea is not None and clave and reporte_id is not None:
+            self._vinculos[clave] = reporte_id
+
+    async def iniciar(self):
+        if CONSUMO_ACTIVO:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        # Lo último que quedó en memoria
+        await self.volcar()
+        self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self.volcar()
+
+    async def volcar(self):
+        """Escribe lo pendiente en una transacción. Devuelve cuántas llamadas guardó."""
+        filas, vinculos = self._pendientes, self._vinculos
+        if not filas and not vinculos:
+            return 0
+        # Lo que se anote mientras se escribe va a la próxima tanda
+        self._pendientes, self._vinculos = [], {}
+        for fila in filas:
+            fila["reporte_id"] = vinculos.get(fila["id_interno"])
+
+        escrito = False
+        try:
+            async with AsyncSessionLocal() as db:
+                with medir("consumo_escritura"):
+                    if filas:
+                        await db.execute(insert(tabla), filas)
+                    # Las llamadas de tandas anteriores se vinculan en la base
+                    for clave, reporte_id in vinculos.items():
+                        await db.execute(
+                            update(tabla)
+                            .where(tabla.c.id_interno == clave, tabla.c.reporte_id.is_(None))
+                            .values(reporte_id=reporte_id)
+                        )
+                    await db.commit()
+                    escrito = True
+        except (Exception, asyncio.CancelledError) as e:
+            if escrito:
+                # Falló al cerrar la sesión, pero el commit ya estaba hecho
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return len(filas)
+            # Nada quedó escrito: todo vuelve al buffer, delante de lo más nuevo
+            self._pendientes[:0] = filas
+            self._vinculos = {**vinculos, **self._vinculos}
+            self._recortar()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            print(f"⚠️ No se pudo guardar el consumo de {len(filas)} llamadas (se reintenta): {e}")
+            return 0
+        return len(filas)
+
+
+registro_consumo = RegistroConsumo()
+
+
+# --- CONSULTAS ---
+
+def _acumular(destino, fila):
+    destino["llamadas"] += fila.llamadas
+    destino["errores"] += fila.errores or 0
+    destino["prompt_tokens"] += fila.prompt_tokens or 0
+    destino["completion_tokens"] += fila.completion_tokens or 0
+    destino["cached_tokens"] += fila.cached_tokens or 0
+    destino["segundos"] += fila.segundos or 0.0
+
+
+def _nuevo_total(**claves):
+    return {
+        **claves, "llamadas": 0, "errores": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "segundos": 0.0,
+    }
+
+
+def _cerrar(total):
+    """Agrega promedios, proporción de cache y costo a un total acumulado."""
+    segundos = total.pop("segundos")
+    total["segundos_promedio"] = round(segundos / total["llamadas"], 3) if total["llamadas"] else None
+    total["proporcion_cache"] = (
+        round(total["cached_tokens"] / total["prompt_tokens"], 4) if total["prompt_tokens"] else None
+    )
+    total["costo_usd"] = costo_usd(total["prompt_tokens"], total["completion_tokens"], total["cached_tokens"])
+    return total
+
+
+async def consultar(db, dias=CONSUMO_DIAS_DEFECTO):
+    """Totales por día, por endpoint y por etapa de los últimos 'dias'. 'db' es una AsyncSession."""
+    dias = max(1, min(dias, CONSUMO_DIAS_MAXIMO))
+    desde = datetime.now(timezone.utc).date() - timedelta(days=dias - 1)
+
+    with medir("consumo_consulta"):
+        filas = (await db.execute(
+            select(
+                tabla.c.dia, tabla.c.endpoint, tabla.c.etapa,
+                func.count().label("llamadas"),
+                func.sum(case((tabla.c.resultado != "ok", 1), else_=0)).label("errores"),
+                func.sum(tabla.c.prompt_tokens).label("prompt_tokens"),
+                func.sum(tabla.c.completion_tokens).label("completion_tokens"),
+                func.sum(tabla.c.cached_tokens).label("cached_tokens"),
+                func.sum(tabla.c.segundos).label("segundos"),
+            )
+            .where(tabla.c.dia >= desde)
+            .group_by(tabla.c.dia, tabla.c.endpoint, tabla.c.etapa)
+        )).all()
+
+    por_dia, por_endpoint, por_etapa = {}, {}, {}
+    totales = _nuevo_total()
+    for fila in filas:
+        _acumular(por_dia.setdefault(fila.dia, _nuevo_total(dia=fila.dia.isoformat())), fila)
+        _acumular(por_endpoint.setdefault(fila.endpoint, _nuevo_total(endpoint=fila.endpoint)), fila)
+        _acumular(por_etapa.setdefault(fila.etapa, _nuevo_total(etapa=fila.etapa)), fila)
+        _acumular(totales, fila)
+
+    def ordenar_por_tokens(grupos):
+        return sorted(
+            (_cerrar(t) for t in grupos.values()),
+            key=lambda t: t["prompt_tokens"] + t["completion_tokens"], reverse=True,
+        )
+
+    return {
+        "desde": desde.isoformat(),
+        "por_dia": [_cerrar(t) for _, t in sorted(por_dia.items())],
+        "por_endpoint": ordenar_por_tokens(por_endpoint),
+        "por_etapa": ordenar_por_tokens(por_etapa),
+        "totales": _cerrar(totales),
+    }
+
+
+async def llamadas_de_reporte(db, reporte_id):
+    """Las llamadas registradas para un reporte, en orden."""
+    filas = (await db.execute(
+        select(
+            tabla.c.created_at, tabla.c.endpoint, tabla.c.etapa, tabla.c.modelo, tabla.c.resultado,
+            tabla.c.intentos, tabla.c.prompt_tokens, tabla.c.completion_tokens, tabla.c.cached_tokens,
+            tabla.c.segundos,
+        )
+        .where(tabla.c.reporte_id == reporte_id)
+        .order_by(tabla.c.id)
+    )).all()
+    return [{**f._asdict(), "created_at": str(f.created_at)} for f in filas]
@@ -1,7 +1,13 @@
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from metricas import Histograma, Indicador, Contador, registrar
 
 # Obtenemos la URL de las variables de entorno
 SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL")
@@ -14,7 +20,97 @@ if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://")
 if not SQLALCHEMY_DATABASE_URL:
     SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
-engine_kwargs = {}
+# ==========================================
+# POOL DE CONEXIONES
+# ==========================================
+# Los endpoints usan el motor async (asyncpg en Postgres, aiosqlite en
+# local) para que una escritura lenta no frene las lecturas del mismo
+# worker. El motor síncrono queda para el arranque, las migraciones y lo
+# que ya corre en hilos (cache nivel 2, scripts).
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# Segundos tras los cuales una conexión se recicla (-1 = nunca)
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+
+espera_conexion = registrar(Histograma(
+    "biodeco_db_espera_conexion_segundos", "Tiempo esperando una conexión libre del pool.", ("motor",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+))
+conexiones_en_uso = registrar(Indicador(
+    "biodeco_db_conexiones_en_uso", "Conexiones prestadas por el pool ahora mismo.", ("motor",)
+))
+saturacion_pool = registrar(Indicador(
+    "biodeco_db_pool_saturacion", "Conexiones en uso / capacidad máxima (pool_size + max_overflow).", ("motor",)
+))
+timeouts_pool = registrar(Contador(
+    "biodeco_db_pool_timeouts_total", "Peticiones que se quedaron sin conexión tras DB_POOL_TIMEOUT.", ("motor",)
+))
+
+
+def _pool_medido(base, motor):
+    """Subclase del pool que mide cuánto se espera por una conexión."""
+
+    class PoolMedido(base):
+        def _do_get(self):
+            inicio = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                timeouts_pool.inc(motor=motor)
+                raise
+            finally:
+                espera_conexion.observar(time.perf_counter() - inicio, motor=motor)
+
+    return PoolMedido
+
+
+def _contar_conexiones(engine, motor):
+    capacidad = max(1, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    en_uso = {"n": 0}
+    lock = threading.Lock()
+
+    def _cambiar(delta):
+        with lock:
+            en_uso["n"] += delta
+            conexiones_en_uso.fijar(en_uso["n"], motor=motor)
+            saturacion_pool.fijar(round(en_uso["n"] / capacidad, 4), motor=motor)
+
+    def prestada(*_):
+        _cambiar(1)
+
+    def devuelta(*_):
+        _cambiar(-1)
+
+    event.listen(engine, "checkout", prestada)
+    event.listen(engine, "checkin", devuelta)
+
+
+def _opciones_pool(url, pool_base, motor):
+    if ":memory:" in url:
+        # SQLite en memoria vive en una sola conexión; no tiene sentido un pool
+        return {}
+    return {
+        "poolclass": _pool_medido(pool_base, motor),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def url_async(url):
+    """La misma base con driver async: asyncpg para Postgres, aiosqlite para SQLite."""
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+
+engine_kwargs = _opciones_pool(SQLALCHEMY_DATABASE_URL, QueuePool, "sync")
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     engine_kwargs["connect_args"] = {"check_same_thread": False}
 
@@ -22,6 +118,18 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_kwargs)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+engine_async = create_async_engine(
+    url_async(SQLALCHEMY_DATABASE_URL),
+    **_opciones_pool(SQLALCHEMY_DATABASE_URL, AsyncAdaptedQueuePool, "async"),
+)
+
+# expire_on_commit=False: tras el commit los objetos se siguen leyendo sin
+# volver a la base (en async un acceso perezoso fallaría)
+AsyncSessionLocal = async_sessionmaker(engine_async, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+_contar_conexiones(engine, "sync")
+_contar_conexiones(engine_async.sync_engine, "async")
+
 Base = declarative_base()
 
 # Función de ayuda para obtener la DB en cada petición
@@ -31,3 +139,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_db_async():
+    async with AsyncSessionLocal() as db:
+        yield db
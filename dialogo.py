@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import asyncio
+
+from cache import CacheLRU
+from servicios_ia import _chat, _chat_stream, estimar_tokens
+from eventos import hay_oyente
+
+# ==========================================
+# MODO DIÁLOGO: MEMORIA POR CONVERSACIÓN
+# ==========================================
+# Cada conversación tiene su propia sesión (antes había una sola lista
+# global que crecía sin fin). A DeepSeek solo van los últimos turnos,
+# dentro de un presupuesto de tokens; los turnos más viejos se condensan
+# en un resumen que se va actualizando. Las sesiones inactivas se
+# descartan por TTL y, si hay demasiadas, la menos usada (LRU).
+# Las sesiones viven en memoria del worker.
+
+DIALOGO_MAX_SESIONES = int(os.environ.get("DIALOGO_MAX_SESIONES", "500"))
+DIALOGO_TTL = int(os.environ.get("DIALOGO_TTL", str(2 * 3600)))
+# Tokens máximos de historial (resumen + turnos) que se mandan en cada llamada
+DIALOGO_PRESUPUESTO_TOKENS = int(os.environ.get("DIALOGO_PRESUPUESTO_TOKENS", "2000"))
+# Mensajes recientes que siempre van literales (usuario + asistente = 2 por turno)
+DIALOGO_MENSAJES_RECIENTES = int(os.environ.get("DIALOGO_MENSAJES_RECIENTES", "6"))
+DIALOGO_TEMPERATURA = 0.7
+
+SYSTEM_PROMPT = """
+Eres un terapeuta experto en Biodecodificación. Tu objetivo es dialogar,
+hacer preguntas cortas para indagar y encontrar el conflicto emocional.
+Sé cálido y empático.
+"""
+
+PROMPT_RESUMEN = """
+Actualiza el resumen clínico de esta conversación terapéutica.
+Conserva: síntomas, emociones, personas y hechos mencionados, hipótesis de
+conflicto y preguntas pendientes. Máximo 150 palabras, en tercera persona.
+
+RESUMEN ANTERIOR:
+{resumen}
+
+TURNOS NUEVOS:
+{turnos}
+"""
+
+
+class SesionDialogo:
+    def __init__(self, sesion_id):
+        self.id = sesion_id
+        self.resumen = ""
+        self.mensajes = []      # turnos que todavía no entraron al resumen
+        self.turnos = 0
+        self.lock = asyncio.Lock()
+        self.tarea_resumen = None
+
+    def tokens_historial(self):
+        return estimar_tokens(self.resumen) + sum(estimar_tokens(m["content"]) for m in self.mensajes)
+
+    def mensajes_para_modelo(self):
+        mensajes = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if self.resumen:
+            mensajes.append({"role": "system", "content": f"Resumen de la conversación hasta ahora:\n{self.resumen}"})
+        return mensajes + self.mensajes
+
+
+class AlmacenSesiones:
+    """Sesiones por ID con expiración por inactividad (cada uso renueva el TTL)."""
+
+    def __init__(self, max_sesiones=DIALOGO_MAX_SESIONES, ttl=DIALOGO_TTL):
+        self._sesiones = CacheLRU(max_sesiones, ttl)
+
+    def __len__(self):
+        return len(self._sesiones)
+
+    def obtener(self, sesion_id=None):
+        """Devuelve la sesión (nueva si no existe o expiró)."""
+        sesion_id = sesion_id or uuid.uuid4().hex
+        sesion = self._sesiones.obtener(sesion_id) or SesionDialogo(sesion_id)
+        self._sesiones.guardar(sesion_id, sesion)
+        return sesion
+
+    def cerrar(self, sesion_id):
+        return self._sesiones.eliminar(sesion_id)
+
+
+sesiones = AlmacenSesiones()
+
+
+def _necesita_resumen(sesion):
+    return (
+        sesion.tokens_historial() > DIALOGO_PRESUPUESTO_TOKENS
+        and len(sesion.mensajes) > DIALOGO_MENSAJES_RECIENTES
+    )
+
+
+async def _condensar(sesion):
+    """Pasa al resumen los mensajes viejos para volver al presupuesto."""
+    async with sesion.lock:
+        if not _necesita_resumen(sesion):
+            return
+        viejos = sesion.mensajes[:-DIALOGO_MENSAJES_RECIENTES]
+        turnos = "\n".join(
+            f"{'Paciente' if m['role'] == 'user' else 'Terapeuta'}: {m['content']}" for m in viejos
+        )
+        print(f"🗜️ Condensando {len(viejos)} mensajes de la sesión {sesion.id[:8]}...")
+        try:
+            sesion.resumen = await _chat(
+                [
+                    {"role": "system", "content": "Eres un asistente clínico que resume sesiones con precisión."},
+                    {"role": "user", "content": PROMPT_RESUMEN.format(resumen=sesion.resumen or "(vacío)", turnos=turnos)},
+                ],
+                temperatura=0.2,
+                etapa="dialogo_resumen",
+            )
+        except Exception as e:
+            # Sin resumen nuevo se recorta igual: el presupuesto manda
+            print(f"⚠️ No se pudo condensar la sesión: {e}")
+        sesion.mensajes = sesion.mensajes[-DIALOGO_MENSAJES_RECIENTES:]
+
+
+async def pensar_respuesta_async(texto_usuario, sesion_id=None, resumir_en_segundo_plano=True):
+    """Un turno del diálogo. Devuelve un dict con la respuesta y el estado de la sesión.
+
+    Con resumir_en_segundo_plano=False el resumen se hace antes de volver
+    (para los envoltorios síncronos, cuyo event loop se cierra al terminar).
+    """
+    sesion = sesiones.obtener(sesion_id)
+    # Turnos de una misma conversación van en orden; distintas conversaciones en paralelo
+    async with sesion.lock:
+        print("🧠 Analizando conflicto (DeepSeek)...")
+        inicio = time.perf_counter()
+        sesion.mensajes.append({"role": "user", "content": texto_usuario})
+        try:
+            # Por WebSocket la respuesta sale token a token (ver dialogo_ws.py)
+            llamar = _chat_stream if hay_oyente() else _chat
+            respuesta = await llamar(sesion.mensajes_para_modelo(), temperatura=DIALOGO_TEMPERATURA, etapa="dialogo")
+        except Exception:
+            # El turno fallido no queda en la memoria
+            sesion.mensajes.pop()
+            raise
+
+        sesion.mensajes.append({"role": "assistant", "content": respuesta})
+        sesion.turnos += 1
+        # El resumen se hace después de responder, fuera del camino del
+        # usuario; el próximo turno de esta sesión espera al lock
+        condensando = _necesita_resumen(sesion)
+        if condensando and resumir_en_segundo_plano:
+            sesion.tarea_resumen = asyncio.create_task(_condensar(sesion))
+
+        resultado = {
+            "sesion_id": sesion.id,
+            "respuesta": respuesta,
+            "turnos": sesion.turnos,
+            "condensando": condensando,
+            "tokens_historial": sesion.tokens_historial(),
+            "segundos": round(time.perf_counter() - inicio, 3),
+        }
+
+    if condensando and not resumir_en_segundo_plano:
+        await _condensar(sesion)
+    return resultado
@@ -0,0 +1,129 @@
+import io
+import json
+import asyncio
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from admision import Saturado
+from dialogo import pensar_respuesta_async, sesiones
+from eventos import reenviar_eventos
+from servicios_ia import transcribir_sesion_async
+
+# ==========================================
+# DIÁLOGO EN TIEMPO REAL POR WEBSOCKET
+# ==========================================
+# La versión en vivo del bucle de cerebro_con_oido (oído -> cerebro):
+#
+#   cliente -> binario:  un fragmento de audio autocontenido (p. ej. lo
+#                        grabado hasta la última pausa); se transcribe
+#                        apenas llega, en paralelo con los siguientes
+#   cliente -> {"tipo": "fin_turno"}          el paciente terminó de hablar
+#   cliente -> {"tipo": "texto", "texto": ..}  turno escrito, sin audio
+#
+#   servidor -> sesion, transcripcion_parcial (por fragmento),
+#               transcripcion (turno completo), token (respuesta en vivo),
+#               respuesta (final), error
+#
+# Cuando llega fin_turno la mayor parte del audio ya está transcrita, así
+# que la espera del usuario es la del último fragmento más el primer token.
+
+
+class _Canal:
+    """Envoltorio del WebSocket: los envíos de varias tareas no se mezclan."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._lock = asyncio.Lock()
+
+    async def enviar(self, tipo, **datos):
+        async with self._lock:
+            await self.websocket.send_text(json.dumps({"tipo": tipo, **datos}, ensure_ascii=False, default=str))
+
+
+async def _transcribir_fragmento(canal, indice, datos, formato):
+    archivo = io.BytesIO(datos)
+    archivo.name = f"fragmento_{indice:03d}.{formato}"
+    try:
+        texto = await transcribir_sesion_async(archivo)
+    except Saturado:
+        # Sin capacidad de Whisper: el turno queda incompleto (ver fin_turno)
+        await canal.enviar("transcripcion_parcial", indice=indice, texto="", ok=False)
+        raise
+    await canal.enviar("transcripcion_parcial", indice=indice, texto=texto or "", ok=texto is not None)
+    return texto
+
+
+async def _responder(canal, sesion_id, texto):
+    async def reenviar(tipo, datos):
+        if tipo == "token":
+            await canal.enviar("token", **datos)
+
+    try:
+        resultado = await reenviar_eventos(pensar_respuesta_async(texto, sesion_id), reenviar)
+        await canal.enviar("respuesta", **resultado)
+    except Saturado as e:
+        await canal.enviar("error", error=str(e), reintentar_en=e.reintentar_en)
+    except Exception as e:
+        print(f"❌ Error en diálogo por WebSocket: {e}")
+        await canal.enviar("error", error=f"Error pensando: {e}")
+
+
+async def atender_dialogo(websocket: WebSocket, sesion_id=None, formato="webm"):
+    await websocket.accept()
+    canal = _Canal(websocket)
+    sesion = sesiones.obtener(sesion_id)
+    await canal.enviar("sesion", sesion_id=sesion.id)
+    print(f"🔌 Diálogo en vivo conectado (sesión {sesion.id[:8]})")
+
+    fragmentos = []     # tareas de transcripción del turno en curso
+    try:
+        while True:
+            mensaje = await websocket.receive()
+            if mensaje["type"] == "websocket.disconnect":
+                break
+
+            if mensaje.get("bytes") is not None:
+                indice = len(fragmentos)
+                fragmentos.append(asyncio.create_task(
+                    _transcribir_fragmento(canal, indice, mensaje["bytes"], formato)
+                ))
+                continue
+
+            try:
+                datos = json.loads(mensaje.get("text") or "")
+            except ValueError:
+                await canal.enviar("error", error="Mensaje de texto no es JSON.")
+                continue
+
+            tipo = datos.get("tipo")
+            if tipo == "fin_turno":
+                textos = await asyncio.gather(*fragmentos, return_exceptions=True)
+                fragmentos = []
+                errores = [t for t in textos if isinstance(t, BaseException)]
+                saturado = next((e for e in errores if isinstance(e, Saturado)), None)
+                if saturado is not None:
+                    # La conexión sigue: el cliente puede reenviar el turno más tarde
+                    await canal.enviar("error", error=str(saturado), reintentar_en=saturado.reintentar_en)
+                    continue
+                if errores:
+                    raise errores[0]
+                texto = " ".join(t.strip() for t in textos if t)
+            elif tipo == "texto":
+                texto = (datos.get("texto") or "").strip()
+            else:
+                await canal.enviar("error", error=f"Tipo de mensaje desconocido: {tipo}")
+                continue
+
+            if not texto:
+                await canal.enviar("error", error="No se entendió el audio del turno.")
+                continue
+
+            await canal.enviar("transcripcion", texto=texto)
+            await _responder(canal, sesion.id, texto)
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for tarea in fragmentos:
+            tarea.cancel()
+        print(f"🔌 Diálogo en vivo desconectado (sesión {sesion.id[:8]})")
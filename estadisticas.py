@@ -0,0 +1,172 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, select, delete, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+from metricas import medir
+
+# ==========================================
+# ESTADÍSTICAS SEMANALES (ROLLUPS INCREMENTALES)
+# ==========================================
+# La tabla conteos_semanales guarda, por semana, cuántos reportes tienen
+# cada emocion_base / organo_afectado / conflicto_biologico (más el total
+# de reportes). Se actualiza en el mismo flush que inserta cada Reporte,
+# venga de donde venga (endpoints, lotes, workers, scripts), así que
+# /stats lee unas pocas filas por semana sin importar cuántos reportes
+# haya. Los reportes previos se cargan una sola vez con recalcular()
+# (migración 4, o a mano con "python estadisticas.py").
+
+DIMENSIONES = ("emocion_base", "organo_afectado", "conflicto_biologico")
+DIMENSION_TOTAL = "reportes"
+
+STATS_SEMANAS_DEFECTO = 12
+STATS_SEMANAS_MAXIMO = 104
+STATS_TOP_DEFECTO = 10
+LARGO_MAXIMO_VALOR = 120
+FILAS_POR_UPSERT = 500
+
+tabla = models.ConteoSemanal.__table__
+
+
+def normalizar_valor(valor):
+    """La IA escribe el mismo valor con distintas mayúsculas y espacios; se agrupan juntos."""
+    if valor is None:
+        return None
+    valor = " ".join(str(valor).split()).lower()[:LARGO_MAXIMO_VALOR]
+    return valor or None
+
+
+def semana_de(fecha):
+    """Lunes (UTC) de la semana de 'fecha'. Las fechas sin zona se toman como UTC."""
+    if fecha is None:
+        fecha = datetime.now(timezone.utc)
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc)
+    dia = fecha.date()
+    return dia - timedelta(days=dia.weekday())
+
+
+def contar(reportes, signo=1):
+    """Counter {(semana, dimension, valor): cantidad} de una lista de reportes."""
+    conteos = Counter()
+    for reporte in reportes:
+        semana = semana_de(reporte.created_at)
+        conteos[(semana, DIMENSION_TOTAL, "")] += signo
+        for dimension in DIMENSIONES:
+            valor = normalizar_valor(getattr(reporte, dimension))
+            if valor is not None:
+                conteos[(semana, dimension, valor)] += signo
+    return conteos
+
+
+def sumar(conexion, conteos):
+    """Suma los conteos a la tabla con un upsert (crea las filas que falten)."""
+    # Orden fijo de claves: dos transacciones concurrentes bloquean filas en el mismo orden
+    filas = [
+        {"semana": s, "dimension": d, "valor": v, "conteo": n}
+        for (s, d, v), n in sorted(conteos.items()) if n
+    ]
+    if not filas:
+        return
+
+    dialecto = conexion.dialect.name
+    if dialecto in ("postgresql", "sqlite"):
+        insertar = postgresql.insert if dialecto == "postgresql" else sqlite.insert
+        # Por tandas: SQLite limita la cantidad de parámetros por sentencia
+        for i in range(0, len(filas), FILAS_POR_UPSERT):
+            upsert = insertar(tabla).values(filas[i:i + FILAS_POR_UPSERT])
+            conexion.execute(upsert.on_conflict_do_update(
+                index_elements=[tabla.c.semana, tabla.c.dimension, tabla.c.valor],
+                set_={"conteo": tabla.c.conteo + upsert.excluded.conteo},
+            ))
+    else:
+        for fila in filas:
+            clave = (tabla.c.semana == fila["semana"]) & (tabla.c.dimension == fila["dimension"]) & (tabla.c.valor == fila["valor"])
+            actualizadas = conexion.execute(
+                tabla.update().where(clave).values(conteo=tabla.c.conteo + fila["conteo"])
+            ).rowcount
+            if not actualizadas:
+                conexion.execute(insert(tabla).values(**fila))
+
+    if any(f["conteo"] < 0 for f in filas):
+        conexion.execute(delete(tabla).where(tabla.c.conteo <= 0))
+
+
+@event.listens_for(Session, "after_flush")
+def _actualizar_conteos(session, contexto):
+    # En after_flush session.new/deleted todavía tienen lo que se acaba de escribir
+    nuevos = [o for o in session.new if isinstance(o, models.Reporte)]
+    borrados = [o for o in session.deleted if isinstance(o, models.Reporte)]
+    if not nuevos and not borrados:
+        return
+    conteos = contar(nuevos)
+    conteos.update(contar(borrados, signo=-1))
+    sumar(session.connection(), conteos)
+
+
+def recalcular(conexion, tamano_lote=1000):
+    """Rehace conteos_semanales desde cero leyendo todos los reportes (una sola pasada)."""
+    conexion.execute(delete(tabla))
+    reportes = models.Reporte.__table__
+    columnas = [reportes.c.created_at, *[reportes.c[d] for d in DIMENSIONES]]
+    conteos = Counter()
+    total = 0
+    resultado = conexion.execution_options(yield_per=tamano_lote).execute(select(*columnas))
+    for filas in resultado.partitions():
+        conteos.update(contar(filas))
+        total += len(filas)
+    sumar(conexion, conteos)
+    print(f"📊 Estadísticas recalculadas: {total} reportes, {len(conteos)} conteos.")
+    return total
+
+
+def _top(conteos, top):
+    return [{"valor": v, "conteo": n} for v, n in conteos.most_common(top)]
+
+
+async def consultar(db, semanas=STATS_SEMANAS_DEFECTO, top=STATS_TOP_DEFECTO, dimensiones=DIMENSIONES):
+    """Los valores más frecuentes por semana y en todo el período. 'db' es una AsyncSession."""
+    semanas = max(1, min(semanas, STATS_SEMANAS_MAXIMO))
+    top = max(1, top)
+    desde = semana_de(None) - timedelta(weeks=semanas - 1)
+
+    with medir("stats_consulta"):
+        filas = (await db.execute(
+            select(tabla.c.semana, tabla.c.dimension, tabla.c.valor, tabla.c.conteo)
+            .where(tabla.c.semana >= desde, tabla.c.dimension.in_((DIMENSION_TOTAL, *dimensiones)))
+        )).all()
+
+    por_semana = {}
+    totales = {d: Counter() for d in dimensiones}
+    total_reportes = 0
+    for semana, dimension, valor, conteo in filas:
+        datos = por_semana.setdefault(semana, {d: Counter() for d in dimensiones} | {DIMENSION_TOTAL: 0})
+        if dimension == DIMENSION_TOTAL:
+            datos[DIMENSION_TOTAL] = conteo
+            total_reportes += conteo
+        else:
+            datos[dimension][valor] = conteo
+            totales[dimension][valor] += conteo
+
+    return {
+        "desde": desde.isoformat(),
+        "semanas": [
+            {
+                "semana": semana.isoformat(),
+                DIMENSION_TOTAL: datos[DIMENSION_TOTAL],
+                **{d: _top(datos[d], top) for d in dimensiones},
+            }
+            for semana, datos in sorted(por_semana.items())
+        ],
+        "totales": {DIMENSION_TOTAL: total_reportes, **{d: _top(totales[d], top) for d in dimensiones}},
+    }
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    with engine.begin() as conexion:
+        recalcular(conexion)
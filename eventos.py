@@ -0,0 +1,99 @@
+import json
+import asyncio
+import contextvars
+
+from fastapi.responses import StreamingResponse
+
+# ==========================================
+# EVENTOS DE PROGRESO (SERVER-SENT EVENTS)
+# ==========================================
+# Las funciones del pipeline llaman a emitir(...) sin saber quién escucha.
+# Si la petición es de streaming, respuesta_sse() deja una cola en el
+# contexto y cada evento sale al cliente apenas ocurre; si no, emitir()
+# no hace nada.
+
+SSE_PING_SEGUNDOS = 15
+
+_cola_eventos = contextvars.ContextVar("cola_eventos", default=None)
+_FIN = object()
+
+
+def hay_oyente():
+    return _cola_eventos.get() is not None
+
+
+def emitir(tipo, **datos):
+    cola = _cola_eventos.get()
+    if cola is not None:
+        cola.put_nowait((tipo, datos))
+
+
+def _formatear(tipo, datos):
+    return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+async def reenviar_eventos(corutina, enviar):
+    """Ejecuta 'corutina' pasando cada evento a 'await enviar(tipo, datos)'.
+
+    Para canales que no son SSE (WebSocket). Devuelve lo que devuelve la corutina.
+    """
+    cola = asyncio.Queue()
+
+    async def ejecutar():
+        _cola_eventos.set(cola)
+        try:
+            return await corutina
+        finally:
+            cola.put_nowait(_FIN)
+
+    tarea = asyncio.create_task(ejecutar())
+    while True:
+        evento = await cola.get()
+        if evento is _FIN:
+            break
+        await enviar(*evento)
+    return await tarea
+
+
+def respuesta_sse(corutina):
+    """Ejecuta 'corutina' emitiendo su progreso como SSE.
+
+    El valor que devuelve la corutina sale como último evento ('resultado'),
+    o como 'error' si lanza una excepción.
+    """
+    cola = asyncio.Queue()
+
+    async def ejecutar():
+        _cola_eventos.set(cola)
+        try:
+            resultado = await corutina
+            if isinstance(resultado, dict) and resultado.get("error"):
+                cola.put_nowait(("error", resultado))
+            else:
+                cola.put_nowait(("resultado", resultado))
+        except Exception as e:
+            print(f"❌ Error en análisis por streaming: {e}")
+            cola.put_nowait(("error", {"error": str(e)}))
+        finally:
+            cola.put_nowait(_FIN)
+
+    async def generar():
+        # La tarea sigue aunque el cliente se desconecte: el reporte se guarda igual
+        tarea = asyncio.create_task(ejecutar())
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), SSE_PING_SEGUNDOS)
+            except asyncio.TimeoutError:
+                # Comentario SSE para que proxies y móviles no corten la conexión
+                yield ": ping\n\n"
+                continue
+            if evento is _FIN:
+                break
+            yield _formatear(*evento)
+        await tarea
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,143 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, TypeAdapter, field_validator
+from sqlalchemy import select, or_, and_
+
+import models
+from metricas import medir
+
+# ==========================================
+# LECTURA PAGINADA DEL HISTORIAL
+# ==========================================
+# Paginación por cursor sobre (created_at, id), apoyada en el índice
+# compuesto ix_reportes_created_at_id: cada página cuesta lo mismo sin
+# importar cuántos reportes haya. Con 'fields' solo se leen las columnas
+# pedidas, así las listas no cargan los Text grandes.
+# La respuesta se serializa con pydantic-core directamente a bytes, sin
+# armar un dict por fila ni pasar por el encoder genérico de FastAPI.
+
+HISTORIAL_LIMIT_DEFECTO = 50
+HISTORIAL_LIMIT_MAXIMO = 200
+
+# Nombre en la API -> columna en la tabla
+CAMPOS = {
+    "id": models.Reporte.id,
+    "fecha": models.Reporte.created_at,
+    "motivo_consulta": models.Reporte.motivo_consulta,
+    "emocion_base": models.Reporte.emocion_base,
+    "organo_afectado": models.Reporte.organo_afectado,
+    "conflicto_biologico": models.Reporte.conflicto_biologico,
+    "diagnostico_tecnico": models.Reporte.diagnostico_tecnico,
+    "hallazgos_clinicos": models.Reporte.hallazgos_clinicos,
+    "resumen_sesion": models.Reporte.resumen_sesion,
+    "recomendaciones": models.Reporte.recomendaciones,
+    "oportunidades_omitidas": models.Reporte.oportunidades_omitidas,
+    "modo_reporte": models.Reporte.modo_reporte,
+    "degradado": models.Reporte.degradado,
+}
+CAMPOS_LISTA = ("recomendaciones", "oportunidades_omitidas")
+
+# fields=resumen: lo que necesita una vista de lista
+CAMPOS_RESUMEN = ("id", "fecha", "motivo_consulta", "emocion_base", "organo_afectado", "conflicto_biologico")
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(created_at, reporte_id):
+    crudo = json.dumps([created_at.isoformat(), reporte_id])
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii")
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, reporte_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(fecha), int(reporte_id)
+    except Exception:
+        raise CursorInvalido("Cursor inválido.")
+
+
+def parsear_campos(fields):
+    """'a,b,c' o 'resumen' -> tupla de campos. Sin 'fields' devuelve todos."""
+    if not fields:
+        return tuple(CAMPOS)
+    if fields == "resumen":
+        return CAMPOS_RESUMEN
+    campos = tuple(dict.fromkeys(c.strip() for c in fields.split(",") if c.strip()))
+    desconocidos = [c for c in campos if c not in CAMPOS]
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}")
+    return campos
+
+
+class ReporteHistorial(BaseModel):
+    """Un reporte tal como sale en /historial. Con 'fields' solo van los pedidos."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Optional[int] = None
+    fecha: Optional[datetime] = None
+    motivo_consulta: Optional[str] = None
+    emocion_base: Optional[str] = None
+    organo_afectado: Optional[str] = None
+    conflicto_biologico: Optional[str] = None
+    diagnostico_tecnico: Optional[str] = None
+    hallazgos_clinicos: Optional[str] = None
+    resumen_sesion: Optional[str] = None
+    # La IA a veces devuelve texto en vez de lista; se respeta lo guardado
+    recomendaciones: Union[List[Any], str, None] = None
+    oportunidades_omitidas: Union[List[Any], str, None] = None
+    modo_reporte: Optional[str] = None
+    degradado: Optional[bool] = None
+
+    @field_validator(*CAMPOS_LISTA, mode="before")
+    @classmethod
+    def _vacia_si_nula(cls, valor):
+        return [] if valor is None else valor
+
+
+_adaptador_lista = TypeAdapter(List[ReporteHistorial])
+
+
+def serializar_lista(reportes, campos):
+    """Lista de ReporteHistorial -> bytes JSON con solo los campos pedidos."""
+    with medir("historial_serializacion"):
+        return _adaptador_lista.dump_json(reportes, include={"__all__": set(campos)})
+
+
+def serializar_detalle(reporte):
+    return ReporteHistorial.model_validate(reporte).model_dump_json()
+
+
+async def consultar_pagina(db, limit=HISTORIAL_LIMIT_DEFECTO, cursor=None, campos=None):
+    """Devuelve (lista de ReporteHistorial, siguiente_cursor o None). 'db' es una AsyncSession."""
+    campos = campos or tuple(CAMPOS)
+    limit = max(1, min(limit, HISTORIAL_LIMIT_MAXIMO))
+    tabla = models.Reporte
+
+    # id y fecha siempre se leen: hacen falta para armar el cursor
+    columnas = {"id": tabla.id, "fecha": tabla.created_at}
+    columnas.update({c: CAMPOS[c] for c in campos})
+    consulta = select(*[col.label(nombre) for nombre, col in columnas.items()])
+
+    if cursor:
+        fecha, reporte_id = decodificar_cursor(cursor)
+        consulta = consulta.where(or_(
+            tabla.created_at < fecha,
+            and_(tabla.created_at == fecha, tabla.id < reporte_id),
+        ))
+
+    with medir("historial_consulta"):
+        filas = (await db.execute(
+            consulta.order_by(tabla.created_at.desc(), tabla.id.desc()).limit(limit + 1)
+        )).all()
+
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        siguiente = codificar_cursor(filas[-1].fecha, filas[-1].id)
+
+    return [ReporteHistorial.model_validate(f) for f in filas], siguiente
@@ -0,0 +1,114 @@
+import os
+import json
+import asyncio
+import hashlib
+
+from cache import CacheLRU
+from metricas import Contador, registrar
+
+# ==========================================
+# IDEMPOTENCIA Y "SINGLE-FLIGHT" DE ANÁLISIS
+# ==========================================
+# Flutter reintenta /analyze_audio y /analyze_text cuando se corta la
+# conexión a mitad del análisis. Sin esto, el reintento lanza otro
+# Whisper + DeepSeek en paralelo y guarda un Reporte duplicado.
+#
+# Cada petición tiene una clave: la cabecera Idempotency-Key si el cliente
+# la manda, o si no un hash del contenido y los parámetros. Con la misma
+# clave:
+#   - si hay un análisis en curso, la petición se une a ese ("unida");
+#   - si terminó bien hace menos de IDEMPOTENCIA_VENTANA segundos, se
+#     devuelve el mismo resultado, con el mismo ID de reporte ("repetida");
+#   - si no, se analiza ("original").
+# Los errores no se guardan: un reintento después de un error vuelve a
+# analizar. Con usar_cache=False el cliente pide un análisis nuevo, así
+# que solo cuenta la Idempotency-Key explícita, nunca el hash del
+# contenido. El registro vive en memoria del worker.
+
+IDEMPOTENCIA_VENTANA = int(os.environ.get("IDEMPOTENCIA_VENTANA", "600"))
+IDEMPOTENCIA_MAX_ENTRADAS = int(os.environ.get("IDEMPOTENCIA_MAX_ENTRADAS", "1000"))
+
+CABECERA_IDEMPOTENCIA = "Idempotency-Key"
+CABECERA_RESULTADO = "X-Idempotencia"
+LARGO_MAXIMO_CLAVE = 255
+
+resultados_idempotencia = registrar(Contador(
+    "biodeco_idempotencia_total", "Peticiones de análisis según se analizaron, se unieron o se repitieron.",
+    ("endpoint", "resultado"),
+))
+
+
+class ClaveReutilizada(ValueError):
+    """La misma Idempotency-Key llegó con otro contenido."""
+
+
+def huella(*partes):
+    """SHA-256 del contenido y los parámetros que cambian el resultado."""
+    return hashlib.sha256(json.dumps(partes, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class AnalisisUnicos:
+    def __init__(self, ventana=IDEMPOTENCIA_VENTANA, max_entradas=IDEMPOTENCIA_MAX_ENTRADAS):
+        self._en_curso = {}     # clave -> (huella, Future)
+        self._terminados = CacheLRU(max_entradas, ventana)   # clave -> (huella, resultado)
+
+    def en_curso(self):
+        return len(self._en_curso)
+
+    async def ejecutar(self, endpoint, huella_contenido, analizar, clave_cliente=None, por_contenido=True):
+        """Devuelve (resultado, "original" | "unida" | "repetida").
+
+        analizar: función sin argumentos que devuelve la corutina del análisis;
+        solo se llama si no hay uno en curso ni un resultado reciente.
+        por_contenido: si es False, sin clave del cliente siempre se analiza.
+        """
+        if clave_cliente and len(clave_cliente) > LARGO_MAXIMO_CLAVE:
+            raise ClaveReutilizada(f"{CABECERA_IDEMPOTENCIA} supera los {LARGO_MAXIMO_CLAVE} caracteres.")
+        if not clave_cliente and not por_contenido:
+            resultados_idempotencia.inc(endpoint=endpoint, resultado="original")
+            return await analizar(), "original"
+        clave = f"{endpoint}:{'cliente:' + clave_cliente if clave_cliente else huella_contenido}"
+
+        terminado = self._terminados.obtener(clave)
+        if terminado is not None:
+            self._verificar(terminado[0], huella_contenido)
+            resultados_idempotencia.inc(endpoint=endpoint, resultado="repetida")
+            print(f"♻️ Análisis repetido ({endpoint}): se devuelve el resultado anterior.")
+            return terminado[1], "repetida"
+
+        en_curso = self._en_curso.get(clave)
+        if en_curso is not None:
+            self._verificar(en_curso[0], huella_contenido)
+            resultados_idempotencia.inc(endpoint=endpoint, resultado="unida")
+            print(f"🔗 Análisis idéntico en curso ({endpoint}): se espera ese resultado.")
+            # shield: si esta petición se cancela, no se cancela el análisis de la otra
+            return await asyncio.shield(en_curso[1]), "unida"
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = (huella_contenido, futuro)
+        resultados_idempotencia.inc(endpoint=endpoint, resultado="original")
+        try:
+            resultado = await analizar()
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except BaseException as e:
+            futuro.set_exception(e)
+            # Que no quede "Future exception was never retrieved" si nadie se unió
+            futuro.exception()
+            raise
+        else:
+            futuro.set_result(resultado)
+            if not (isinstance(resultado, dict) and "error" in resultado):
+                self._terminados.guardar(clave, (huella_contenido, resultado))
+            return resultado, "original"
+        finally:
+            self._en_curso.pop(clave, None)
+
+    @staticmethod
+    def _verificar(huella_guardada, huella_contenido):
+        if huella_guardada != huella_contenido:
+            raise ClaveReutilizada(f"{CABECERA_IDEMPOTENCIA} ya usada con otro contenido.")
+
+
+analisis_unicos = AnalisisUnicos()
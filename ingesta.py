@@ -0,0 +1,138 @@
+import io
+import os
+import hashlib
+import tempfile
+
+from metricas import medir
+
+try:
+    import mutagen
+except ImportError:  # Sin mutagen no se valida la duración, solo el tamaño
+    mutagen = None
+
+# ==========================================
+# INGESTA DE AUDIO POR STREAMING
+# ==========================================
+# Lee el upload una sola vez por bloques: calcula el SHA-256 mientras lee,
+# guarda en memoria los archivos chicos y pasa a un tempfile único los
+# grandes. Corta apenas se supera el tamaño máximo.
+
+INGESTA_MAX_MEMORIA = int(os.environ.get("INGESTA_MAX_MEMORIA", str(8 * 1024 * 1024)))
+INGESTA_MAX_BYTES = int(os.environ.get("INGESTA_MAX_BYTES", str(200 * 1024 * 1024)))
+INGESTA_MAX_DURACION = float(os.environ.get("INGESTA_MAX_DURACION", str(2 * 3600)))
+INGESTA_DIR = os.environ.get("INGESTA_DIR") or tempfile.gettempdir()
+
+TAMANO_BLOQUE = 1024 * 1024
+
+
+class ErrorIngesta(Exception):
+    """El audio no se acepta; 'status_code' es el código HTTP a devolver."""
+
+    def __init__(self, mensaje, status_code=400):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+
+class AudioIngerido:
+    """Audio ya leído: en memoria o en un tempfile, con su hash y tamaño."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre or "audio"
+        self.sha256 = None
+        self.tamano = 0
+        self.duracion = None
+        self.archivo = io.BytesIO()
+        # Replicate usa el atributo 'name' para el nombre y el content-type
+        self.archivo.name = os.path.basename(self.nombre)
+        self.ruta = None
+
+    @property
+    def en_memoria(self):
+        return self.ruta is None
+
+    def abrir(self):
+        """Devuelve el archivo listo para leer desde el principio."""
+        self.archivo.seek(0)
+        return self.archivo
+
+    def escribir(self, bloque):
+        if self.en_memoria and self.tamano + len(bloque) > INGESTA_MAX_MEMORIA:
+            self._pasar_a_disco()
+        self.archivo.write(bloque)
+        self.tamano += len(bloque)
+
+    def asegurar_en_disco(self):
+        """Para quien necesita una ruta (workers, ffmpeg). Devuelve la ruta."""
+        if self.en_memoria:
+            self._pasar_a_disco()
+        self.archivo.flush()
+        return self.ruta
+
+    def cerrar(self):
+        self.archivo.close()
+        if self.ruta and os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def _pasar_a_disco(self):
+        _, extension = os.path.splitext(self.nombre)
+        destino = tempfile.NamedTemporaryFile(prefix="audio_", suffix=extension, dir=INGESTA_DIR, delete=False)
+        destino.write(self.archivo.getvalue())
+        self.archivo.close()
+        self.archivo = destino
+        self.ruta = destino.name
+
+
+def _medir_duracion(audio):
+    if mutagen is None:
+        return None
+    try:
+        info = mutagen.File(audio.abrir())
+    except Exception:
+        return None
+    if info is None or info.info is None:
+        return None
+    return getattr(info.info, "length", None)
+
+
+async def ingerir_subida(upload):
+    """Lee un UploadFile de FastAPI y devuelve un AudioIngerido validado."""
+    with medir("ingesta"):
+        return await _ingerir(upload)
+
+
+async def _ingerir(upload):
+    # Si el cliente mandó el tamaño, rechazamos antes de leer nada
+    if upload.size is not None and upload.size > INGESTA_MAX_BYTES:
+        raise ErrorIngesta(f"El audio supera el máximo de {INGESTA_MAX_BYTES // (1024 * 1024)} MB.", 413)
+
+    audio = AudioIngerido(upload.filename)
+    sha256 = hashlib.sha256()
+    try:
+        while True:
+            bloque = await upload.read(TAMANO_BLOQUE)
+            if not bloque:
+                break
+            if audio.tamano + len(bloque) > INGESTA_MAX_BYTES:
+                raise ErrorIngesta(f"El audio supera el máximo de {INGESTA_MAX_BYTES // (1024 * 1024)} MB.", 413)
+            sha256.update(bloque)
+            audio.escribir(bloque)
+
+        if audio.tamano == 0:
+            raise ErrorIngesta("El archivo de audio está vacío.")
+
+        audio.sha256 = sha256.hexdigest()
+        audio.duracion = _medir_duracion(audio)
+        if audio.duracion and audio.duracion > INGESTA_MAX_DURACION:
+            raise ErrorIngesta(f"El audio dura más de {int(INGESTA_MAX_DURACION // 60)} minutos.", 413)
+    except Exception:
+        audio.cerrar()
+        raise
+
+    print(f"📦 Audio ingerido: {audio.tamano} bytes ({'memoria' if audio.en_memoria else 'disco'}).")
+    return audio
@@ -0,0 +1,120 @@
+import os
+import json
+import asyncio
+
+from fastapi.responses import StreamingResponse
+
+from database import AsyncSessionLocal
+from cache import generar_reporte_cacheado
+from procesamiento import normalizar_reporte, guardar_reportes_lote
+from metricas import asignar_id_interno, id_interno
+
+# ==========================================
+# ANÁLISIS DE TEXTOS EN LOTE (NDJSON)
+# ==========================================
+# Cada texto pasa por el mismo pipeline que /analyze_text, con un máximo
+# de LOTE_CONCURRENCIA reportes generándose a la vez. Los resultados salen
+# como una línea JSON por texto, en el orden en que terminan; un texto que
+# falla lleva su 'error' y no corta el resto. Al final todos los reportes
+# se guardan en una sola transacción y la última línea trae los IDs.
+
+LOTE_CONCURRENCIA = int(os.environ.get("LOTE_CONCURRENCIA", "4"))
+LOTE_MAX_TEXTOS = int(os.environ.get("LOTE_MAX_TEXTOS", "200"))
+
+_FIN = object()
+
+
+def _linea(datos):
+    return json.dumps(datos, ensure_ascii=False, default=str) + "\n"
+
+
+async def _analizar_item(indice, texto, usar_cache, modo, limite):
+    """Devuelve (indice, reporte_json, metadatos, error, id_interno)."""
+    # Cada texto tiene su ID interno (la tarea tiene su propio contexto):
+    # así las llamadas de consumo se vinculan a su reporte y no a todo el lote
+    asignar_id_interno()
+    clave = id_interno()
+    async with limite:
+        try:
+            reporte_json, metadatos = await generar_reporte_cacheado(texto, usar_cache, modo)
+            reporte_json = normalizar_reporte(
+                reporte_json,
+                motivo_error="Texto en lote",
+                diagnostico_error="Error de formato JSON en texto.",
+            )
+            if not isinstance(reporte_json, dict) or reporte_json.get("error"):
+                error = reporte_json.get("error") if isinstance(reporte_json, dict) else None
+                return indice, None, None, error or "La IA no devolvió un reporte.", clave
+            return indice, reporte_json, metadatos, None, clave
+        except Exception as e:
+            print(f"❌ Error en el texto {indice} del lote: {e}")
+            return indice, None, None, str(e), clave
+
+
+async def _guardar_lote(reportes_json, ids_internos):
+    async with AsyncSessionLocal() as db:
+        return await guardar_reportes_lote(
+            db, reportes_json, hallazgos_por_defecto="Análisis de texto directo.", ids_internos=ids_internos,
+        )
+
+
+async def _procesar_lote(textos, usar_cache, modo, cola):
+    limite = asyncio.Semaphore(LOTE_CONCURRENCIA)
+    tareas = [
+        asyncio.create_task(_analizar_item(i, texto, usar_cache, modo, limite))
+        for i, texto in enumerate(textos)
+    ]
+
+    exitosos = []
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            indice, reporte_json, metadatos, error, clave = await siguiente
+            if error:
+                cola.put_nowait({"tipo": "item", "indice": indice, "estado": "error", "error": error})
+                continue
+            exitosos.append((indice, reporte_json, clave))
+            cola.put_nowait({
+                "tipo": "item",
+                "indice": indice,
+                "estado": "exito",
+                "error": None,
+                "analisis_ia": reporte_json,
+                "desde_cache": metadatos["desde_cache"],
+                "modo_reporte": metadatos["modo"],
+                "degradado": metadatos["degradado"],
+            })
+
+        ids = None
+        if exitosos:
+            ids = await _guardar_lote([r for _, r, _ in exitosos], [c for _, _, c in exitosos])
+        cola.put_nowait({
+            "tipo": "resumen",
+            "total": len(textos),
+            "exitos": len(exitosos),
+            "errores": len(textos) - len(exitosos),
+            "guardado": ids is not None or not exitosos,
+            "ids": {indice: reporte_id for (indice, _, _), reporte_id in zip(exitosos, ids or [])},
+        })
+    finally:
+        cola.put_nowait(_FIN)
+
+
+def respuesta_lote(textos, usar_cache=True, modo=None):
+    """StreamingResponse NDJSON con el análisis de cada texto y un resumen final."""
+    cola = asyncio.Queue()
+
+    async def generar():
+        # Igual que en SSE: si el cliente se va, el lote termina y se guarda igual
+        tarea = asyncio.create_task(_procesar_lote(textos, usar_cache, modo, cola))
+        while True:
+            datos = await cola.get()
+            if datos is _FIN:
+                break
+            yield _linea(datos)
+        await tarea
+
+    return StreamingResponse(
+        generar(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
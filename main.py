@@ -1,26 +1,69 @@
 # main.py COMPLETO
-import os
-import shutil
-import json
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Depends, Header, HTTPException, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field # <--- AGREGA ESTO EN TUS IMPORTS ARRIBA
 # --- TUS MÓDULOS PROPIOS ---
 # Asegúrate de que estos archivos existan y tengan las funciones
-from database import engine, get_db
+from database import engine, engine_async, get_db_async, AsyncSessionLocal
 import models
-from servicios_ia import transcribir_sesion, generar_reporte_clinico, generar_plan_asistente_mentor
+from servicios_ia import generar_plan_asistente_mentor_async
+from cache import generar_reporte_cacheado, transcribir_cacheado, cache_reportes, cache_transcripciones, normalizar_texto
+from procesamiento import normalizar_reporte, guardar_reporte
+from trabajos import gestor, trabajo_a_dict, ColaLlena
+from ingesta import ingerir_subida, ErrorIngesta
+from eventos import emitir, respuesta_sse
+from lote import respuesta_lote, LOTE_MAX_TEXTOS
+from historial import (
+    consultar_pagina, parsear_campos, serializar_lista, serializar_detalle,
+    ReporteHistorial, HISTORIAL_LIMIT_DEFECTO,
+)
+from busqueda import buscar, serializar_resultados, ResultadoBusqueda, BUSQUEDA_LIMIT_DEFECTO
+from estadisticas import (
+    consultar as consultar_estadisticas, DIMENSIONES, STATS_SEMANAS_DEFECTO, STATS_TOP_DEFECTO,
+)
+from consumo import (
+    registro_consumo, consultar as consultar_consumo, llamadas_de_reporte, CONSUMO_DIAS_DEFECTO,
+)
+from migraciones import aplicar_migraciones
+from admision import Saturado
+from idempotencia import (
+    analisis_unicos, huella, ClaveReutilizada, CABECERA_IDEMPOTENCIA, CABECERA_RESULTADO,
+)
+from dialogo import pensar_respuesta_async, sesiones
+from dialogo_ws import atender_dialogo
+from metricas import MiddlewareMetricas, CABECERA_ID_PETICION, exponer
 
 # ==========================================
 # 1. CONFIGURACIÓN DE BASE DE DATOS
 # ==========================================
-# ⚠️ IMPORTANTE: Dejamos 'drop_all' activo una vez para reiniciar la tabla
-# con las nuevas columnas. En el futuro, comenta esa línea.
-models.Base.metadata.drop_all(bind=engine) 
-models.Base.metadata.create_all(bind=engine)
+# El esquema se migra al arrancar (no al importar) y sin borrar datos:
+# si ya está en la última versión es una sola consulta (ver migraciones.py).
+estado_servicio = {"listo": False, "version_esquema": None}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    estado_servicio["version_esquema"] = await asyncio.to_thread(aplicar_migraciones, engine)
+    await registro_consumo.iniciar()
+    await gestor.iniciar()
+    estado_servicio["listo"] = True
+    yield
+    estado_servicio["listo"] = False
+    await gestor.detener()
+    # Después de los workers: sus últimas llamadas también se guardan
+    await registro_consumo.detener()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+ModoTranscripcion = Literal["auto", "completa", "segmentada"]
+ModoReporte = Literal["completo", "rapido"]
 
 # Configuración de CORS (Para que Flutter pueda hablar con Python)
 app.add_middleware(
@@ -29,140 +72,236 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Siguiente-Cursor", CABECERA_ID_PETICION, CABECERA_RESULTADO, "Retry-After"],
 )
+# Latencia, errores y peticiones en curso; agrega X-Request-ID a cada respuesta
+app.add_middleware(MiddlewareMetricas)
+
+
+@app.exception_handler(Saturado)
+async def servicio_saturado(request, exc):
+    """Sin capacidad para llamar a los modelos (ver admision.py): 429 inmediato."""
+    return JSONResponse(
+        {"error": str(exc), "recurso": exc.recurso},
+        status_code=429,
+        headers={"Retry-After": str(exc.reintentar_en)},
+    )
 
 # ==========================================
 # 2. ENDPOINTS (LAS FUNCIONES)
 # ==========================================
 
+async def _analizar_audio(audio, usar_cache, modo_transcripcion, modo_reporte, db):
+    """Transcripción + reporte + guardado. Lo comparten /analyze_audio y su versión SSE."""
+    # B. Transcribir (Whisper o cache por hash del audio)
+    emitir("transcripcion", estado="inicio")
+    texto_transcrito, metadatos_transcripcion = await transcribir_cacheado(audio, usar_cache, modo_transcripcion)
+    emitir("transcripcion", estado="fin", **metadatos_transcripcion)
+
+    if not texto_transcrito:
+        return {"error": "No se pudo transcribir el audio."}
+
+    # C. Analizar (DeepSeek o cache) y aplicar el parche de seguridad JSON
+    reporte_json, metadatos_reporte = await generar_reporte_cacheado(texto_transcrito, usar_cache, modo_reporte)
+    reporte_json = normalizar_reporte(reporte_json)
+
+    # D. Guardar en Base de Datos (agrega el ID al JSON)
+    await guardar_reporte(db, reporte_json)
+
+    # E. Devolver respuesta final al Frontend
+    return {
+        "estado": "exito",
+        "nombre_archivo": audio.nombre,
+        "transcripcion": texto_transcrito,
+        "analisis_ia": reporte_json,
+        "desde_cache": metadatos_reporte["desde_cache"],
+        "modo_reporte": metadatos_reporte["modo"],
+        "degradado": metadatos_reporte["degradado"],
+        "etapas": metadatos_reporte["etapas"],
+        "transcripcion_desde_cache": metadatos_transcripcion["desde_cache"],
+        "metadatos_transcripcion": metadatos_transcripcion,
+        "sha256_audio": audio.sha256
+    }
+
+
 @app.post("/analyze_audio")
-async def analyze_audio(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def analyze_audio(
+    response: Response,
+    file: UploadFile = File(...),
+    usar_cache: bool = True,
+    modo_transcripcion: ModoTranscripcion = "auto",
+    modo_reporte: Optional[ModoReporte] = None,
+    idempotency_key: Optional[str] = Header(None, alias=CABECERA_IDEMPOTENCIA),
+    db: AsyncSession = Depends(get_db_async),
+):
     print(f"📥 Recibiendo archivo: {file.filename}")
     
-    # A. Guardar archivo temporal
-    ruta_temporal = f"temp_{file.filename}"
-    with open(ruta_temporal, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
+    # A. Ingesta por streaming (memoria o tempfile único, con hash y límites)
     try:
-        # B. Transcribir (Whisper)
-        texto_transcrito = transcribir_sesion(ruta_temporal)
-        
-        if not texto_transcrito:
-            return {"error": "No se pudo transcribir el audio."}
-
-        # C. Analizar (DeepSeek)
-        # OJO: Aquí obtenemos la respuesta cruda
-        reporte_json = generar_reporte_clinico(texto_transcrito)
-
-        # === PARCHE DE SEGURIDAD: Convertir Texto a JSON si es necesario ===
-        if isinstance(reporte_json, str):
-            print("⚠️ Alerta: La IA devolvió texto. Convirtiendo a JSON...")
-            try:
-                # Limpieza de etiquetas markdown ```json
-                json_limpio = reporte_json.replace("```json", "").replace("```", "").strip()
-                reporte_json = json.loads(json_limpio)
-            except Exception as e_json:
-                print(f"❌ Error fatal convirtiendo JSON: {e_json}")
-                # Diccionario de emergencia
-                reporte_json = {
-                    "motivo_consulta": "Error de formato IA",
-                    "diagnostico_tecnico": "La IA no devolvió un JSON válido.",
-                    "resumen_sesion": str(reporte_json),
-                    "recomendaciones": [],
-                    "oportunidades_omitidas": []
-                }
-        # ===================================================================
-
-        # D. Guardar en Base de Datos
-        try:
-            # Serializar listas a String para SQL
-            recomendaciones_str = json.dumps(reporte_json.get("recomendaciones", []))
-            oportunidades_str = json.dumps(reporte_json.get("oportunidades_omitidas", []))
-
-            nuevo_reporte = models.Reporte(
-                motivo_consulta=reporte_json.get("motivo_consulta"),
-                emocion_base=reporte_json.get("emocion_base"),
-                organo_afectado=reporte_json.get("organo_afectado"),
-                conflicto_biologico=reporte_json.get("conflicto_biologico"),
-                diagnostico_tecnico=reporte_json.get("diagnostico_tecnico"),
-                
-                # Campos Nuevos
-                hallazgos_clinicos=reporte_json.get("hallazgos_clinicos", "Sin hallazgos."),
-                oportunidades_omitidas=oportunidades_str,
-                
-                recomendaciones=recomendaciones_str,
-                resumen_sesion=reporte_json.get("resumen_sesion")
-            )
-
-            db.add(nuevo_reporte)
-            db.commit()
-            db.refresh(nuevo_reporte)
-            print(f"✅ Reporte guardado con ID: {nuevo_reporte.id}")
-            
-            # Agregamos el ID al JSON de respuesta
-            reporte_json["id"] = nuevo_reporte.id
-            
-        except Exception as e_db:
-            print(f"⚠️ Error guardando en DB: {e_db}")
-            # No detenemos el programa, el usuario recibirá su reporte igual
-
-        # E. Devolver respuesta final al Frontend
-        return {
-            "estado": "exito",
-            "nombre_archivo": file.filename,
-            "transcripcion": texto_transcrito,
-            "analisis_ia": reporte_json 
-        }
-        
+        audio = await ingerir_subida(file)
+    except ErrorIngesta as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    try:
+        # Un reintento del mismo audio se une al análisis en curso o recibe el ya hecho
+        resultado, origen = await analisis_unicos.ejecutar(
+            "analyze_audio",
+            huella(audio.sha256, usar_cache, modo_transcripcion, modo_reporte),
+            lambda: _analizar_audio(audio, usar_cache, modo_transcripcion, modo_reporte, db),
+            idempotency_key,
+            # Sin cache el cliente pide un análisis nuevo: solo vale su propia clave
+            por_contenido=usar_cache,
+        )
+        response.headers[CABECERA_RESULTADO] = origen
+        return resultado
+
+    except ClaveReutilizada as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    except Saturado:
+        raise
+
     except Exception as e:
         print(f"❌ ERROR CRÍTICO: {str(e)}")
         return {"error": str(e)}
         
     finally:
         # F. Limpieza
-        if os.path.exists(ruta_temporal):
-            os.remove(ruta_temporal)
+        audio.cerrar()
 
 
-@app.get("/historial")
-def leer_historial(db: Session = Depends(get_db)):
-    print("📖 Consultando historial...")
-    reportes = db.query(models.Reporte).order_by(models.Reporte.created_at.desc()).all()
-    
-    lista_resultado = []
-    for rep in reportes:
-        # Convertir Objeto DB a Diccionario
-        rep_dict = {
-            "id": rep.id,
-            "fecha": str(rep.created_at),
-            "motivo_consulta": rep.motivo_consulta,
-            "emocion_base": rep.emocion_base,
-            "organo_afectado": rep.organo_afectado,
-            "conflicto_biologico": rep.conflicto_biologico,
-            "diagnostico_tecnico": rep.diagnostico_tecnico,
-            "hallazgos_clinicos": rep.hallazgos_clinicos,
-            "resumen_sesion": rep.resumen_sesion,
-            "recomendaciones": [],
-            "oportunidades_omitidas": []
-        }
-        
-        # Parsear Strings JSON a Listas
-        try:
-            if rep.recomendaciones:
-                rep_dict["recomendaciones"] = json.loads(rep.recomendaciones)
-        except:
-            pass
-            
+@app.post("/analyze_audio/stream")
+async def analyze_audio_stream(
+    file: UploadFile = File(...),
+    usar_cache: bool = True,
+    modo_transcripcion: ModoTranscripcion = "auto",
+    modo_reporte: Optional[ModoReporte] = None,
+):
+    """Igual que /analyze_audio, pero emite el progreso como Server-Sent Events."""
+    print(f"📥 Recibiendo archivo (streaming): {file.filename}")
+    try:
+        audio = await ingerir_subida(file)
+    except ErrorIngesta as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    async def analizar():
+        # Sesión propia: la respuesta sigue viva después de que termina el endpoint
         try:
-            if rep.oportunidades_omitidas:
-                rep_dict["oportunidades_omitidas"] = json.loads(rep.oportunidades_omitidas)
-        except:
-            pass
-            
-        lista_resultado.append(rep_dict)
+            async with AsyncSessionLocal() as db:
+                return await _analizar_audio(audio, usar_cache, modo_transcripcion, modo_reporte, db)
+        finally:
+            audio.cerrar()
+
+    return respuesta_sse(analizar())
+
+
+# ==========================================
+# ANÁLISIS EN SEGUNDO PLANO (JOBS)
+# ==========================================
+
+@app.post("/jobs/analyze_audio", status_code=202)
+async def crear_trabajo_audio(
+    file: UploadFile = File(...),
+    usar_cache: bool = True,
+    modo_transcripcion: ModoTranscripcion = "auto",
+    modo_reporte: Optional[ModoReporte] = None,
+    db: AsyncSession = Depends(get_db_async),
+):
+    print(f"📥 Recibiendo archivo para trabajo en segundo plano: {file.filename}")
+
+    try:
+        audio = await ingerir_subida(file)
+    except ErrorIngesta as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    try:
+        trabajo = await gestor.crear(db, audio, usar_cache, modo_transcripcion, modo_reporte)
+    except ColaLlena:
+        audio.cerrar()
+        raise HTTPException(
+            status_code=503,
+            detail="La cola de análisis está llena. Intenta de nuevo en unos minutos.",
+            headers={"Retry-After": "30"},
+        )
+
+    return {
+        "estado": trabajo.estado,
+        "job_id": trabajo.id,
+        "url_estado": f"/jobs/{trabajo.id}",
+        "en_cola": gestor.en_cola,
+    }
+
+
+@app.get("/jobs")
+async def listar_trabajos(limit: int = 20, db: AsyncSession = Depends(get_db_async)):
+    trabajos = (await db.scalars(
+        select(models.Trabajo).order_by(models.Trabajo.created_at.desc()).limit(limit)
+    )).all()
+    return [trabajo_a_dict(t) for t in trabajos]
+
+
+@app.get("/jobs/{job_id}")
+async def leer_trabajo(job_id: str, db: AsyncSession = Depends(get_db_async)):
+    trabajo = await db.get(models.Trabajo, job_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo_a_dict(trabajo)
+
+
+@app.get("/historial", response_model=List[ReporteHistorial])
+async def leer_historial(
+    limit: int = HISTORIAL_LIMIT_DEFECTO,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_db_async),
+):
+    """Página de reportes, del más nuevo al más viejo.
+
+    La respuesta sigue siendo una lista; si hay más páginas, el cursor para
+    pedir la siguiente viene en la cabecera X-Siguiente-Cursor.
+    fields: lista separada por comas o 'resumen' para las vistas de lista.
+    """
+    print("📖 Consultando historial...")
+    try:
+        campos = parsear_campos(fields)
+        reportes, siguiente = await consultar_pagina(db, limit, cursor, campos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cabeceras = {"X-Siguiente-Cursor": siguiente} if siguiente else None
+    return Response(serializar_lista(reportes, campos), media_type="application/json", headers=cabeceras)
 
-    return lista_resultado
+
+@app.get("/historial/search", response_model=List[ResultadoBusqueda])
+async def buscar_historial(
+    q: str,
+    limit: int = BUSQUEDA_LIMIT_DEFECTO,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = "resumen",
+    db: AsyncSession = Depends(get_db_async),
+):
+    """Reportes que mencionan 'q', del más relevante al menos relevante.
+
+    Cada resultado trae 'relevancia' y un 'fragmento' con las palabras
+    encontradas marcadas; la paginación es igual que en /historial.
+    """
+    print(f"🔎 Buscando en historial: {q[:80]}")
+    try:
+        campos = parsear_campos(fields)
+        resultados, siguiente = await buscar(db, q, limit, cursor, campos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cabeceras = {"X-Siguiente-Cursor": siguiente} if siguiente else None
+    return Response(serializar_resultados(resultados, campos), media_type="application/json", headers=cabeceras)
+
+
+@app.get("/historial/{reporte_id}", response_model=ReporteHistorial)
+async def leer_reporte(reporte_id: int, db: AsyncSession = Depends(get_db_async)):
+    reporte = await db.get(models.Reporte, reporte_id)
+    if reporte is None:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    return Response(serializar_detalle(reporte), media_type="application/json")
 
 # ==========================================
 # ENDPOINT PARA TEXTO (NUEVO)
@@ -171,68 +310,185 @@ def leer_historial(db: Session = Depends(get_db)):
 # Definimos el formato del paquete que nos enviará Flutter
 class ConsultaTexto(BaseModel):
     texto: str
+    usar_cache: bool = True
+    modo_reporte: Optional[ModoReporte] = None
+
+
+async def _analizar_texto(consulta, db):
+    # A. Analizar Directamente (Sin Whisper)
+    # Usamos el mismo cerebro que para el audio
+    reporte_json, metadatos_reporte = await generar_reporte_cacheado(
+        consulta.texto, consulta.usar_cache, consulta.modo_reporte
+    )
+
+    # B. Parche de Seguridad (Igual que en audio)
+    reporte_json = normalizar_reporte(
+        reporte_json,
+        motivo_error="Texto directo",
+        diagnostico_error="Error de formato JSON en texto.",
+    )
+
+    # C. Guardar en Base de Datos (Igual que en audio)
+    await guardar_reporte(db, reporte_json, hallazgos_por_defecto="Análisis de texto directo.")
+
+    # D. Devolver respuesta
+    return {
+        "estado": "exito",
+        "tipo": "texto",
+        "analisis_ia": reporte_json,
+        "desde_cache": metadatos_reporte["desde_cache"],
+        "modo_reporte": metadatos_reporte["modo"],
+        "degradado": metadatos_reporte["degradado"],
+        "etapas": metadatos_reporte["etapas"]
+    }
+
 
 @app.post("/analyze_text")
-async def analyze_text(consulta: ConsultaTexto, db: Session = Depends(get_db)):
+async def analyze_text(
+    consulta: ConsultaTexto,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=CABECERA_IDEMPOTENCIA),
+    db: AsyncSession = Depends(get_db_async),
+):
     print(f"📝 Recibiendo consulta de texto (Longitud: {len(consulta.texto)} caracteres)")
     
     try:
-        # A. Analizar Directamente (Sin Whisper)
-        # Usamos el mismo cerebro que para el audio
-        reporte_json = generar_reporte_clinico(consulta.texto)
-
-        # B. Parche de Seguridad (Igual que en audio)
-        if isinstance(reporte_json, str):
-            try:
-                json_limpio = reporte_json.replace("```json", "").replace("```", "").strip()
-                reporte_json = json.loads(json_limpio)
-            except:
-                reporte_json = {
-                    "motivo_consulta": "Texto directo",
-                    "diagnostico_tecnico": "Error de formato JSON en texto.",
-                    "resumen_sesion": str(reporte_json),
-                    "recomendaciones": [],
-                    "oportunidades_omitidas": []
-                }
-
-        # C. Guardar en Base de Datos (Igual que en audio)
-        try:
-            recomendaciones_str = json.dumps(reporte_json.get("recomendaciones", []))
-            oportunidades_str = json.dumps(reporte_json.get("oportunidades_omitidas", []))
-
-            nuevo_reporte = models.Reporte(
-                motivo_consulta=reporte_json.get("motivo_consulta"),
-                emocion_base=reporte_json.get("emocion_base"),
-                organo_afectado=reporte_json.get("organo_afectado"),
-                conflicto_biologico=reporte_json.get("conflicto_biologico"),
-                diagnostico_tecnico=reporte_json.get("diagnostico_tecnico"),
-                hallazgos_clinicos=reporte_json.get("hallazgos_clinicos", "Análisis de texto directo."),
-                oportunidades_omitidas=oportunidades_str,
-                recomendaciones=recomendaciones_str,
-                resumen_sesion=reporte_json.get("resumen_sesion")
-            )
-
-            db.add(nuevo_reporte)
-            db.commit()
-            db.refresh(nuevo_reporte)
-            
-            # Agregamos ID para el frontend
-            reporte_json["id"] = nuevo_reporte.id
-            
-        except Exception as e_db:
-            print(f"⚠️ Error guardando texto en DB: {e_db}")
-
-        # D. Devolver respuesta
-        return {
-            "estado": "exito",
-            "tipo": "texto",
-            "analisis_ia": reporte_json 
-        }
+        resultado, origen = await analisis_unicos.ejecutar(
+            "analyze_text",
+            huella(normalizar_texto(consulta.texto), consulta.usar_cache, consulta.modo_reporte),
+            lambda: _analizar_texto(consulta, db),
+            idempotency_key,
+            por_contenido=consulta.usar_cache,
+        )
+        response.headers[CABECERA_RESULTADO] = origen
+        return resultado
+
+    except ClaveReutilizada as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    except Saturado:
+        raise
 
     except Exception as e:
         print(f"❌ Error en endpoint de texto: {str(e)}")
         return {"error": str(e)}
 
+
+@app.post("/analyze_text/stream")
+async def analyze_text_stream(consulta: ConsultaTexto):
+    """Igual que /analyze_text, pero emite el progreso como Server-Sent Events."""
+    print(f"📝 Recibiendo consulta de texto por streaming (Longitud: {len(consulta.texto)} caracteres)")
+
+    async def analizar():
+        async with AsyncSessionLocal() as db:
+            return await _analizar_texto(consulta, db)
+
+    return respuesta_sse(analizar())
+
+
+class ConsultaTextoLote(BaseModel):
+    textos: List[str] = Field(..., min_length=1, max_length=LOTE_MAX_TEXTOS)
+    usar_cache: bool = True
+    modo_reporte: Optional[ModoReporte] = None
+
+
+@app.post("/analyze_text/batch")
+async def analyze_text_batch(consulta: ConsultaTextoLote):
+    """Analiza varios textos a la vez. Responde NDJSON, una línea por texto según terminan."""
+    print(f"📚 Recibiendo lote de {len(consulta.textos)} textos")
+    return respuesta_lote(consulta.textos, consulta.usar_cache, consulta.modo_reporte)
+
+
+@app.get("/metrics")
+def metrics():
+    """Métricas en formato de texto de Prometheus."""
+    return Response(exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: esquema migrado, cola de trabajos en marcha y la base responde."""
+    if not estado_servicio["listo"]:
+        return JSONResponse({"listo": False, "motivo": "Arrancando"}, status_code=503)
+    try:
+        async with engine_async.connect() as conexion:
+            await conexion.execute(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse({"listo": False, "motivo": f"Base de datos: {e}"}, status_code=503)
+    return {"listo": True, "version_esquema": estado_servicio["version_esquema"]}
+
+
+@app.get("/stats")
+async def leer_estadisticas(
+    semanas: int = STATS_SEMANAS_DEFECTO,
+    top: int = STATS_TOP_DEFECTO,
+    dimension: Optional[str] = None,
+    db: AsyncSession = Depends(get_db_async),
+):
+    """Emociones, órganos y conflictos más frecuentes por semana (de conteos_semanales).
+
+    dimension: una de emocion_base, organo_afectado, conflicto_biologico (todas si se omite).
+    """
+    if dimension is not None and dimension not in DIMENSIONES:
+        raise HTTPException(status_code=400, detail=f"Dimensión desconocida: {dimension}")
+    dimensiones = (dimension,) if dimension else DIMENSIONES
+    return await consultar_estadisticas(db, semanas, top, dimensiones)
+
+
+@app.get("/consumo")
+async def leer_consumo(dias: int = CONSUMO_DIAS_DEFECTO, db: AsyncSession = Depends(get_db_async)):
+    """Tokens, latencia y costo estimado de las llamadas a DeepSeek por día, endpoint y etapa."""
+    return await consultar_consumo(db, dias)
+
+
+@app.get("/consumo/reporte/{reporte_id}")
+async def leer_consumo_reporte(reporte_id: int, db: AsyncSession = Depends(get_db_async)):
+    """Las llamadas a DeepSeek que produjeron un reporte (las escritas hasta ahora)."""
+    return {"reporte_id": reporte_id, "llamadas": await llamadas_de_reporte(db, reporte_id)}
+
+
+@app.get("/cache/estadisticas")
+def estadisticas_cache():
+    return {
+        "reportes": cache_reportes.estadisticas(),
+        "transcripciones": cache_transcripciones.estadisticas(),
+    }
+
+
+# ==========================================
+# MODO DIÁLOGO (TERAPEUTA CONVERSACIONAL)
+# ==========================================
+
+class MensajeDialogo(BaseModel):
+    texto: str = Field(..., min_length=1)
+    # Sin sesion_id se abre una conversación nueva; el ID vuelve en la respuesta
+    sesion_id: Optional[str] = Field(None, max_length=64)
+
+
+@app.post("/dialogo")
+async def dialogo(mensaje: MensajeDialogo):
+    try:
+        return await pensar_respuesta_async(mensaje.texto, mensaje.sesion_id)
+    except Saturado:
+        raise
+    except Exception as e:
+        print(f"❌ Error en diálogo: {e}")
+        raise HTTPException(status_code=502, detail=f"Error pensando: {e}")
+
+
+@app.delete("/dialogo/{sesion_id}")
+def cerrar_dialogo(sesion_id: str):
+    if not sesiones.cerrar(sesion_id):
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    return {"estado": "cerrada", "sesion_id": sesion_id}
+
+
+@app.websocket("/ws/dialogo")
+async def dialogo_en_vivo(websocket: WebSocket, sesion_id: Optional[str] = None, formato: str = "webm"):
+    """Fragmentos de audio entran, tokens de la respuesta salen (protocolo en dialogo_ws.py)."""
+    await atender_dialogo(websocket, sesion_id, formato)
+
+
 class PlanAsistenteRequest(BaseModel):
     descripcion: str
     contexto: dict = Field(default_factory=dict)
@@ -247,7 +503,7 @@ async def design_assistant(payload: PlanAsistenteRequest):
         "contexto": payload.contexto,
     }
 
-    plan = generar_plan_asistente_mentor(datos_terapeuta)
+    plan = await generar_plan_asistente_mentor_async(datos_terapeuta)
 
     if not plan or plan.get("error"):
         raise HTTPException(status_code=502, detail=plan.get("error", "No se pudo generar el plan"))
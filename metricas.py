@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ==========================================
+# MÉTRICAS (FORMATO PROMETHEUS) Y LOGS CON ID DE PETICIÓN
+# ==========================================
+# Sin dependencias: contadores, indicadores e histogramas en memoria del
+# proceso, expuestos en /metrics con el formato de texto de Prometheus.
+# medir("etapa") cronometra un bloque y cuenta sus errores; cada medición
+# deja además una línea JSON con el ID de la petición en curso, para
+# encontrar la etapa lenta de una petición concreta bajo carga.
+
+LOG_ESTRUCTURADO = os.environ.get("LOG_ESTRUCTURADO", "1") == "1"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CABECERA_ID_PETICION = "X-Request-ID"
+
+_id_peticion = contextvars.ContextVar("id_peticion", default=None)
+# ID que genera siempre el servidor (el de arriba puede venir del cliente)
+_id_interno = contextvars.ContextVar("id_interno", default=None)
+# Scope ASGI de la petición en curso (o un nombre fijo, para los workers)
+_ruta_peticion = contextvars.ContextVar("ruta_peticion", default=None)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatear_etiquetas(nombres, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas):
+        return tuple(str(etiquetas.get(n, "")) for n in self.etiquetas)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            valores = dict(self._valores)
+        for clave, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+
+class Indicador(_Metrica):
+    tipo = "gauge"
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def dec(self, cantidad=1, **etiquetas):
+        self.inc(-cantidad, **etiquetas)
+
+    def fijar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                # [conteo por bucket..., suma, total]
+                serie = self._valores[clave] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            valores = {clave: list(serie) for clave, serie in self._valores.items()}
+        for clave, serie in sorted(valores.items()):
+            for limite, conteo in zip(self.buckets, serie):
+                le = _formatear_etiquetas(self.etiquetas, clave, f'le="{limite}"')
+                lineas.append(f"{self.nombre}_bucket{le} {conteo}")
+            inf = _formatear_etiquetas(self.etiquetas, clave, 'le="+Inf"')
+            lineas.append(f"{self.nombre}_bucket{inf} {serie[-1]}")
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {round(serie[-2], 6)}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {serie[-1]}")
+        return lineas
+
+
+duracion_etapa = Histograma(
+    "biodeco_etapa_duracion_segundos", "Latencia de cada etapa del pipeline.", ("etapa",)
+)
+errores_etapa = Contador(
+    "biodeco_etapa_errores_total", "Errores por etapa del pipeline.", ("etapa",)
+)
+peticiones_en_curso = Indicador(
+    "biodeco_http_peticiones_en_curso", "Peticiones HTTP que se están atendiendo ahora."
+)
+duracion_peticion = Histograma(
+    "biodeco_http_duracion_segundos", "Latencia de las peticiones HTTP.", ("metodo", "ruta")
+)
+peticiones_total = Contador(
+    "biodeco_http_peticiones_total", "Peticiones HTTP atendidas.", ("metodo", "ruta", "estado")
+)
+
+METRICAS = [duracion_etapa, errores_etapa, peticiones_en_curso, duracion_peticion, peticiones_total]
+
+
+def registrar(metrica):
+    """Agrega una métrica de otro módulo a la salida de /metrics."""
+    METRICAS.append(metrica)
+    return metrica
+
+
+def exponer():
+    lineas = []
+    for metrica in METRICAS:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+
+# --- ID DE PETICIÓN Y LOGS ESTRUCTURADOS ---
+
+def id_peticion():
+    return _id_peticion.get()
+
+
+def asignar_id_peticion(valor=None):
+    """Fija el ID de la petición en el contexto actual. Devuelve el token para reset()."""
+    return _id_peticion.set(valor or uuid.uuid4().hex[:16])
+
+
+def id_interno():
+    return _id_interno.get()
+
+
+def asignar_id_interno():
+    """ID nuevo generado por el servidor, único aunque el cliente repita X-Request-ID.
+
+    Sirve para asociar datos a la petición (o a una parte de ella, como cada
+    texto de un lote) sin depender de un valor que manda el cliente.
+    """
+    return _id_interno.set(uuid.uuid4().hex)
+
+
+def ruta_peticion():
+    """Plantilla de la ruta en curso ('/analyze_audio'), o None fuera de una petición."""
+    valor = _ruta_peticion.get()
+    if isinstance(valor, dict):
+        # El router agrega la ruta al scope al resolverla, después del middleware
+        return getattr(valor.get("route"), "path", None) or valor.get("path")
+    return valor
+
+
+def asignar_ruta_peticion(valor):
+    return _ruta_peticion.set(valor)
+
+
+def log_evento(evento, **campos):
+    if not LOG_ESTRUCTURADO:
+        return
+    registro = {"ts": round(time.time(), 3), "evento": evento, "request_id": _id_peticion.get(), **campos}
+    print(json.dumps(registro, ensure_ascii=False, default=str), flush=True)
+
+
+def observar_etapa(etapa, segundos, error=False):
+    duracion_etapa.observar(segundos, etapa=etapa)
+    if error:
+        errores_etapa.inc(etapa=etapa)
+    log_evento("etapa", etapa=etapa, segundos=round(segundos, 4), error=bool(error))
+
+
+class Medicion:
+    def __init__(self):
+        self.error = False
+
+    def fallo(self):
+        """Para funciones que atrapan su propia excepción y devuelven None/{'error'}."""
+        self.error = True
+
+
+@contextmanager
+def medir(etapa):
+    """Cronometra el bloque; una excepción o medicion.fallo() cuentan como error."""
+    medicion = Medicion()
+    inicio = time.perf_counter()
+    try:
+        yield medicion
+    except BaseException:
+        medicion.error = True
+        raise
+    finally:
+        observar_etapa(etapa, time.perf_counter() - inicio, medicion.error)
+
+
+# --- MIDDLEWARE HTTP ---
+
+class MiddlewareMetricas:
+    """ASGI puro: cuenta también el tiempo de las respuestas en streaming (SSE, NDJSON)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            token_ruta = asignar_ruta_peticion(scope if scope["type"] == "websocket" else None)
+            token_interno = asignar_id_interno()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _ruta_peticion.reset(token_ruta)
+                _id_interno.reset(token_interno)
+            return
+
+        recibido = dict(scope.get("headers") or []).get(CABECERA_ID_PETICION.lower().encode())
+        valor = recibido.decode("latin-1")[:64] if recibido else None
+        token = asignar_id_peticion(valor)
+        token_ruta = asignar_ruta_peticion(scope)
+        token_interno = asignar_id_interno()
+        estado = {"codigo": 500}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+                cabeceras = list(mensaje.get("headers") or [])
+                cabeceras.append((CABECERA_ID_PETICION.lower().encode(), _id_peticion.get().encode("latin-1")))
+                mensaje = {**mensaje, "headers": cabeceras}
+            await send(mensaje)
+
+        peticiones_en_curso.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            segundos = time.perf_counter() - inicio
+            peticiones_en_curso.dec()
+            # La plantilla de la ruta (no la URL) para no crear una serie por ID
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            duracion_peticion.observar(segundos, metodo=scope["method"], ruta=ruta)
+            peticiones_total.inc(metodo=scope["method"], ruta=ruta, estado=estado["codigo"])
+            log_evento(
+                "peticion", metodo=scope["method"], ruta=ruta,
+                estado=estado["codigo"], segundos=round(segundos, 4),
+            )
+            _id_peticion.reset(token)
+            _ruta_peticion.reset(token_ruta)
+            _id_interno.reset(token_interno)
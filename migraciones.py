@@ -0,0 +1,211 @@
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, DateTime,
+    inspect, text, select, insert, func,
+)
+
+import models
+import busqueda
+import estadisticas
+
+# ==========================================
+# MIGRACIONES DE ESQUEMA
+# ==========================================
+# Cada migración tiene un número de versión; la tabla 'schema_version'
+# guarda cuáles ya se aplicaron. Al arrancar, si la base ya está en la
+# última versión basta una consulta y no se toca el esquema. Si falta
+# alguna, se toma un lock (advisory lock en Postgres, BEGIN IMMEDIATE en
+# SQLite) para que varios workers arrancando a la vez no migren dos veces.
+# Las migraciones deben ser idempotentes: una base creada por create_all
+# puede ya tener lo que agrega una migración posterior.
+
+CLAVE_LOCK_MIGRACIONES = 7152026
+
+_metadata_version = MetaData()
+tabla_version = Table(
+    "schema_version",
+    _metadata_version,
+    Column("version", Integer, primary_key=True),
+    Column("descripcion", String),
+    Column("aplicada_en", DateTime(timezone=True)),
+)
+
+COLUMNAS_LISTA = ("recomendaciones", "oportunidades_omitidas")
+
+
+def _esquema_inicial(conexion):
+    # checkfirst: en una base existente solo crea las tablas que falten
+    models.Base.metadata.create_all(bind=conexion)
+
+
+def _reparar_json_invalido(conexion, columna):
+    """Deja cada valor de la columna como JSON válido.
+
+    Los reportes viejos guardaban json.dumps(lista) en Text; si algún valor
+    no parsea (texto suelto de la IA), se guarda como string JSON.
+    """
+    filas = conexion.execute(
+        text(f"SELECT id, {columna} FROM reportes WHERE {columna} IS NOT NULL")
+    ).fetchall()
+    for reporte_id, valor in filas:
+        if isinstance(valor, (list, dict)):
+            continue
+        if valor == "":
+            nuevo = "[]"
+        else:
+            try:
+                json.loads(valor)
+                continue
+            except (TypeError, ValueError):
+                nuevo = json.dumps(valor, ensure_ascii=False)
+        conexion.execute(
+            text(f"UPDATE reportes SET {columna} = :valor WHERE id = :id"),
+            {"valor": nuevo, "id": reporte_id},
+        )
+
+
+def _listas_a_json(conexion):
+    """recomendaciones / oportunidades_omitidas: Text con JSON -> JSON nativo.
+
+    En Postgres cambia el tipo de columna a JSONB; en SQLite el tipo JSON
+    se guarda como texto, así que basta con reparar los valores inválidos.
+    """
+    tipos = {c["name"]: str(c["type"]).upper() for c in inspect(conexion).get_columns("reportes")}
+    for columna in COLUMNAS_LISTA:
+        if columna not in tipos:
+            continue
+        if conexion.dialect.name == "postgresql":
+            if tipos[columna] == "JSONB":
+                continue
+            _reparar_json_invalido(conexion, columna)
+            conexion.execute(text(
+                f"ALTER TABLE reportes ALTER COLUMN {columna} TYPE JSONB USING {columna}::jsonb"
+            ))
+            print(f"🔧 Columna reportes.{columna} convertida a JSONB.")
+        else:
+            _reparar_json_invalido(conexion, columna)
+
+
+def _conteos_semanales(conexion):
+    """Crea conteos_semanales (si create_all no la creó) y la carga con los reportes existentes."""
+    estadisticas.tabla.create(conexion, checkfirst=True)
+    estadisticas.recalcular(conexion)
+
+
+def _consumo_llamadas(conexion):
+    # create_all ya la crea en bases nuevas; las existentes solo necesitan la tabla
+    models.LlamadaModelo.__table__.create(conexion, checkfirst=True)
+
+
+def _indices_reportes(conexion):
+    """Índices de 'reportes' declarados en models.py después de la primera versión.
+
+    create_all no toca tablas que ya existen, así que en una base anterior
+    ix_reportes_created_at_id (paginación de /historial) nunca se creó.
+    """
+    for indice in models.Reporte.__table__.indexes:
+        indice.create(conexion, checkfirst=True)
+
+
+def _dueno_trabajos(conexion):
+    """trabajos.instancia / trabajos.latido: qué proceso tiene cada trabajo (ver trabajos.py)."""
+    existentes = {c["name"] for c in inspect(conexion).get_columns("trabajos")}
+    for nombre in ("instancia", "latido"):
+        if nombre in existentes:
+            continue
+        tipo = models.Trabajo.__table__.c[nombre].type.compile(dialect=conexion.dialect)
+        conexion.execute(text(f"ALTER TABLE trabajos ADD COLUMN {nombre} {tipo}"))
+
+
+def _id_interno_consumo(conexion):
+    """consumo_llamadas.id_interno: el reporte se vincula por un ID del servidor, no por X-Request-ID."""
+    tabla = models.LlamadaModelo.__table__
+    if "id_interno" not in {c["name"] for c in inspect(conexion).get_columns(tabla.name)}:
+        tipo = tabla.c.id_interno.type.compile(dialect=conexion.dialect)
+        conexion.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN id_interno {tipo}"))
+    for indice in tabla.indexes:
+        indice.create(conexion, checkfirst=True)
+
+
+def _fechas_reportes_sqlite(conexion):
+    """reportes.created_at en SQLite: 'YYYY-MM-DD HH:MM:SS' -> 'YYYY-MM-DD HH:MM:SS.000000'.
+
+    El server_default de la primera versión (CURRENT_TIMESTAMP) guardaba
+    segundos, pero SQLAlchemy escribe y compara con microsegundos. Como
+    texto '10:00:00' < '10:00:00.000000', así que el cursor de /historial
+    volvía a incluir su propia fila y nunca avanzaba sobre esos reportes.
+    En Postgres la columna es timestamptz y compara bien.
+    """
+    if conexion.dialect.name != "sqlite":
+        return
+    conexion.execute(text(
+        "UPDATE reportes SET created_at = created_at || '.000000' WHERE length(created_at) = 19"
+    ))
+
+
+def _modo_reportes(conexion):
+    """reportes.modo_reporte / reportes.degradado: qué pipeline armó cada reporte."""
+    existentes = {c["name"] for c in inspect(conexion).get_columns("reportes")}
+    for nombre in ("modo_reporte", "degradado"):
+        if nombre in existentes:
+            continue
+        tipo = models.Reporte.__table__.c[nombre].type.compile(dialect=conexion.dialect)
+        conexion.execute(text(f"ALTER TABLE reportes ADD COLUMN {nombre} {tipo}"))
+
+
+# (versión, descripción, función que recibe la conexión). Solo se agregan al final.
+MIGRACIONES = [
+    (1, "Esquema inicial: reportes, trabajos y cache_entradas", _esquema_inicial),
+    (2, "recomendaciones / oportunidades_omitidas como JSON nativo", _listas_a_json),
+    (3, "Índice de texto completo de reportes (tsvector/GIN o FTS5)", busqueda.crear_indice),
+    (4, "Conteos semanales por emoción, órgano y conflicto", _conteos_semanales),
+    (5, "Registro de consumo de tokens por llamada (consumo_llamadas)", _consumo_llamadas),
+    (6, "Índices de reportes que create_all no agrega a tablas existentes", _indices_reportes),
+    (7, "Instancia y latido de cada trabajo en segundo plano", _dueno_trabajos),
+    (8, "ID interno en consumo_llamadas para vincular reportes", _id_interno_consumo),
+    (9, "Fechas de reportes con microsegundos en SQLite", _fechas_reportes_sqlite),
+    (10, "Modo y degradación de cada reporte", _modo_reportes),
+]
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+
+def version_esquema(conexion):
+    """Última versión aplicada (0 si la base nunca se migró)."""
+    if not inspect(conexion).has_table("schema_version"):
+        return 0
+    return conexion.execute(select(func.max(tabla_version.c.version))).scalar() or 0
+
+
+def _bloquear(conexion):
+    if conexion.dialect.name == "postgresql":
+        # Se libera solo al terminar la transacción
+        conexion.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": CLAVE_LOCK_MIGRACIONES})
+    elif conexion.dialect.name == "sqlite":
+        # Toma el lock de escritura de la base ya, no en la primera escritura
+        conexion.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def aplicar_migraciones(engine):
+    """Lleva la base a VERSION_ESQUEMA. Devuelve la versión final."""
+    with engine.connect() as conexion:
+        if version_esquema(conexion) >= VERSION_ESQUEMA:
+            return VERSION_ESQUEMA
+
+    with engine.begin() as conexion:
+        _bloquear(conexion)
+        tabla_version.create(conexion, checkfirst=True)
+        # Otro worker pudo haber migrado mientras esperábamos el lock
+        actual = version_esquema(conexion)
+        for version, descripcion, migrar in MIGRACIONES:
+            if version <= actual:
+                continue
+            print(f"🔧 Aplicando migración {version}: {descripcion}")
+            migrar(conexion)
+            conexion.execute(insert(tabla_version).values(
+                version=version, descripcion=descripcion, aplicada_en=datetime.now(timezone.utc),
+            ))
+            actual = version
+    print(f"✅ Esquema en la versión {actual}.")
+    return actual
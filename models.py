@@ -1,12 +1,29 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Float, Boolean, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import synonym
 from sqlalchemy.sql import func
 from database import Base
 
+# JSONB en Postgres, JSON (texto) en SQLite
+TipoJSON = JSON().with_variant(JSONB(), "postgresql")
+
+def _ahora():
+    return datetime.now(timezone.utc)
+
+
 class Reporte(Base):
     __tablename__ = "reportes"
+    __table_args__ = (
+        # Paginación por cursor de /historial (ver historial.py)
+        Index("ix_reportes_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # El default en Python da la misma precisión (microsegundos) en SQLite y
+    # Postgres; sin él SQLite guarda segundos y el cursor compara mal.
+    created_at = Column(DateTime(timezone=True), default=_ahora, server_default=func.now())
+    fecha = synonym("created_at")   # Nombre con el que sale en la API
     
     # Campos Clásicos
     motivo_consulta = Column(String)
@@ -17,8 +34,81 @@ class Reporte(Base):
     
     # --- LOS NUEVOS CEREBROS DEL SISTEMA ---
     hallazgos_clinicos = Column(Text)       # <--- ¡NUEVO!
-    oportunidades_omitidas = Column(Text)   # <--- ¡NUEVO!
+    oportunidades_omitidas = Column(TipoJSON)   # Lista nativa (ver migraciones.py)
     # ---------------------------------------
 
-    recomendaciones = Column(Text)
-    resumen_sesion = Column(Text)
\ No newline at end of file
+    recomendaciones = Column(TipoJSON)
+    resumen_sesion = Column(Text)
+
+    # Pipeline que armó el reporte ("completo" | "rapido"); degradado si se
+    # pidió "completo" y falló la Fase 2. Nulos en los reportes anteriores.
+    modo_reporte = Column(String)
+    degradado = Column(Boolean)
+
+
+class Trabajo(Base):
+    """Análisis de audio en segundo plano (ver trabajos.py)."""
+    __tablename__ = "trabajos"
+
+    id = Column(String, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # en_cola -> transcribiendo -> analizando -> completado | error
+    estado = Column(String, index=True)
+    nombre_archivo = Column(String)
+
+    transcripcion = Column(Text)
+    resultado = Column(Text)    # JSON del reporte serializado
+    error = Column(Text)
+    reporte_id = Column(Integer)
+
+    # Proceso que lo tiene en memoria y último latido (epoch) de ese proceso
+    instancia = Column(String)
+    latido = Column(Float)
+
+
+class EntradaCache(Base):
+    """Segundo nivel (persistente) de los caches de cache.py."""
+    __tablename__ = "cache_entradas"
+
+    espacio = Column(String, primary_key=True)   # "reportes", ...
+    clave = Column(String, primary_key=True)     # sha256 hex
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    expira_en = Column(Float, index=True)        # epoch en segundos
+    valor = Column(Text)                         # JSON serializado
+
+
+class ConteoSemanal(Base):
+    """Cuántos reportes por semana tienen cada valor de una dimensión (ver estadisticas.py)."""
+    __tablename__ = "conteos_semanales"
+
+    semana = Column(Date, primary_key=True)         # lunes de la semana (UTC)
+    dimension = Column(String, primary_key=True)    # "emocion_base", ..., o "reportes"
+    valor = Column(String, primary_key=True)
+    conteo = Column(Integer, nullable=False, default=0)
+
+
+class LlamadaModelo(Base):
+    """Una llamada de chat a DeepSeek: tokens, latencia y a qué petición pertenece (ver consumo.py)."""
+    __tablename__ = "consumo_llamadas"
+    __table_args__ = (
+        # Agregados por día y endpoint de /consumo
+        Index("ix_consumo_llamadas_dia_endpoint", "dia", "endpoint"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime(timezone=True), default=_ahora, server_default=func.now())
+    dia = Column(Date, nullable=False)      # UTC
+    id_interno = Column(String, index=True)     # Generado por el servidor; con él se vincula el reporte
+    request_id = Column(String, index=True)     # X-Request-ID (puede venir del cliente), para correlacionar logs
+    reporte_id = Column(Integer, index=True)    # Se completa al guardar el reporte
+    endpoint = Column(String)
+    etapa = Column(String)                  # fase_1, fase_2, fase_3, rapido, dialogo, plan...
+    modelo = Column(String)
+    resultado = Column(String)              # ok | error
+    intentos = Column(Integer)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)   # Parte del prompt servida del cache del proveedor
+    segundos = Column(Float)
@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import tempfile
+
+import audio
+from ingesta import AudioIngerido, INGESTA_DIR
+from metricas import Contador, registrar, medir
+
+# ==========================================
+# NORMALIZACIÓN DE AUDIO ANTES DE WHISPER
+# ==========================================
+# Los audios del celular llegan en estéreo, a 44.1/48 kHz y con el bitrate
+# que eligió el teléfono. Whisper trabaja en mono a 16 kHz, así que antes de
+# subir a Replicate se decodifica, se pasa a mono 16 kHz, se recorta el
+# silencio del principio y del final y se recodifica en Opus. Se sube menos
+# y el modelo procesa menos segundos.
+#
+# Cada normalización es un proceso ffmpeg aparte (el event loop solo espera
+# su salida); NORMALIZACION_PROCESOS limita cuántos corren a la vez para no
+# saturar la CPU de la máquina.
+
+NORMALIZACION_ACTIVA = os.environ.get("NORMALIZACION_ACTIVA", "1") == "1"
+NORMALIZACION_PROCESOS = int(os.environ.get("NORMALIZACION_PROCESOS", str(os.cpu_count() or 2)))
+NORMALIZACION_CODEC = os.environ.get("NORMALIZACION_CODEC", "libopus")
+NORMALIZACION_BITRATE = os.environ.get("NORMALIZACION_BITRATE", "24k")
+NORMALIZACION_UMBRAL_DB = float(os.environ.get("NORMALIZACION_UMBRAL_DB", "-45"))
+# Margen que se deja antes y después de la voz al recortar
+NORMALIZACION_MARGEN = 0.25
+
+EXTENSIONES = {"libopus": ".ogg", "flac": ".flac", "aac": ".m4a"}
+
+bytes_ahorrados = registrar(Contador(
+    "biodeco_audio_bytes_ahorrados_total", "Bytes que se dejaron de subir gracias a la normalización."
+))
+segundos_recortados = registrar(Contador(
+    "biodeco_audio_segundos_recortados_total", "Segundos de silencio recortados antes de transcribir."
+))
+
+_procesos = {"loop": None, "semaforo": None}
+
+
+def _semaforo():
+    # El semáforo queda atado al loop donde se crea (igual que los clientes de IA)
+    loop = asyncio.get_running_loop()
+    if _procesos["loop"] is not loop:
+        _procesos["loop"] = loop
+        _procesos["semaforo"] = asyncio.Semaphore(NORMALIZACION_PROCESOS)
+    return _procesos["semaforo"]
+
+
+async def _normalizar(original):
+    ruta = original.asegurar_en_disco()
+    async with _semaforo():
+        inicio, fin, duracion = await audio.tramo_con_voz(ruta, NORMALIZACION_UMBRAL_DB)
+        inicio = max(0.0, inicio - NORMALIZACION_MARGEN)
+        fin = min(duracion, fin + NORMALIZACION_MARGEN) if duracion else None
+        if fin is not None and fin <= inicio:
+            # Todo es silencio (o no se pudo medir): no se recorta
+            inicio, fin = 0.0, None
+
+        destino = tempfile.NamedTemporaryFile(
+            prefix="normalizado_", suffix=EXTENSIONES.get(NORMALIZACION_CODEC, ".ogg"),
+            dir=INGESTA_DIR, delete=False,
+        )
+        destino.close()
+        try:
+            await audio.normalizar(ruta, destino.name, inicio, fin, NORMALIZACION_CODEC, NORMALIZACION_BITRATE)
+        except Exception:
+            os.remove(destino.name)
+            raise
+
+    nombre, _ = os.path.splitext(os.path.basename(original.nombre))
+    normalizado = AudioIngerido(nombre + EXTENSIONES.get(NORMALIZACION_CODEC, ".ogg"))
+    normalizado.archivo = open(destino.name, "rb")
+    normalizado.ruta = destino.name
+    normalizado.tamano = os.path.getsize(destino.name)
+    normalizado.sha256 = original.sha256
+    normalizado.duracion = (fin if fin is not None else duracion) - inicio if duracion else None
+    return normalizado, duracion
+
+
+async def normalizar_para_whisper(original):
+    """Devuelve (audio_a_transcribir, metadatos).
+
+    Si la normalización está apagada, no hay ffmpeg, falla o el resultado
+    no es más chico, se devuelve el mismo audio original. Quien llama cierra
+    el audio devuelto si no es el original.
+    """
+    if not NORMALIZACION_ACTIVA or audio.FFMPEG is None:
+        return original, {"aplicada": False}
+
+    inicio = time.perf_counter()
+    try:
+        with medir("normalizacion"):
+            normalizado, duracion = await _normalizar(original)
+    except audio.ErrorAudio as e:
+        print(f"⚠️ No se pudo normalizar el audio, se sube el original: {e}")
+        return original, {"aplicada": False, "error": str(e)[-200:]}
+
+    duracion_original = original.duracion or duracion
+    metadatos = {
+        "aplicada": True,
+        "bytes_original": original.tamano,
+        "bytes_normalizado": normalizado.tamano,
+        "ahorro_bytes": original.tamano - normalizado.tamano,
+        "duracion_original": round(duracion_original, 2) if duracion_original else None,
+        "duracion_normalizada": round(normalizado.duracion, 2) if normalizado.duracion else None,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+    if duracion_original and normalizado.duracion:
+        metadatos["ahorro_segundos"] = round(max(0.0, duracion_original - normalizado.duracion), 2)
+
+    if normalizado.tamano >= original.tamano:
+        # Ya venía compacto (p. ej. un Opus mono): se sube tal cual
+        normalizado.cerrar()
+        return original, {**metadatos, "aplicada": False}
+
+    bytes_ahorrados.inc(metadatos["ahorro_bytes"])
+    segundos_recortados.inc(metadatos.get("ahorro_segundos") or 0)
+    print(
+        f"🎚️ Audio normalizado: {original.tamano} -> {normalizado.tamano} bytes"
+        f" ({metadatos.get('ahorro_segundos') or 0}s de silencio recortados)."
+    )
+    return normalizado, metadatos
@@ -0,0 +1,178 @@
+import os
+import time
+import random
+import asyncio
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import httpx
+
+from admision import Saturado
+from metricas import Contador, registrar
+
+# ==========================================
+# PLAZOS, REINTENTOS Y LLAMADAS DE COBERTURA
+# ==========================================
+# Cada reporte tiene un plazo total (REPORTE_PLAZO) que se reparte entre
+# sus etapas según PESOS_PLAZO; lo que una etapa no usa queda para las
+# siguientes. Dentro de la etapa cada llamada a DeepSeek tiene un timeout
+# (el menor entre CHAT_TIMEOUT_LLAMADA y lo que queda del plazo).
+#   - Errores transitorios (timeout, conexión, 429, 5xx): se reintenta con
+#     espera exponencial con jitter mientras quede plazo.
+#   - Cobertura (CHAT_COBERTURA=1): si una llamada tarda más que el p95
+#     reciente de su etapa, se lanza una copia y gana la primera respuesta.
+#     Recorta la cola de latencia a cambio de algunas llamadas de más.
+# El resultado de cada llamada queda contado en /metrics.
+
+REPORTE_PLAZO = float(os.environ.get("REPORTE_PLAZO", "300"))
+PLAN_PLAZO = float(os.environ.get("PLAN_PLAZO", "120"))
+CHAT_TIMEOUT_LLAMADA = float(os.environ.get("CHAT_TIMEOUT_LLAMADA", "120"))
+CHAT_REINTENTOS = int(os.environ.get("CHAT_REINTENTOS", "2"))
+CHAT_ESPERA_BASE = float(os.environ.get("CHAT_ESPERA_BASE", "0.5"))
+CHAT_COBERTURA = os.environ.get("CHAT_COBERTURA", "0") == "1"
+
+# Parte del plazo del reporte que le toca a cada etapa
+PESOS_PLAZO = {"fase_1": 0.3, "fase_2": 0.45, "fase_3": 0.25, "rapido": 1.0}
+# Latencias recientes por etapa para el p95 (y cuántas hacen falta para confiar en él)
+VENTANA_LATENCIAS = 200
+MINIMO_MUESTRAS_P95 = 20
+ESTADOS_TRANSITORIOS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+resultados_llamadas = registrar(Contador(
+    "biodeco_chat_llamadas_total",
+    "Llamadas a DeepSeek por etapa y resultado (ok, reintentada, cobertura, timeout, error, plazo_agotado).",
+    ("etapa", "resultado"),
+))
+intentos_llamadas = registrar(Contador(
+    "biodeco_chat_intentos_total", "Intentos individuales a DeepSeek (incluye reintentos y copias).", ("etapa", "tipo")
+))
+
+_plazo = contextvars.ContextVar("plazo", default=None)
+_latencias = defaultdict(lambda: deque(maxlen=VENTANA_LATENCIAS))
+
+
+class PlazoAgotado(TimeoutError):
+    """No queda tiempo del plazo de la petición para otra llamada."""
+
+
+@contextmanager
+def plazo(segundos):
+    """Fija el plazo (absoluto) de lo que corre dentro del bloque."""
+    marca = _plazo.set(time.monotonic() + segundos)
+    try:
+        yield
+    finally:
+        _plazo.reset(marca)
+
+
+def restante():
+    """Segundos que quedan del plazo actual (None si no hay plazo)."""
+    fin = _plazo.get()
+    return None if fin is None else fin - time.monotonic()
+
+
+def repartir(etapas, indice, total_restante):
+    """Segundos para la etapa 'indice' según su peso entre las que faltan."""
+    pesos = [PESOS_PLAZO.get(nombre, 1.0) for nombre in etapas[indice:]]
+    return max(0.0, total_restante) * pesos[0] / sum(pesos)
+
+
+def p95(etapa):
+    muestras = _latencias[etapa]
+    if len(muestras) < MINIMO_MUESTRAS_P95:
+        return None
+    ordenadas = sorted(muestras)
+    return ordenadas[int(0.95 * (len(ordenadas) - 1))]
+
+
+def es_transitorio(error):
+    if isinstance(error, PlazoAgotado):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    import openai  # ya está cargado: solo se llega aquí después de usar el cliente
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in ESTADOS_TRANSITORIOS
+
+
+def _timeout_llamada():
+    queda = restante()
+    return CHAT_TIMEOUT_LLAMADA if queda is None else min(CHAT_TIMEOUT_LLAMADA, queda)
+
+
+async def _primera_respuesta(llamar, timeout, etapa, cobertura):
+    """Corre llamar(); si tarda más que el p95, corre una copia. Devuelve (resultado, ganó_la_copia)."""
+    inicio = time.monotonic()
+    original = asyncio.create_task(llamar())
+    intentos_llamadas.inc(etapa=etapa, tipo="original")
+    tareas = {original}
+    umbral = p95(etapa) if cobertura else None
+    try:
+        if umbral is not None and umbral < timeout:
+            listas, _ = await asyncio.wait(tareas, timeout=umbral)
+            if not listas:
+                print(f"🪂 Llamada de {etapa} pasó el p95 ({umbral:.1f}s): se lanza una copia.")
+                tareas.add(asyncio.create_task(llamar()))
+                intentos_llamadas.inc(etapa=etapa, tipo="cobertura")
+
+        error = None
+        while tareas:
+            queda = timeout - (time.monotonic() - inicio)
+            if queda <= 0:
+                break
+            listas, tareas = await asyncio.wait(tareas, timeout=queda, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in listas:
+                if tarea.exception() is None:
+                    _latencias[etapa].append(time.monotonic() - inicio)
+                    return tarea.result(), tarea is not original
+                # La copia rechazada por admisión no cuenta: se sigue esperando la original
+                if tarea is original or not isinstance(tarea.exception(), Saturado):
+                    error = error or tarea.exception()
+            if not listas:
+                break
+        if error is not None:
+            raise error
+        raise asyncio.TimeoutError(f"DeepSeek no respondió en {timeout:.1f}s")
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+
+async def llamar_con_plazo(llamar, etapa="chat", cobertura=True, reintentable=None):
+    """Ejecuta llamar() (una corutina nueva por intento) con timeout, reintentos y cobertura.
+
+    reintentable: función sin argumentos; si devuelve False no se reintenta
+    (por ejemplo, un stream que ya emitió tokens).
+    """
+    intento = 0
+    while True:
+        timeout = _timeout_llamada()
+        if timeout <= 0:
+            resultados_llamadas.inc(etapa=etapa, resultado="plazo_agotado")
+            raise PlazoAgotado(f"Se agotó el plazo antes de llamar a DeepSeek ({etapa}).")
+        try:
+            resultado, gano_copia = await _primera_respuesta(llamar, timeout, etapa, cobertura and CHAT_COBERTURA)
+        except Saturado:
+            raise
+        except Exception as e:
+            puede = reintentable is None or reintentable()
+            espera = CHAT_ESPERA_BASE * (2 ** intento) * (0.5 + random.random())
+            queda = restante()
+            if not es_transitorio(e) or intento >= CHAT_REINTENTOS or not puede or (queda is not None and queda <= espera):
+                motivo = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                resultados_llamadas.inc(etapa=etapa, resultado=motivo)
+                raise
+            intento += 1
+            intentos_llamadas.inc(etapa=etapa, tipo="reintento")
+            print(f"🔁 DeepSeek falló en {etapa} ({type(e).__name__}); reintento {intento} en {espera:.1f}s.")
+            await asyncio.sleep(espera)
+            continue
+
+        if gano_copia:
+            resultados_llamadas.inc(etapa=etapa, resultado="cobertura")
+        else:
+            resultados_llamadas.inc(etapa=etapa, resultado="reintentada" if intento else "ok")
+        return resultado, intento
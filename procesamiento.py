@@ -0,0 +1,102 @@
+import json
+
+import models
+# Al importarlo queda registrada la actualización de conteos_semanales en cada flush
+import estadisticas
+from consumo import registro_consumo
+from metricas import medir
+
+# ==========================================
+# PASOS COMPARTIDOS DEL PIPELINE
+# ==========================================
+# Los usan tanto los endpoints síncronos de main.py como los workers
+# de trabajos.py, para que el reporte se limpie y se guarde igual
+# venga de donde venga.
+
+def normalizar_reporte(reporte_json, motivo_error="Error de formato IA", diagnostico_error="La IA no devolvió un JSON válido."):
+    """Convierte la respuesta de la IA a diccionario si llegó como texto."""
+    if not isinstance(reporte_json, str):
+        return reporte_json
+
+    print("⚠️ Alerta: La IA devolvió texto. Convirtiendo a JSON...")
+    try:
+        # Limpieza de etiquetas markdown ```json
+        json_limpio = reporte_json.replace("```json", "").replace("```", "").strip()
+        return json.loads(json_limpio)
+    except Exception as e_json:
+        print(f"❌ Error fatal convirtiendo JSON: {e_json}")
+        # Diccionario de emergencia
+        return {
+            "motivo_consulta": motivo_error,
+            "diagnostico_tecnico": diagnostico_error,
+            "resumen_sesion": str(reporte_json),
+            "recomendaciones": [],
+            "oportunidades_omitidas": []
+        }
+
+
+def construir_reporte(reporte_json, hallazgos_por_defecto="Sin hallazgos."):
+    """Arma el objeto models.Reporte a partir del JSON de la IA."""
+    # Las listas van tal cual: las columnas son JSON nativas
+    return models.Reporte(
+        motivo_consulta=reporte_json.get("motivo_consulta"),
+        emocion_base=reporte_json.get("emocion_base"),
+        organo_afectado=reporte_json.get("organo_afectado"),
+        conflicto_biologico=reporte_json.get("conflicto_biologico"),
+        diagnostico_tecnico=reporte_json.get("diagnostico_tecnico"),
+        hallazgos_clinicos=reporte_json.get("hallazgos_clinicos", hallazgos_por_defecto),
+        oportunidades_omitidas=reporte_json.get("oportunidades_omitidas", []),
+        recomendaciones=reporte_json.get("recomendaciones", []),
+        resumen_sesion=reporte_json.get("resumen_sesion"),
+        modo_reporte=reporte_json.get("modo_reporte"),
+        degradado=reporte_json.get("degradado"),
+    )
+
+
+async def guardar_reporte(db, reporte_json, hallazgos_por_defecto="Sin hallazgos."):
+    """Guarda el reporte (AsyncSession) y agrega su ID al JSON. Devuelve el ID o None."""
+    try:
+        nuevo_reporte = construir_reporte(reporte_json, hallazgos_por_defecto)
+
+        # Sin refresh: el ID vuelve con el INSERT y la sesión no expira los objetos
+        with medir("db_commit"):
+            db.add(nuevo_reporte)
+            await db.commit()
+        print(f"✅ Reporte guardado con ID: {nuevo_reporte.id}")
+        registro_consumo.vincular_reporte(nuevo_reporte.id)
+
+        # Agregamos el ID al JSON de respuesta
+        reporte_json["id"] = nuevo_reporte.id
+        return nuevo_reporte.id
+
+    except Exception as e_db:
+        await db.rollback()
+        print(f"⚠️ Error guardando en DB: {e_db}")
+        # No detenemos el programa, el usuario recibirá su reporte igual
+        return None
+
+
+async def guardar_reportes_lote(db, reportes_json, hallazgos_por_defecto="Sin hallazgos.", ids_internos=None):
+    """Guarda varios reportes en una sola transacción. Devuelve la lista de IDs o None.
+
+    ids_internos: el ID interno con que se generó cada reporte, para vincular su consumo.
+    """
+    try:
+        nuevos = [construir_reporte(r, hallazgos_por_defecto) for r in reportes_json]
+        with medir("db_commit"):
+            # Un solo INSERT por lotes que devuelve todos los IDs
+            db.add_all(nuevos)
+            await db.commit()
+        ids = [r.id for r in nuevos]
+        print(f"✅ {len(ids)} reportes guardados en un solo commit.")
+        for reporte_id, clave in zip(ids, ids_internos or []):
+            registro_consumo.vincular_reporte(reporte_id, clave)
+
+        for reporte_json, reporte_id in zip(reportes_json, ids):
+            reporte_json["id"] = reporte_id
+        return ids
+
+    except Exception as e_db:
+        await db.rollback()
+        print(f"⚠️ Error guardando el lote en DB: {e_db}")
+        return None
@@ -0,0 +1,174 @@
+import os
+import re
+import time
+import asyncio
+import tempfile
+
+import audio
+from servicios_ia import transcribir_sesion_async
+
+# ==========================================
+# TRANSCRIPCIÓN SEGMENTADA EN PARALELO
+# ==========================================
+# Las sesiones de 50-90 minutos se cortan en los silencios en segmentos
+# que se solapan unos segundos. Los segmentos se transcriben en paralelo
+# (con límite), solo se reintentan los que fallan y el texto se vuelve a
+# unir en orden quitando lo repetido en los solapes.
+
+SEGMENTOS_DURACION = float(os.environ.get("SEGMENTOS_DURACION", "300"))
+SEGMENTOS_SOLAPE = float(os.environ.get("SEGMENTOS_SOLAPE", "3"))
+SEGMENTOS_PARALELO = int(os.environ.get("SEGMENTOS_PARALELO", "4"))
+SEGMENTOS_REINTENTOS = int(os.environ.get("SEGMENTOS_REINTENTOS", "2"))
+# En modo "auto" solo se segmentan audios más largos que esto
+SEGMENTOS_DESDE = float(os.environ.get("SEGMENTOS_DESDE", "600"))
+
+# Cuántas palabras del borde de cada segmento se comparan al unir
+VENTANA_SOLAPE_PALABRAS = 60
+MINIMO_PALABRAS_COINCIDENTES = 3
+
+
+def planificar_cortes(duracion, silencios, objetivo=SEGMENTOS_DURACION):
+    """Elige los puntos de corte: el centro de silencio más cercano a cada objetivo.
+
+    Si no hay silencio a menos de un tercio del objetivo, se corta en seco.
+    """
+    centros = [(inicio + fin) / 2 for inicio, fin in silencios]
+    tolerancia = objetivo / 3
+    cortes = []
+    anterior = 0.0
+    while duracion - anterior > objetivo + tolerancia:
+        meta = anterior + objetivo
+        candidatos = [c for c in centros if abs(c - meta) <= tolerancia and c > anterior + tolerancia]
+        corte = min(candidatos, key=lambda c: abs(c - meta)) if candidatos else meta
+        cortes.append(corte)
+        anterior = corte
+    return cortes
+
+
+def segmentos_desde_cortes(duracion, cortes, solape=SEGMENTOS_SOLAPE):
+    """Convierte cortes en tramos (inicio, fin) que se solapan 'solape' segundos."""
+    limites = [0.0] + cortes + [duracion]
+    return [
+        (max(0.0, limites[i] - solape), min(duracion, limites[i + 1] + solape))
+        for i in range(len(limites) - 1)
+    ]
+
+
+def _normalizar_palabra(palabra):
+    return re.sub(r"[^\w]", "", palabra.lower())
+
+
+def unir_textos(anterior, siguiente):
+    """Une dos transcripciones contiguas quitando el texto repetido del solape.
+
+    Busca el bloque de palabras más largo que aparece al final de 'anterior'
+    y al principio de 'siguiente'; se queda con 'anterior' hasta el fin del
+    bloque y con 'siguiente' desde ahí. Los bordes del solape suelen venir
+    cortados a media palabra, por eso no se exige que el bloque toque el borde.
+    """
+    palabras_a = anterior.split()
+    palabras_b = siguiente.split()
+    if not palabras_a or not palabras_b:
+        return " ".join(palabras_a + palabras_b)
+
+    desde_a = max(0, len(palabras_a) - VENTANA_SOLAPE_PALABRAS)
+    cola = [_normalizar_palabra(p) for p in palabras_a[desde_a:]]
+    cabeza = [_normalizar_palabra(p) for p in palabras_b[:VENTANA_SOLAPE_PALABRAS]]
+
+    # Substring común más largo (programación dinámica sobre palabras)
+    mejor, fin_a, fin_b = 0, 0, 0
+    previa = [0] * (len(cabeza) + 1)
+    for i in range(1, len(cola) + 1):
+        actual = [0] * (len(cabeza) + 1)
+        for j in range(1, len(cabeza) + 1):
+            if cola[i - 1] and cola[i - 1] == cabeza[j - 1]:
+                actual[j] = previa[j - 1] + 1
+                if actual[j] > mejor:
+                    mejor, fin_a, fin_b = actual[j], i, j
+        previa = actual
+
+    if mejor < MINIMO_PALABRAS_COINCIDENTES:
+        return " ".join(palabras_a + palabras_b)
+    return " ".join(palabras_a[:desde_a + fin_a] + palabras_b[fin_b:])
+
+
+async def _reunir(corutinas):
+    """Como asyncio.gather, pero si una falla cancela las demás y espera a que terminen.
+
+    Si no, los segmentos hermanos seguirían ocupando Whisper (y leyendo
+    archivos ya borrados) para una petición que ya respondió con error.
+    """
+    tareas = [asyncio.ensure_future(c) for c in corutinas]
+    try:
+        return await asyncio.gather(*tareas)
+    except BaseException:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        raise
+
+
+async def _transcribir_segmento(indice, ruta, duracion, limite, tiempos):
+    async with limite:
+        inicio = time.perf_counter()
+        texto = await transcribir_sesion_async(ruta, duracion)
+        tiempos[indice] = round(time.perf_counter() - inicio, 3)
+        return texto
+
+
+async def transcribir_segmentado(ruta_audio, duracion=None):
+    """Transcribe un audio largo por segmentos. Devuelve (texto, metadatos).
+
+    'texto' es None si algún segmento sigue fallando tras los reintentos.
+    """
+    inicio_total = time.perf_counter()
+    if duracion is None:
+        duracion = await audio.medir_duracion(ruta_audio)
+
+    silencios = await audio.detectar_silencios(ruta_audio)
+    tramos = segmentos_desde_cortes(duracion, planificar_cortes(duracion, silencios))
+    print(f"✂️ Audio de {duracion / 60:.1f} min dividido en {len(tramos)} segmentos.")
+
+    with tempfile.TemporaryDirectory(prefix="segmentos_") as carpeta:
+        rutas = await _reunir([
+            audio.recortar(ruta_audio, inicio, fin, os.path.join(carpeta, f"segmento_{i:03d}.flac"))
+            for i, (inicio, fin) in enumerate(tramos)
+        ])
+
+        limite = asyncio.Semaphore(SEGMENTOS_PARALELO)
+        textos = [None] * len(rutas)
+        tiempos = [None] * len(rutas)
+        reintentos = 0
+        pendientes = list(range(len(rutas)))
+
+        for intento in range(SEGMENTOS_REINTENTOS + 1):
+            if intento:
+                reintentos += len(pendientes)
+                print(f"🔁 Reintentando {len(pendientes)} segmento(s) (intento {intento})...")
+            resultados = await _reunir([
+                _transcribir_segmento(i, rutas[i], tramos[i][1] - tramos[i][0], limite, tiempos) for i in pendientes
+            ])
+            for i, texto in zip(pendientes, resultados):
+                textos[i] = texto
+            pendientes = [i for i in pendientes if not textos[i]]
+            if not pendientes:
+                break
+
+    metadatos = {
+        "modo": "segmentada",
+        "segmentos": len(tramos),
+        "tramos": [[round(inicio, 2), round(fin, 2)] for inicio, fin in tramos],
+        "tiempos_segmento": tiempos,
+        "reintentos": reintentos,
+        "segmentos_fallidos": pendientes,
+        "tiempo_total": round(time.perf_counter() - inicio_total, 3),
+    }
+    if pendientes:
+        print(f"❌ {len(pendientes)} segmento(s) sin transcribir tras los reintentos.")
+        return None, metadatos
+
+    texto_final = textos[0]
+    for texto in textos[1:]:
+        texto_final = unir_textos(texto_final, texto)
+    print(f"✅ Transcripción segmentada completada en {metadatos['tiempo_total']} s.")
+    return texto_final, metadatos
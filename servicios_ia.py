@@ -1,37 +1,261 @@
 import os
 import json
 import re
-import replicate
-from openai import OpenAI
+import time
+import asyncio
+import contextvars
+import httpx
+
+from eventos import emitir, hay_oyente
+from metricas import medir, observar_etapa
+from admision import (
+    limitador_chat, limitador_transcripcion, segundos_de_audio, Saturado, ADMISION_TOKENS_RESPUESTA,
+    correr_sincrono,
+)
+from consumo import registro_consumo, tokens_en_cache
+from plazos import llamar_con_plazo, plazo, restante, repartir, REPORTE_PLAZO, PLAN_PLAZO
 
 # 1. Configuración de Clientes
 # Asegúrate de tener las API KEYS en tu archivo .env
-client = OpenAI(
-    api_key=os.environ.get("DEEPSEEK_API_KEY"), 
-    base_url="https://api.deepseek.com" 
-)
+# Los clientes son asíncronos y comparten un pool de conexiones HTTP,
+# así una llamada lenta a DeepSeek no congela el worker de uvicorn.
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+HTTP_MAX_CONEXIONES = int(os.environ.get("HTTP_MAX_CONEXIONES", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "600"))
+
+MODELO_CHAT = "deepseek-chat"
+
+# Versión de los prompts del reporte clínico. Súbela al cambiar cualquier
+# prompt de generar_reporte_clinico para que el cache no sirva reportes viejos.
+PROMPT_VERSION_REPORTE = "eclectico-v2"
+TEMPERATURAS_REPORTE = {"fase_1": 0.0, "fase_2": 0.4, "fase_3": 0.1, "rapido": 0.3}
+# "completo" (3 fases) o "rapido" (una llamada); cada petición puede elegir
+MODO_REPORTE_POR_DEFECTO = os.environ.get("MODO_REPORTE", "completo")
+
+# Fase 1 por ventanas: tamaño de cada ventana y cuántas se extraen a la vez
+FASE1_TOKENS_POR_VENTANA = int(os.environ.get("FASE1_TOKENS_POR_VENTANA", "3000"))
+FASE1_SOLAPE_CARACTERES = int(os.environ.get("FASE1_SOLAPE_CARACTERES", "300"))
+FASE1_PARALELO = int(os.environ.get("FASE1_PARALELO", "6"))
+
+_clientes = {"loop": None, "deepseek": None, "replicate": None, "whisper": None}
+
+
+def _clientes_async():
+    """Devuelve (deepseek, replicate) compartidos por el event loop actual.
+
+    Se crean en el primer uso. Los pools de httpx quedan atados al loop que
+    los creó; si cambia el loop (por ejemplo al usar los envoltorios
+    síncronos) se crean de nuevo.
+    """
+    loop = asyncio.get_running_loop()
+    if _clientes["loop"] is not loop:
+        # Import perezoso: openai y replicate tardan ~0.5 s en cargar y el
+        # arranque del servidor no los necesita
+        import replicate
+        from openai import AsyncOpenAI
+
+        limites = httpx.Limits(
+            max_connections=HTTP_MAX_CONEXIONES,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        )
+        _clientes["deepseek"] = AsyncOpenAI(
+            api_key=os.environ.get("DEEPSEEK_API_KEY"),
+            base_url=DEEPSEEK_BASE_URL,
+            http_client=httpx.AsyncClient(limits=limites, timeout=HTTP_TIMEOUT),
+            # Los reintentos los maneja plazos.py, que conoce el plazo de la petición
+            max_retries=0,
+        )
+        _clientes["replicate"] = replicate.Client(
+            api_token=os.environ.get("REPLICATE_API_TOKEN"),
+            transport=httpx.AsyncHTTPTransport(limits=limites),
+        )
+        _clientes["whisper"] = None
+        _clientes["loop"] = loop
+    return _clientes["deepseek"], _clientes["replicate"]
+
+
+# Acumulador de la etapa del reporte en curso (ver generar_reporte_con_etapas)
+_uso_etapa = contextvars.ContextVar("uso_etapa", default=None)
+
+
+def _marcar_error_etapa(error):
+    """Las etapas atrapan sus errores para seguir; así quedan contados igual."""
+    uso = _uso_etapa.get()
+    if uso is not None:
+        uso["error"] = str(error)
+
+
+def _tokens_a_reservar(mensajes):
+    return sum(estimar_tokens(m["content"]) for m in mensajes) + ADMISION_TOKENS_RESPUESTA
+
+
+def _registrar_uso(usage, reintentos):
+    uso = _uso_etapa.get()
+    if uso is not None:
+        uso["llamadas"] += 1
+        uso["reintentos"] += reintentos
+        if usage:
+            uso["prompt_tokens"] += usage.prompt_tokens or 0
+            uso["completion_tokens"] += usage.completion_tokens or 0
+            uso["cached_tokens"] += tokens_en_cache(usage)
+
+
+def _nombre_etapa(etapa=None):
+    uso = _uso_etapa.get()
+    return etapa or (uso["etapa"] if uso is not None else "chat")
+
+
+async def _llamar_registrando(llamar, etapa, **opciones):
+    """llamar_con_plazo + una fila en el registro de consumo (ver consumo.py).
+
+    llamar() devuelve (resultado, usage). Devuelve el resultado.
+    """
+    inicio = time.perf_counter()
+    try:
+        (resultado, usage), reintentos = await llamar_con_plazo(llamar, etapa, **opciones)
+    except Exception:
+        registro_consumo.anotar(etapa, MODELO_CHAT, None, time.perf_counter() - inicio, resultado="error")
+        raise
+    registro_consumo.anotar(etapa, MODELO_CHAT, usage, time.perf_counter() - inicio, intentos=reintentos + 1)
+    _registrar_uso(usage, reintentos)
+    return resultado
+
+
+async def _chat(mensajes, temperatura, etapa=None, **kwargs):
+    """Una llamada a DeepSeek (con plazo y reintentos); devuelve el texto de la respuesta.
+
+    etapa: nombre para métricas y consumo (por defecto, la etapa del reporte en curso o "chat").
+    """
+    deepseek, _ = _clientes_async()
+
+    async def llamar():
+        async with limitador_chat.reservar(_tokens_a_reservar(mensajes)) as reserva:
+            response = await deepseek.chat.completions.create(
+                model=MODELO_CHAT,
+                messages=mensajes,
+                temperature=temperatura,
+                **kwargs
+            )
+            if response.usage:
+                reserva.ajustar(response.usage.total_tokens or 0)
+            return response, response.usage
+
+    response = await _llamar_registrando(llamar, _nombre_etapa(etapa))
+    return response.choices[0].message.content
+
+
+async def _chat_stream(mensajes, temperatura, etapa=None, **kwargs):
+    """Como _chat, pero emite cada fragmento como evento 'token' mientras llega.
+
+    Sin copias de cobertura (duplicarían los tokens) y solo se reintenta si
+    todavía no salió ningún token.
+    """
+    deepseek, _ = _clientes_async()
+    emitidos = [False]
+
+    async def llamar():
+        async with limitador_chat.reservar(_tokens_a_reservar(mensajes)) as reserva:
+            stream = await deepseek.chat.completions.create(
+                model=MODELO_CHAT,
+                messages=mensajes,
+                temperature=temperatura,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            partes = []
+            usage = None
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    fragmento = chunk.choices[0].delta.content
+                    partes.append(fragmento)
+                    emitidos[0] = True
+                    emitir("token", texto=fragmento)
+            if usage:
+                reserva.ajustar(usage.total_tokens or 0)
+            return "".join(partes), usage
+
+    return await _llamar_registrando(
+        llamar, _nombre_etapa(etapa), cobertura=False, reintentable=lambda: not emitidos[0]
+    )
 
 # 2. FUNCIÓN PARA ESCUCHAR (Recuperada)
 # En servicios_ia.py
 
-def transcribir_sesion(ruta_audio):
+# ID ACTUALIZADO Y VERIFICADO (Whisper Large v3)
+# Este es el ID correcto para el modelo oficial de OpenAI en Replicate
+WHISPER_VERSION = "openai/whisper:e39e354773466b955265e969568deb7da217804d8e771ea8c9cd0cef6591f8bc"
+PARAMETROS_WHISPER = {
+    "model": "large-v2",
+    "language": "es",
+    "translate": False,
+    "temperature": 0,
+    "transcription": "plain text"
+}
+
+
+def firma_transcripcion():
+    """Todo lo que, además del audio, cambia el resultado de transcribir_sesion."""
+    return {"version": WHISPER_VERSION, **PARAMETROS_WHISPER}
+
+
+async def _version_whisper(cliente_replicate):
+    """El objeto Version de WHISPER_VERSION, pedido una sola vez por cliente.
+
+    Con el string "dueño/modelo:id" replicate vuelve a consultar la versión
+    en cada async_run; con el objeto ya resuelto cada transcripción es una
+    sola llamada al modelo.
+    """
+    if _clientes["whisper"] is None:
+        from replicate.version import Versions
+
+        modelo, version_id = WHISPER_VERSION.split(":")
+        dueno, nombre = modelo.split("/")
+        try:
+            _clientes["whisper"] = await Versions(cliente_replicate, model=(dueno, nombre)).async_get(version_id)
+        except Exception as e:
+            print(f"⚠️ No se pudo resolver la versión de Whisper: {e}")
+            return WHISPER_VERSION
+    return _clientes["whisper"]
+
+
+async def transcribir_sesion_async(audio, duracion=None):
+    """Transcribe un archivo abierto (o una ruta) con Whisper en Replicate.
+
+    'duracion' (segundos) es lo que se descuenta del presupuesto de
+    transcripción; si no se conoce se estima por el tamaño.
+    """
+    # La espera de admisión no cuenta como latencia de la transcripción
+    async with limitador_transcripcion.reservar(segundos_de_audio(audio, duracion)):
+        with medir("transcripcion") as medicion:
+            texto = await _transcribir_replicate(audio)
+            if texto is None:
+                medicion.fallo()
+            return texto
+
+
+async def _transcribir_replicate(audio):
     print(f"🎧 Transcribiendo audio con Replicate (Whisper Large-v3)...")
     try:
-        # ID ACTUALIZADO Y VERIFICADO (Whisper Large v3)
-        # Este es el ID correcto para el modelo oficial de OpenAI en Replicate
-        model_version = "openai/whisper:e39e354773466b955265e969568deb7da217804d8e771ea8c9cd0cef6591f8bc"
-        
-        output = replicate.run(
-            model_version,
-            input={
-                "audio": open(ruta_audio, "rb"),
-                "model": "large-v2",
-                "language": "es",
-                "translate": False,
-                "temperature": 0,
-                "transcription": "plain text"
-            }
-        )
+        _, cliente_replicate = _clientes_async()
+        version = await _version_whisper(cliente_replicate)
+        if isinstance(audio, (str, os.PathLike)):
+            with open(audio, "rb") as archivo:
+                output = await cliente_replicate.async_run(
+                    version,
+                    input={"audio": archivo, **PARAMETROS_WHISPER},
+                    use_file_output=False,
+                )
+        else:
+            audio.seek(0)
+            output = await cliente_replicate.async_run(
+                version,
+                input={"audio": audio, **PARAMETROS_WHISPER},
+                use_file_output=False,
+            )
         
         # Procesar respuesta
         texto_final = ""
@@ -47,13 +271,22 @@ def transcribir_sesion(ruta_audio):
         print(f"❌ Error crítico en Whisper: {e}")
         return None
 
-# 3. FUNCIÓN PARA PENSAR (Supervisor Ecléctico)
-def generar_reporte_clinico(texto_transcrito):
-    print("🧠 Iniciando SUPERVISOR CLÍNICO (Enfoque Ecléctico)...")
-    
-    # --- FASE 1: EXTRACCIÓN ---
-    print("🔍 Fase 1: Recopilando evidencia...")
-    prompt_extraccion = """
+def firma_reporte(modo=None):
+    """Todo lo que, además del texto, cambia el resultado de generar_reporte_clinico."""
+    return {
+        "modo": modo or MODO_REPORTE_POR_DEFECTO,
+        "prompt_version": PROMPT_VERSION_REPORTE,
+        "modelo": MODELO_CHAT,
+        "temperaturas": TEMPERATURAS_REPORTE,
+        "tokens_por_ventana_fase_1": FASE1_TOKENS_POR_VENTANA,
+    }
+
+
+# --- FASE 1 POR VENTANAS ---
+# Antes se mandaban solo los primeros 6000 caracteres (~10 minutos de sesión).
+# Ahora la transcripción completa se parte en ventanas con presupuesto de
+# tokens, se extrae cada una en paralelo y se fusionan las listas.
+PROMPT_EXTRACCION = """
     Actúa como un Secretario Clínico. Extrae datos crudos en JSON:
     {
       "paciente": {
@@ -68,24 +301,110 @@ def generar_reporte_clinico(texto_transcrito):
     }
     Transcripción:
     """
-    try:
-        response1 = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "Eres un extractor de datos objetivo."},
-                {"role": "user", "content": prompt_extraccion + texto_transcrito[:6000]}
-            ],
-            temperature=0.0,
-        )
-        datos_fase_1 = _limpiar_y_parsear_json(response1.choices[0].message.content)
-        print("✅ Fase 1 Completada.")
-    except Exception as e:
-        print(f"❌ Error Fase 1: {e}")
-        datos_fase_1 = {}
 
-    # --- FASE 2: ANÁLISIS DEL SUPERVISOR ---
-    print("❤️ Fase 2: Análisis del Consultor Ecléctico...")
-    prompt_analisis = """
+def estimar_tokens(texto):
+    # Aproximación para español: ~4 caracteres por token
+    return (len(texto) + 3) // 4
+
+
+def dividir_en_ventanas(texto, max_tokens=None, solape_caracteres=None):
+    """Parte el texto en ventanas de hasta max_tokens, cortando en fin de frase.
+
+    Cada ventana repite el final de la anterior (solape) para no partir
+    una cita a la mitad; los duplicados se quitan al fusionar.
+    """
+    max_tokens = max_tokens or FASE1_TOKENS_POR_VENTANA
+    solape_caracteres = FASE1_SOLAPE_CARACTERES if solape_caracteres is None else solape_caracteres
+    max_caracteres = max_tokens * 4
+    if len(texto) <= max_caracteres:
+        return [texto]
+
+    ventanas = []
+    inicio = 0
+    while inicio < len(texto):
+        fin = min(len(texto), inicio + max_caracteres)
+        if fin < len(texto):
+            # Retrocedemos hasta el último fin de frase dentro de la ventana
+            corte = max(texto.rfind(signo, inicio, fin) for signo in (". ", "? ", "! ", "\n"))
+            if corte > inicio + max_caracteres // 2:
+                fin = corte + 1
+        ventanas.append(texto[inicio:fin].strip())
+        if fin >= len(texto):
+            break
+        inicio = max(fin - solape_caracteres, inicio + 1)
+    return ventanas
+
+
+async def _extraer_ventana(ventana):
+    async with _limite_fase_1():
+        try:
+            respuesta = await _chat(
+                [
+                    {"role": "system", "content": "Eres un extractor de datos objetivo."},
+                    {"role": "user", "content": PROMPT_EXTRACCION + ventana}
+                ],
+                temperatura=TEMPERATURAS_REPORTE["fase_1"],
+            )
+            return _limpiar_y_parsear_json(respuesta)
+        except Saturado:
+            # Sin capacidad: que llegue al endpoint como 429, no como reporte a medias
+            raise
+        except Exception as e:
+            print(f"❌ Error Fase 1 (ventana): {e}")
+            return {}
+
+
+def _clave_dedup(valor):
+    if isinstance(valor, str):
+        return " ".join(re.sub(r"[^\w\s]", "", valor.lower()).split())
+    return json.dumps(valor, sort_keys=True, ensure_ascii=False)
+
+
+def fusionar_extracciones(extracciones):
+    """Une los JSON de Fase 1: listas concatenadas sin duplicados, dicts recursivos."""
+    if not extracciones:
+        return {}
+    resultado = {}
+    for extraccion in extracciones:
+        if not isinstance(extraccion, dict):
+            continue
+        for clave, valor in extraccion.items():
+            previo = resultado.get(clave)
+            if isinstance(valor, dict):
+                resultado[clave] = fusionar_extracciones([previo or {}, valor])
+            elif isinstance(valor, list):
+                lista = list(previo) if isinstance(previo, list) else []
+                vistos = {_clave_dedup(v) for v in lista}
+                for elemento in valor:
+                    clave_elemento = _clave_dedup(elemento)
+                    if clave_elemento and clave_elemento not in vistos:
+                        vistos.add(clave_elemento)
+                        lista.append(elemento)
+                resultado[clave] = lista
+            elif previo in (None, ""):
+                resultado[clave] = valor
+    return resultado
+
+
+_semaforos_fase_1 = {}
+
+
+def _limite_fase_1():
+    # Un semáforo por event loop, igual que los clientes HTTP
+    loop = asyncio.get_running_loop()
+    if loop not in _semaforos_fase_1:
+        _semaforos_fase_1.clear()
+        _semaforos_fase_1[loop] = asyncio.Semaphore(FASE1_PARALELO)
+    return _semaforos_fase_1[loop]
+
+
+# 3. FUNCIÓN PARA PENSAR (Supervisor Ecléctico)
+# El reporte es una lista de etapas que comparten un diccionario de contexto.
+#   "completo": Fase 1 (extracción) -> Fase 2 (supervisor) -> Fase 3 (JSON)
+#   "rapido":   una sola llamada que devuelve directamente el JSON del Reporte
+# Cada etapa registra su latencia, llamadas y tokens.
+
+PROMPT_ANALISIS = """
     # IDENTIDAD: Consultor Clínico Ecléctico. Cliente: TERAPEUTA.
     
     ## OBJETIVOS:
@@ -115,24 +434,8 @@ def generar_reporte_clinico(texto_transcrito):
     ---
     DATOS: {datos}
     """
-    try:
-        response2 = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "Eres un Supervisor Clínico Senior."},
-                {"role": "user", "content": prompt_analisis.format(datos=json.dumps(datos_fase_1))}
-            ],
-            temperature=0.4, 
-        )
-        analisis_texto_fase_2 = response2.choices[0].message.content
-        print("✅ Fase 2 Completada.")
-    except Exception as e:
-        print(f"❌ Error Fase 2: {e}")
-        analisis_texto_fase_2 = "Error en análisis."
 
-    # --- FASE 3: MAPEO A JSON ---
-    print("📊 Fase 3: Formateando para la App...")
-    prompt_final = """
+PROMPT_FINAL = """
     Vuelca el INFORME (Fase 2) en este JSON estricto:
     {{
       "motivo_consulta": "Pon el Tema Central",
@@ -147,25 +450,183 @@ def generar_reporte_clinico(texto_transcrito):
     }}
     INFORME: {analisis}
     """
+
+PROMPT_RAPIDO = """
+    # IDENTIDAD: Consultor Clínico Ecléctico. Cliente: TERAPEUTA.
+    Lee la transcripción de la sesión y, en un solo paso:
+    1. SINTETIZA el núcleo del caso (tema central, creencias nucleares,
+       conexión simbólica del síntoma, origen sistémico/familiar).
+    2. EVALÚA la intervención del terapeuta (puntos fuertes y puntos ciegos).
+    3. PROPÓN líneas de acción (emocional, narrativa, tarea psicomágica).
+
+    Devuelve SOLO este JSON estricto:
+    {{
+      "motivo_consulta": "Tema Central",
+      "emocion_base": "Emoción predominante",
+      "organo_afectado": "Conexión Simbólica",
+      "conflicto_biologico": "Creencias Nucleares",
+      "hallazgos_clinicos": "Síntesis Diagnóstica completa",
+      "diagnostico_tecnico": "Insight teórico breve",
+      "oportunidades_omitidas": ["Puntos ciegos y temas no seguidos"],
+      "recomendaciones": ["Líneas de acción concretas"],
+      "resumen_sesion": "Resumen breve"
+    }}
+    TRANSCRIPCIÓN:
+    {texto}
+    """
+
+
+async def _etapa_fase_1(contexto):
+    # --- FASE 1: EXTRACCIÓN (map-reduce sobre toda la transcripción) ---
+    print("🔍 Fase 1: Recopilando evidencia...")
+    ventanas = dividir_en_ventanas(contexto["texto"])
+    extracciones = await asyncio.gather(*[_extraer_ventana(v) for v in ventanas])
+    contexto["datos_fase_1"] = fusionar_extracciones([e for e in extracciones if e])
+    if contexto["datos_fase_1"]:
+        print(f"✅ Fase 1 Completada ({len(ventanas)} ventana(s)).")
+    else:
+        print("❌ Error Fase 1: ninguna ventana devolvió datos.")
+        _marcar_error_etapa("Ninguna ventana devolvió datos.")
+
+
+async def _etapa_fase_2(contexto):
+    # --- FASE 2: ANÁLISIS DEL SUPERVISOR ---
+    print("❤️ Fase 2: Análisis del Consultor Ecléctico...")
+    # Si hay un cliente escuchando por SSE, el texto del supervisor sale token a token
+    llamar = _chat_stream if hay_oyente() else _chat
+    try:
+        contexto["analisis"] = await llamar(
+            [
+                {"role": "system", "content": "Eres un Supervisor Clínico Senior."},
+                {"role": "user", "content": PROMPT_ANALISIS.format(datos=json.dumps(contexto.get("datos_fase_1", {})))}
+            ],
+            temperatura=TEMPERATURAS_REPORTE["fase_2"],
+        )
+        print("✅ Fase 2 Completada.")
+    except Saturado:
+        raise
+    except Exception as e:
+        print(f"❌ Error Fase 2: {e}")
+        _marcar_error_etapa(e)
+        # Sin análisis la Fase 3 arma el reporte directo de la transcripción
+        contexto["analisis"] = None
+
+
+async def _etapa_fase_3(contexto):
+    # --- FASE 3: MAPEO A JSON ---
+    if contexto.get("analisis") is None:
+        print("⚠️ Fase 3 sin análisis del supervisor: se genera el reporte en modo rápido.")
+        uso = _uso_etapa.get()
+        if uso is not None:
+            uso["degradado"] = "rapido"
+        await _etapa_rapida(contexto)
+        return
+    print("📊 Fase 3: Formateando para la App...")
     try:
-        response3 = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
+        respuesta3 = await _chat(
+            [
                 {"role": "system", "content": "Eres un generador JSON."},
-                {"role": "user", "content": prompt_final.format(analisis=analisis_texto_fase_2)}
+                {"role": "user", "content": PROMPT_FINAL.format(analisis=contexto.get("analisis", ""))}
             ],
-            temperature=0.1,
+            temperatura=TEMPERATURAS_REPORTE["fase_3"],
             response_format={ "type": "json_object" }
         )
-        json_final = _limpiar_y_parsear_json(response3.choices[0].message.content)
+        contexto["reporte"] = _limpiar_y_parsear_json(respuesta3)
         print("✅ Reporte Listo.")
-        return json_final
+    except Saturado:
+        raise
     except Exception as e:
         print(f"❌ Error Fase 3: {e}")
-        return {"error": str(e)}
+        _marcar_error_etapa(e)
+        contexto["reporte"] = {"error": str(e)}
 
 
-def generar_plan_asistente_mentor(datos_terapeuta):
+async def _etapa_rapida(contexto):
+    # --- MODO RÁPIDO: transcripción -> JSON del Reporte en una llamada ---
+    print("⚡ Reporte rápido (una sola llamada)...")
+    try:
+        respuesta = await _chat(
+            [
+                {"role": "system", "content": "Eres un Supervisor Clínico Senior que responde solo en JSON."},
+                {"role": "user", "content": PROMPT_RAPIDO.format(texto=contexto["texto"])}
+            ],
+            temperatura=TEMPERATURAS_REPORTE["rapido"],
+            response_format={"type": "json_object"}
+        )
+        contexto["reporte"] = _limpiar_y_parsear_json(respuesta)
+        print("✅ Reporte Listo.")
+    except Saturado:
+        raise
+    except Exception as e:
+        print(f"❌ Error reporte rápido: {e}")
+        _marcar_error_etapa(e)
+        contexto["reporte"] = {"error": str(e)}
+
+
+PIPELINES_REPORTE = {
+    "completo": [("fase_1", _etapa_fase_1), ("fase_2", _etapa_fase_2), ("fase_3", _etapa_fase_3)],
+    "rapido": [("rapido", _etapa_rapida)],
+}
+
+
+async def generar_reporte_con_etapas(texto_transcrito, modo=None):
+    """Ejecuta el pipeline del modo pedido. Devuelve (reporte, etapas).
+
+    'etapas' es una lista con la latencia, las llamadas y los tokens de cada etapa
+    (y 'error' si la etapa falló).
+    """
+    modo = modo or MODO_REPORTE_POR_DEFECTO
+    if modo not in PIPELINES_REPORTE:
+        raise ValueError(f"Modo de reporte desconocido: {modo}")
+    print(f"🧠 Iniciando SUPERVISOR CLÍNICO (Enfoque Ecléctico, modo {modo})...")
+
+    contexto = {"texto": texto_transcrito}
+    etapas = []
+    pipeline = PIPELINES_REPORTE[modo]
+    nombres = [nombre for nombre, _ in pipeline]
+    # Si quien llama ya tiene un plazo más corto, manda ese
+    queda = restante()
+    fin_reporte = time.monotonic() + (REPORTE_PLAZO if queda is None else min(queda, REPORTE_PLAZO))
+    for indice, (nombre, ejecutar) in enumerate(pipeline):
+        uso = {
+            "etapa": nombre, "segundos": 0.0, "llamadas": 0, "reintentos": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+        }
+        marca = _uso_etapa.set(uso)
+        emitir("etapa", etapa=nombre, estado="inicio")
+        inicio = time.perf_counter()
+        try:
+            # Lo que una etapa no usa de su parte queda para las siguientes
+            with plazo(repartir(nombres, indice, fin_reporte - time.monotonic())):
+                await ejecutar(contexto)
+        except Exception as e:
+            uso["error"] = str(e)
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            uso["segundos"] = round(segundos, 3)
+            _uso_etapa.reset(marca)
+            observar_etapa(f"reporte_{nombre}", segundos, error="error" in uso)
+        emitir("etapa", estado="fin", **uso)
+        etapas.append(uso)
+
+    return contexto.get("reporte", {}), etapas
+
+
+async def generar_reporte_clinico_async(texto_transcrito, modo=None):
+    reporte, _ = await generar_reporte_con_etapas(texto_transcrito, modo)
+    return reporte
+
+
+async def generar_plan_asistente_mentor_async(datos_terapeuta):
+    with medir("plan_asistente") as medicion, plazo(PLAN_PLAZO):
+        plan = await _generar_plan(datos_terapeuta)
+        if not plan or plan.get("error"):
+            medicion.fallo()
+        return plan
+
+
+async def _generar_plan(datos_terapeuta):
     print("🧭 Generando plan de Asistente + Mentor para terapeuta...")
     prompt = """
     Diseña un plan accionable para un asistente de IA para terapeutas.
@@ -181,39 +642,38 @@ def generar_plan_asistente_mentor(datos_terapeuta):
     - Entrega respuestas concretas y accionables.
 
     Devuelve SOLO JSON con esta estructura:
-    {
+    {{
       "vision_producto": "string",
       "modulos_priorizados": [
-        {
+        {{
           "nombre": "string",
           "problema_que_resuelve": "string",
           "mvp_en_2_semanas": ["string"],
           "kpi": "string"
-        }
+        }}
       ],
       "flujo_terapeuta_asistente": ["string"],
-      "protocolo_mentor": {
+      "protocolo_mentor": {{
         "antes_sesion": ["string"],
         "durante_sesion": ["string"],
         "despues_sesion": ["string"]
-      },
-      "motor_contenido": {
+      }},
+      "motor_contenido": {{
         "pilares": ["string"],
         "cadencia_semanal": ["string"],
         "ideas_iniciales": ["string"]
-      },
+      }},
       "riesgos_y_mitigaciones": ["string"],
       "primeros_30_dias": ["string"]
-    }
+    }}
 
     CONTEXTO TERAPEUTA:
     {datos}
     """
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
+        respuesta = await _chat(
+            [
                 {
                     "role": "system",
                     "content": "Eres un arquitecto de producto para asistentes clínicos con foco ético.",
@@ -223,14 +683,31 @@ def generar_plan_asistente_mentor(datos_terapeuta):
                     "content": prompt.format(datos=json.dumps(datos_terapeuta, ensure_ascii=False)),
                 },
             ],
-            temperature=0.3,
+            temperatura=0.3,
+            etapa="plan",
             response_format={"type": "json_object"},
         )
-        return _limpiar_y_parsear_json(response.choices[0].message.content)
+        return _limpiar_y_parsear_json(respuesta)
+    except Saturado:
+        raise
     except Exception as e:
         print(f"❌ Error generando plan asistente-mentor: {e}")
         return {"error": str(e)}
 
+# Envoltorios síncronos para scripts y consola; los endpoints usan las versiones async.
+# Comparten un loop (ver admision.py) para que el control de admisión valga entre llamadas.
+def transcribir_sesion(audio):
+    return correr_sincrono(transcribir_sesion_async(audio))
+
+
+def generar_reporte_clinico(texto_transcrito, modo=None):
+    return correr_sincrono(generar_reporte_clinico_async(texto_transcrito, modo))
+
+
+def generar_plan_asistente_mentor(datos_terapeuta):
+    return correr_sincrono(generar_plan_asistente_mentor_async(datos_terapeuta))
+
+
 def _limpiar_y_parsear_json(texto):
     try:
         texto = re.sub(r'```json\s*|\s*```', '', texto).strip()
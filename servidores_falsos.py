@@ -0,0 +1,246 @@
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import argparse
+import threading
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# ==========================================
+# SERVIDORES FALSOS DE DEEPSEEK Y REPLICATE
+# ==========================================
+# Imitan lo justo de la API de chat compatible con OpenAI y de la API de
+# predicciones de Replicate para correr el servicio sin salir a internet.
+# Cada respuesta tarda 'latencia' ± 'jitter' segundos y falla con un 500
+# con probabilidad 'tasa_error'. Los usa benchmark.py; también se pueden
+# levantar a mano:  python servidores_falsos.py --latencia 0.5
+
+REPORTE_FALSO = {
+    "motivo_consulta": "Ansiedad ante cambios laborales",
+    "emocion_base": "Miedo",
+    "organo_afectado": "Estómago: lo que no se digiere",
+    "conflicto_biologico": "No soy suficiente",
+    "hallazgos_clinicos": "Patrón de autoexigencia heredado de la línea paterna.",
+    "diagnostico_tecnico": "Esquema de defectuosidad con somatización digestiva.",
+    "oportunidades_omitidas": ["No se exploró la mención al padre."],
+    "recomendaciones": ["Trabajar la carta al padre.", "Registro de sensaciones."],
+    "resumen_sesion": "Sesión centrada en la presión laboral y su eco familiar.",
+}
+
+EXTRACCION_FALSA = {
+    "paciente": {
+        "frases_creencias": ["Nunca es suficiente"],
+        "metaforas_fisicas": ["Un nudo en el estómago"],
+        "historia_familiar": ["Mi padre era igual"],
+    },
+    "terapeuta": {
+        "mejores_preguntas": ["¿Desde cuándo lo sientes así?"],
+        "momentos_ignorados": ["La mención al padre"],
+    },
+}
+
+ANALISIS_FALSO = (
+    "SECCIÓN 1: El tema central es la autoexigencia. SECCIÓN 2: El terapeuta "
+    "sostuvo bien el encuadre. SECCIÓN 3: Explorar la figura paterna. "
+    "SECCIÓN 4: Esquema de defectuosidad."
+)
+
+TRANSCRIPCION_FALSA = (
+    "Paciente: Últimamente siento un nudo en el estómago cada vez que pienso en el trabajo. "
+    "Terapeuta: ¿Desde cuándo lo sientes así? Paciente: Desde que cambió mi jefe; mi padre era igual."
+)
+
+
+async def _esperar(latencia, jitter):
+    await asyncio.sleep(max(0.0, latencia + random.uniform(-jitter, jitter)))
+
+
+def _falla(tasa_error):
+    return random.random() < tasa_error
+
+
+def _respuesta_chat(cuerpo):
+    """Elige qué devolver según el prompt, para que cada fase reciba algo válido."""
+    mensajes = cuerpo.get("messages") or []
+    prompt = mensajes[-1].get("content", "") if mensajes else ""
+    if "Secretario Clínico" in prompt:
+        return json.dumps(EXTRACCION_FALSA, ensure_ascii=False)
+    if (cuerpo.get("response_format") or {}).get("type") == "json_object":
+        if "asistente de IA para terapeutas" in prompt:
+            return json.dumps({"vision_producto": "Asistente falso", "modulos_priorizados": []}, ensure_ascii=False)
+        return json.dumps(REPORTE_FALSO, ensure_ascii=False)
+    return ANALISIS_FALSO
+
+
+def _uso(cuerpo, texto):
+    prompt_tokens = sum(len(m.get("content", "")) for m in cuerpo.get("messages") or []) // 4
+    completion_tokens = len(texto) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def crear_app_deepseek(latencia=0.5, jitter=0.1, tasa_error=0.0):
+    app = FastAPI()
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        cuerpo = await request.json()
+        await _esperar(latencia, jitter)
+        if _falla(tasa_error):
+            return JSONResponse({"error": {"message": "Error simulado", "type": "server_error"}}, status_code=500)
+
+        texto = _respuesta_chat(cuerpo)
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": cuerpo.get("model")}
+
+        if not cuerpo.get("stream"):
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": texto}}],
+                "usage": _uso(cuerpo, texto),
+            }
+
+        async def fragmentos():
+            for palabra in texto.split(" "):
+                delta = {"index": 0, "delta": {"content": palabra + " "}, "finish_reason": None}
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [delta]})}\n\n"
+            final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": _uso(cuerpo, texto)}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(fragmentos(), media_type="text/event-stream")
+
+    return app
+
+
+def crear_app_replicate(latencia=2.0, jitter=0.5, tasa_error=0.0):
+    app = FastAPI()
+    predicciones = {}
+
+    def _prediccion(prediccion_id, version, entrada, estado, salida=None, error=None):
+        return {
+            "id": prediccion_id,
+            "model": "openai/whisper",
+            "version": version,
+            "status": estado,
+            "input": entrada,
+            "output": salida,
+            "logs": "",
+            "error": error,
+            "metrics": {},
+            "created_at": "2026-01-01T00:00:00Z",
+            "started_at": None,
+            "completed_at": None,
+            "urls": {"get": f"/v1/predictions/{prediccion_id}", "cancel": f"/v1/predictions/{prediccion_id}/cancel"},
+        }
+
+    @app.post("/v1/files")
+    async def subir_archivo(request: Request):
+        # Solo se consume el cuerpo; el contenido no importa para la transcripción falsa
+        tamano = len(await request.body())
+        archivo_id = uuid.uuid4().hex[:12]
+        return {
+            "id": archivo_id,
+            "name": "audio",
+            "content_type": "application/octet-stream",
+            "size": tamano,
+            "etag": archivo_id,
+            "checksums": {},
+            "metadata": {},
+            "created_at": "2026-01-01T00:00:00Z",
+            "expires_at": None,
+            "urls": {"get": f"http://falso/v1/files/{archivo_id}"},
+        }
+
+    @app.get("/v1/models/{dueno}/{nombre}/versions/{version_id}")
+    async def leer_version(dueno: str, nombre: str, version_id: str):
+        return {"id": version_id, "created_at": "2026-01-01T00:00:00Z", "cog_version": "0.9.0", "openapi_schema": {}}
+
+    @app.post("/v1/predictions")
+    async def crear_prediccion(request: Request):
+        cuerpo = await request.json()
+        prediccion_id = uuid.uuid4().hex[:12]
+        # Se responde ya terminada, como el "Prefer: wait" de Replicate
+        await _esperar(latencia, jitter)
+        if _falla(tasa_error):
+            prediccion = _prediccion(prediccion_id, cuerpo.get("version"), cuerpo.get("input"), "failed", error="Error simulado")
+        else:
+            prediccion = _prediccion(
+                prediccion_id, cuerpo.get("version"), cuerpo.get("input"), "succeeded",
+                salida={"transcription": TRANSCRIPCION_FALSA},
+            )
+        predicciones[prediccion_id] = prediccion
+        return JSONResponse(prediccion, status_code=201)
+
+    @app.get("/v1/predictions/{prediccion_id}")
+    async def leer_prediccion(prediccion_id: str):
+        if prediccion_id not in predicciones:
+            return JSONResponse({"detail": "No encontrada"}, status_code=404)
+        return predicciones[prediccion_id]
+
+    return app
+
+
+# --- ARRANQUE EN SEGUNDO PLANO ---
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServidorEnHilo:
+    """Corre una app ASGI con uvicorn en un hilo propio (con su propio event loop)."""
+
+    def __init__(self, app, puerto=None, host="127.0.0.1"):
+        self.host = host
+        self.puerto = puerto or puerto_libre()
+        self.servidor = uvicorn.Server(uvicorn.Config(app, host=host, port=self.puerto, log_level="warning"))
+        self.hilo = threading.Thread(target=self.servidor.run, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.puerto}"
+
+    def iniciar(self):
+        self.hilo.start()
+        while not self.servidor.started:
+            if not self.hilo.is_alive():
+                raise RuntimeError(f"No se pudo levantar el servidor en el puerto {self.puerto}")
+            time.sleep(0.02)
+        return self
+
+    def detener(self):
+        self.servidor.should_exit = True
+        self.hilo.join(timeout=5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Levanta DeepSeek y Replicate falsos.")
+    parser.add_argument("--puerto-deepseek", type=int, default=8801)
+    parser.add_argument("--puerto-replicate", type=int, default=8802)
+    parser.add_argument("--latencia", type=float, default=0.5, help="Segundos por llamada de chat")
+    parser.add_argument("--latencia-whisper", type=float, default=2.0, help="Segundos por transcripción")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--errores", type=float, default=0.0, help="Probabilidad de error (0-1)")
+    args = parser.parse_args()
+
+    deepseek = ServidorEnHilo(crear_app_deepseek(args.latencia, args.jitter, args.errores), args.puerto_deepseek).iniciar()
+    replicate = ServidorEnHilo(crear_app_replicate(args.latencia_whisper, args.jitter, args.errores), args.puerto_replicate).iniciar()
+    print(f"🧪 DeepSeek falso:  DEEPSEEK_BASE_URL={deepseek.url}")
+    print(f"🧪 Replicate falso: REPLICATE_BASE_URL={replicate.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        deepseek.detener()
+        replicate.detener()
@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import asyncio
+import sqlite3
+import tempfile
+
+import httpx
+import pytest
+
+# Los módulos del backend están en la raíz del repo y leen el entorno al importarse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "pruebas.db"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "pruebas")
+os.environ.setdefault("LOG_ESTRUCTURADO", "0")
+
+# La tabla 'reportes' tal como la creaba create_all antes de las migraciones
+ESQUEMA_LEGADO = """
+CREATE TABLE reportes (
+    id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    motivo_consulta VARCHAR,
+    emocion_base VARCHAR,
+    organo_afectado VARCHAR,
+    conflicto_biologico VARCHAR,
+    diagnostico_tecnico VARCHAR,
+    hallazgos_clinicos TEXT,
+    oportunidades_omitidas TEXT,
+    recomendaciones TEXT,
+    resumen_sesion TEXT,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_reportes_id ON reportes (id);
+"""
+
+
+@pytest.fixture
+def base_legada(tmp_path):
+    """Crea un legacy.db con el esquema de la primera versión. Devuelve (ruta, insertar)."""
+    ruta = str(tmp_path / "legacy.db")
+    conexion = sqlite3.connect(ruta)
+    conexion.executescript(ESQUEMA_LEGADO)
+    conexion.commit()
+
+    def insertar(*filas):
+        for fila in filas:
+            columnas = ", ".join(fila)
+            marcas = ", ".join("?" for _ in fila)
+            conexion.execute(f"INSERT INTO reportes ({columnas}) VALUES ({marcas})", tuple(fila.values()))
+        conexion.commit()
+
+    yield ruta, insertar
+    conexion.close()
+
+
+@pytest.fixture(scope="session")
+def base():
+    """Migra la base de pruebas (DATABASE_URL) una sola vez. Devuelve el engine síncrono."""
+    from database import engine
+    from migraciones import aplicar_migraciones
+    aplicar_migraciones(engine)
+    return engine
+
+
+@pytest.fixture
+def correr(base):
+    """asyncio.run que al terminar suelta las conexiones async (quedan atadas a ese loop)."""
+    from database import engine_async
+
+    def _correr(corutina):
+        async def envuelta():
+            try:
+                return await corutina
+            finally:
+                await engine_async.dispose()
+        return asyncio.run(envuelta())
+
+    return _correr
+
+
+class DeepSeekFalso:
+    """El DeepSeek de servidores_falsos.py sin red, con fallas a pedido.
+
+    fallar("texto del prompt", estado, veces): las próximas 'veces' llamadas
+    cuyo último mensaje contiene el texto responden con ese código HTTP.
+    """
+
+    def __init__(self):
+        from servidores_falsos import crear_app_deepseek
+        self.app = crear_app_deepseek(latencia=0, jitter=0)
+        self.peticiones = []
+        self._fallas = []
+
+    def fallar(self, texto, estado=400, veces=1):
+        self._fallas.append({"texto": texto, "estado": estado, "veces": veces})
+
+    async def _atender(self, request):
+        cuerpo = json.loads(await request.aread())
+        self.peticiones.append(cuerpo)
+        prompt = cuerpo["messages"][-1]["content"]
+        for falla in self._fallas:
+            if falla["veces"] and falla["texto"] in prompt:
+                falla["veces"] -= 1
+                return httpx.Response(falla["estado"], json={"error": {"message": "Falla de prueba"}})
+        return await httpx.ASGITransport(app=self.app).handle_async_request(request)
+
+    def cliente(self):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(
+            api_key="pruebas", base_url="http://deepseek-falso", max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self._atender)),
+        )
+
+
+@pytest.fixture
+def deepseek_falso(monkeypatch):
+    import servicios_ia
+    falso = DeepSeekFalso()
+    monkeypatch.setattr(servicios_ia, "_clientes_async", lambda: (falso.cliente(), None))
+    return falso
+
+
+@pytest.fixture
+def cliente(base, deepseek_falso):
+    """TestClient de main.app (con lifespan: migraciones, cola y consumo) contra el DeepSeek falso."""
+    from fastapi.testclient import TestClient
+    from database import engine_async
+    import main
+
+    with TestClient(main.app) as cliente:
+        yield cliente
+    asyncio.run(engine_async.dispose())
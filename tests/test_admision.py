@@ -0,0 +1,163 @@
+import io
+import time
+import asyncio
+import threading
+
+import pytest
+
+from admision import Limitador, Saturado, segundos_de_audio, llamar_con_admision, correr_sincrono
+
+
+def _correr(corutina):
+    return asyncio.run(corutina)
+
+
+def test_admite_sin_esperar_con_capacidad():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=2, por_minuto=0)
+        async with limitador.reservar():
+            async with limitador.reservar():
+                return limitador._en_curso
+
+    assert _correr(escenario()) == 2
+
+
+def test_cola_llena_rechaza_enseguida():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, por_minuto=0, max_cola=1, espera_maxima=5)
+        ocupada = await limitador.adquirir()
+        en_cola = asyncio.create_task(limitador.adquirir())
+        await asyncio.sleep(0)
+        inicio = time.monotonic()
+        with pytest.raises(Saturado) as error:
+            await limitador.adquirir()
+        demora = time.monotonic() - inicio
+        limitador.liberar(ocupada)
+        limitador.liberar(await en_cola)
+        return error.value, demora
+
+    error, demora = _correr(escenario())
+    assert error.motivo == "cola_llena"
+    assert error.recurso == "prueba"
+    assert error.reintentar_en >= 1
+    assert demora < 0.1
+
+
+def test_espera_agotada():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, por_minuto=0, espera_maxima=0.05)
+        ocupada = await limitador.adquirir()
+        with pytest.raises(Saturado) as error:
+            await limitador.adquirir()
+        limitador.liberar(ocupada)
+        # El que se rindió ya no está en la cola
+        return error.value, len(limitador._cola)
+
+    error, en_cola = _correr(escenario())
+    assert error.motivo == "espera_agotada"
+    assert en_cola == 0
+
+
+def test_presupuesto_inalcanzable_rechaza_enseguida():
+    async def escenario():
+        # 60 por minuto = 1 por segundo: faltarían 30 s y solo se espera 1
+        limitador = Limitador("prueba", concurrencia=4, por_minuto=60, espera_maxima=1)
+        await limitador.adquirir(60)
+        with pytest.raises(Saturado) as error:
+            await limitador.adquirir(30)
+        return error.value
+
+    error = _correr(escenario())
+    assert error.motivo == "presupuesto"
+    assert error.reintentar_en >= 30
+
+
+def test_espera_a_que_se_recargue_el_presupuesto():
+    async def escenario():
+        # 600 por minuto = 10 por segundo: 5 más tardan ~0.5 s
+        limitador = Limitador("prueba", concurrencia=4, por_minuto=600, espera_maxima=2)
+        await limitador.adquirir(600)
+        inicio = time.monotonic()
+        await limitador.adquirir(5)
+        return time.monotonic() - inicio
+
+    assert 0.3 < _correr(escenario()) < 1.5
+
+
+def test_ajustar_devuelve_lo_no_usado():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=4, por_minuto=60, espera_maxima=1)
+        reserva = await limitador.adquirir(60)
+        reserva.ajustar(10)
+        inicio = time.monotonic()
+        await limitador.adquirir(40)
+        return time.monotonic() - inicio
+
+    assert _correr(escenario()) < 0.1
+
+
+def test_atiende_en_orden_de_llegada():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, por_minuto=0, espera_maxima=5)
+        orden = []
+
+        async def pedir(nombre):
+            async with limitador.reservar():
+                orden.append(nombre)
+                await asyncio.sleep(0.01)
+
+        ocupada = await limitador.adquirir()
+        tareas = []
+        for nombre in ("a", "b", "c", "d"):
+            tareas.append(asyncio.create_task(pedir(nombre)))
+            await asyncio.sleep(0)
+        limitador.liberar(ocupada)
+        await asyncio.gather(*tareas)
+        return orden
+
+    assert _correr(escenario()) == ["a", "b", "c", "d"]
+
+
+def test_segundos_de_audio():
+    assert segundos_de_audio(None, duracion=42.5) == 42.5
+    archivo = io.BytesIO(b"\0" * 160000)
+    archivo.seek(10)
+    assert segundos_de_audio(archivo) == 10
+    # No mueve la posición de lectura
+    assert archivo.tell() == 10
+    assert segundos_de_audio("/no/existe.mp3") == 0
+
+
+def test_llamadas_sincronas_comparten_el_presupuesto():
+    limitador = Limitador("consola", concurrencia=1, por_minuto=60, espera_maxima=1)
+    assert llamar_con_admision(limitador, 60, lambda x: x * 2, 21) == 42
+    # Un loop nuevo por llamada volvería a llenar la cubeta
+    with pytest.raises(Saturado) as error:
+        llamar_con_admision(limitador, 30, lambda: None)
+    assert error.value.motivo == "presupuesto"
+
+
+def test_llamadas_sincronas_desde_varios_hilos_respetan_la_concurrencia():
+    limitador = Limitador("consola", concurrencia=1, por_minuto=0, espera_maxima=0.05)
+    resultados = []
+
+    def llamar():
+        try:
+            resultados.append(llamar_con_admision(limitador, 0, time.sleep, 0.2))
+        except Saturado as e:
+            resultados.append(e.motivo)
+
+    hilos = [threading.Thread(target=llamar) for _ in range(2)]
+    for hilo in hilos:
+        hilo.start()
+        time.sleep(0.05)
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(resultados, key=str) == [None, "espera_agotada"]
+
+
+def test_correr_sincrono_usa_siempre_el_mismo_loop():
+    async def loop_actual():
+        return asyncio.get_running_loop()
+
+    assert correr_sincrono(loop_actual()) is correr_sincrono(loop_actual())
@@ -0,0 +1,95 @@
+import uuid
+
+import pytest
+
+import cache
+import servicios_ia
+from cache import CacheDosNiveles, clave_reporte, generar_reporte_cacheado
+
+
+def _texto():
+    # Texto distinto por prueba: el cache y la tabla se comparten entre pruebas
+    return f"Paciente: me cuesta dormir desde la mudanza. Sesión {uuid.uuid4().hex}."
+
+
+def test_clave_ignora_espacios_y_forma_unicode():
+    assert clave_reporte("Me  duele la\nespalda.") == clave_reporte(" Me duele la espalda. ")
+    assert clave_reporte("cancio\u0301n") == clave_reporte("canci\u00f3n")
+
+
+def test_clave_cambia_con_el_modo_y_la_version_del_prompt(monkeypatch):
+    texto = "Me duele la espalda."
+    completo = clave_reporte(texto, "completo")
+    assert completo != clave_reporte(texto, "rapido")
+    monkeypatch.setattr(servicios_ia, "PROMPT_VERSION_REPORTE", "otra-version")
+    assert clave_reporte(texto, "completo") != completo
+
+
+def test_segundo_pedido_sale_del_cache(deepseek_falso, correr):
+    texto = _texto()
+
+    async def escenario():
+        primero = await generar_reporte_cacheado(texto, modo="rapido")
+        llamadas = len(deepseek_falso.peticiones)
+        segundo = await generar_reporte_cacheado(f"  {texto}  ", modo="rapido")
+        return primero, segundo, llamadas
+
+    (reporte_1, meta_1), (reporte_2, meta_2), llamadas = correr(escenario())
+    assert (meta_1["desde_cache"], meta_2["desde_cache"]) == (False, True)
+    assert meta_2["etapas"] == []
+    assert reporte_2 == reporte_1
+    assert len(deepseek_falso.peticiones) == llamadas == 1
+
+
+def test_sin_cache_siempre_llama_y_no_guarda(deepseek_falso, correr):
+    texto = _texto()
+
+    async def escenario():
+        await generar_reporte_cacheado(texto, usar_cache=False, modo="rapido")
+        await generar_reporte_cacheado(texto, usar_cache=False, modo="rapido")
+        return await generar_reporte_cacheado(texto, modo="rapido")
+
+    _, metadatos = correr(escenario())
+    assert not metadatos["desde_cache"]
+    assert len(deepseek_falso.peticiones) == 3
+
+
+def test_reporte_degradado_no_se_guarda(deepseek_falso, correr):
+    texto = _texto()
+    deepseek_falso.fallar("ANÁLISIS DE INTERVENCIÓN", estado=400)
+
+    async def escenario():
+        _, primero = await generar_reporte_cacheado(texto, modo="completo")
+        _, segundo = await generar_reporte_cacheado(texto, modo="completo")
+        return primero, segundo
+
+    primero, segundo = correr(escenario())
+    assert primero["degradado"] and not primero["desde_cache"]
+    assert not segundo["degradado"] and not segundo["desde_cache"]
+
+
+def test_nivel_2_sobrevive_a_otro_proceso(base, correr):
+    clave = uuid.uuid4().hex
+
+    async def escenario():
+        await CacheDosNiveles("pruebas", max_memoria=4, max_db=10, ttl=60).guardar(clave, {"a": [1, 2]})
+        # Otro worker: memoria vacía, misma tabla
+        otro = CacheDosNiveles("pruebas", max_memoria=4, max_db=10, ttl=60)
+        valor = await otro.obtener(clave)
+        return valor, otro.contadores
+
+    valor, contadores = correr(escenario())
+    assert valor == {"a": [1, 2]}
+    assert contadores["aciertos_db"] == 1
+
+
+def test_entrada_vencida_no_se_sirve(base, correr, monkeypatch):
+    clave = uuid.uuid4().hex
+
+    async def escenario():
+        nivel = CacheDosNiveles("pruebas", max_memoria=4, max_db=10, ttl=60)
+        await nivel.guardar(clave, "valor")
+        monkeypatch.setattr(cache.time, "time", lambda: 10**12)
+        return await nivel.obtener(clave), await CacheDosNiveles("pruebas", 4, 10, 60).obtener(clave)
+
+    assert correr(escenario()) == (None, None)
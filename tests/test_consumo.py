@@ -0,0 +1,156 @@
+import json
+import uuid
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+import consumo
+import models
+from consumo import RegistroConsumo, registro_consumo, tokens_en_cache
+from database import AsyncSessionLocal
+from metricas import asignar_id_interno, asignar_id_peticion
+
+USO = SimpleNamespace(prompt_tokens=100, completion_tokens=20, prompt_cache_hit_tokens=40)
+
+
+def test_tokens_en_cache_de_deepseek_y_de_openai():
+    assert tokens_en_cache(USO) == 40
+    assert tokens_en_cache(SimpleNamespace(prompt_tokens_details=SimpleNamespace(cached_tokens=7))) == 7
+    assert tokens_en_cache(None) == 0
+
+
+async def _llamadas(reporte_id):
+    async with AsyncSessionLocal() as db:
+        return await consumo.llamadas_de_reporte(db, reporte_id)
+
+
+def test_reporte_guardado_despues_de_volcar_se_vincula_en_la_base(correr):
+    async def escenario():
+        registro = RegistroConsumo(intervalo=3600)
+        await registro.iniciar()
+        asignar_id_interno()
+        registro.anotar("fase_1", "deepseek-chat", USO, 0.5)
+        assert await registro.volcar() == 1
+        # El reporte se guarda cuando sus llamadas ya están en la tabla
+        registro.vincular_reporte(-101)
+        await registro.detener()
+        return await _llamadas(-101)
+
+    llamadas = correr(escenario())
+    assert [(l["etapa"], l["prompt_tokens"], l["cached_tokens"]) for l in llamadas] == [("fase_1", 100, 40)]
+
+
+def test_mismo_request_id_no_mezcla_reportes(correr):
+    async def peticion(registro, reporte_id):
+        asignar_id_peticion("repetido-por-el-cliente")
+        asignar_id_interno()
+        registro.anotar("rapido", "deepseek-chat", USO, 0.1)
+        registro.vincular_reporte(reporte_id)
+
+    async def escenario():
+        registro = RegistroConsumo(intervalo=3600)
+        await registro.iniciar()
+        await asyncio.gather(peticion(registro, -201), peticion(registro, -202))
+        await registro.detener()
+        return await _llamadas(-201), await _llamadas(-202)
+
+    primera, segunda = correr(escenario())
+    assert len(primera) == len(segunda) == 1
+
+
+def test_escritura_fallida_devuelve_las_filas_al_buffer(correr, monkeypatch):
+    class BaseCaida:
+        async def __aenter__(self):
+            raise ConnectionError("base caída")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def escenario():
+        registro = RegistroConsumo(intervalo=3600)
+        await registro.iniciar()
+        asignar_id_interno()
+        registro.anotar("fase_2", "deepseek-chat", USO, 0.2)
+        registro.vincular_reporte(-301)
+
+        monkeypatch.setattr(consumo, "AsyncSessionLocal", BaseCaida)
+        assert await registro.volcar() == 0
+        pendientes = registro.pendientes()
+        monkeypatch.setattr(consumo, "AsyncSessionLocal", AsyncSessionLocal)
+        await registro.detener()
+        return pendientes, await _llamadas(-301)
+
+    pendientes, llamadas = correr(escenario())
+    assert pendientes == 1
+    assert [l["etapa"] for l in llamadas] == ["fase_2"]
+
+
+def test_escritura_cancelada_devuelve_las_filas_al_buffer(correr, monkeypatch):
+    class BaseLenta:
+        async def __aenter__(self):
+            await asyncio.sleep(5)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def escenario():
+        registro = RegistroConsumo(intervalo=3600)
+        await registro.iniciar()
+        registro.anotar("fase_3", "deepseek-chat", USO, 0.3)
+        monkeypatch.setattr(consumo, "AsyncSessionLocal", BaseLenta)
+        tarea = asyncio.create_task(registro.volcar())
+        await asyncio.sleep(0.01)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        return registro.pendientes()
+
+    assert correr(escenario()) == 1
+
+
+def test_buffer_lleno_descarta_las_mas_viejas(correr):
+    async def escenario():
+        registro = RegistroConsumo(intervalo=3600, max_pendientes=2)
+        await registro.iniciar()
+        for etapa in ("a", "b", "c"):
+            registro.anotar(etapa, "deepseek-chat", USO, 0.1)
+        etapas = [f["etapa"] for f in registro._pendientes]
+        registro._tarea.cancel()
+        return etapas
+
+    assert correr(escenario()) == ["b", "c"]
+
+
+def _volcar(cliente):
+    cliente.portal.call(registro_consumo.volcar)
+
+
+def test_por_http_cada_reporte_tiene_sus_llamadas(cliente):
+    cabeceras = {"X-Request-ID": "mismo-id-de-cliente"}
+    consulta = {"texto": f"Sesión del registro {uuid.uuid4().hex}", "usar_cache": False, "modo_reporte": "rapido"}
+    ids = [
+        cliente.post("/analyze_text", json=consulta, headers=cabeceras).json()["analisis_ia"]["id"]
+        for _ in range(2)
+    ]
+    _volcar(cliente)
+
+    for reporte_id in ids:
+        llamadas = cliente.get(f"/consumo/reporte/{reporte_id}").json()["llamadas"]
+        assert [(l["etapa"], l["endpoint"]) for l in llamadas] == [("rapido", "/analyze_text")]
+
+    totales = cliente.get("/consumo").json()
+    assert any(e["endpoint"] == "/analyze_text" and e["llamadas"] >= 2 for e in totales["por_endpoint"])
+
+
+def test_por_http_cada_texto_del_lote_tiene_sus_llamadas(cliente):
+    textos = [f"Lote {i} {uuid.uuid4().hex}" for i in range(3)]
+    respuesta = cliente.post("/analyze_text/batch", json={"textos": textos, "usar_cache": False, "modo_reporte": "rapido"})
+    resumen = [json.loads(l) for l in respuesta.text.splitlines() if l][-1]
+    assert resumen["tipo"] == "resumen" and resumen["exitos"] == 3
+    _volcar(cliente)
+
+    for reporte_id in resumen["ids"].values():
+        llamadas = cliente.get(f"/consumo/reporte/{reporte_id}").json()["llamadas"]
+        assert len(llamadas) == 1
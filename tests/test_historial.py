@@ -0,0 +1,114 @@
+import json
+import uuid
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from historial import (
+    codificar_cursor, decodificar_cursor, parsear_campos, consultar_pagina, serializar_lista,
+    ReporteHistorial, CursorInvalido, CAMPOS, CAMPOS_RESUMEN,
+)
+from migraciones import aplicar_migraciones
+import models
+
+
+def test_cursor_ida_y_vuelta():
+    fecha = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    assert decodificar_cursor(codificar_cursor(fecha, 42)) == (fecha, 42)
+
+
+def test_cursor_es_seguro_en_url():
+    cursor = codificar_cursor(datetime(2026, 3, 1, tzinfo=timezone.utc), 10**9)
+    assert all(c.isalnum() or c in "-_=" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "no-es-base64!", "W10=", "WyJub3ctZmVjaGEiLCAxXQ=="])
+def test_cursor_invalido(cursor):
+    with pytest.raises(CursorInvalido):
+        decodificar_cursor(cursor)
+
+
+def test_parsear_campos():
+    assert parsear_campos(None) == tuple(CAMPOS)
+    assert parsear_campos("resumen") == CAMPOS_RESUMEN
+    assert parsear_campos(" id, motivo_consulta ,id,") == ("id", "motivo_consulta")
+    with pytest.raises(ValueError):
+        parsear_campos("id,inventado")
+
+
+def _recorrer(ruta, limit):
+    """Sigue los cursores de consultar_pagina hasta el final. Devuelve los IDs por página."""
+    async def escenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{ruta}")
+        paginas, cursor = [], None
+        try:
+            async with AsyncSession(engine) as db:
+                while len(paginas) < 20:
+                    reportes, cursor = await consultar_pagina(db, limit=limit, cursor=cursor, campos=("id",))
+                    paginas.append([r.id for r in reportes])
+                    if cursor is None:
+                        break
+        finally:
+            await engine.dispose()
+        return paginas
+
+    return asyncio.run(escenario())
+
+
+def test_pagina_reportes_viejos_con_la_misma_fecha(base_legada):
+    ruta, insertar = base_legada
+    insertar(*[{"created_at": "2024-05-01 10:00:00", "motivo_consulta": f"m{i}"} for i in range(6)])
+    aplicar_migraciones(create_engine(f"sqlite:///{ruta}"))
+
+    assert _recorrer(ruta, limit=2) == [[6, 5], [4, 3], [2, 1]]
+
+
+def test_pagina_reportes_viejos_y_nuevos(base_legada):
+    ruta, insertar = base_legada
+    insertar(
+        {"created_at": "2024-05-01 10:00:00"},
+        {"created_at": "2024-05-01 10:00:00"},
+        {"created_at": "2024-05-02 09:00:00"},
+    )
+    engine = create_engine(f"sqlite:///{ruta}")
+    aplicar_migraciones(engine)
+    with engine.begin() as conexion:
+        # Un reporte guardado ya con el default de Python (microsegundos)
+        conexion.execute(models.Reporte.__table__.insert().values(motivo_consulta="nuevo"))
+
+    assert _recorrer(ruta, limit=1) == [[4], [3], [2], [1]]
+
+
+def test_serializa_solo_los_campos_pedidos():
+    reportes = [
+        ReporteHistorial(id=1, fecha=datetime(2026, 1, 1, tzinfo=timezone.utc), motivo_consulta="a", recomendaciones=None),
+        ReporteHistorial(id=2, motivo_consulta="b", recomendaciones="texto suelto"),
+    ]
+    assert json.loads(serializar_lista(reportes, ("id", "recomendaciones"))) == [
+        {"id": 1, "recomendaciones": []},
+        {"id": 2, "recomendaciones": "texto suelto"},
+    ]
+
+
+def test_historial_por_http_con_cursor_y_campos(cliente):
+    ids = []
+    for i in range(3):
+        respuesta = cliente.post(
+            "/analyze_text", json={"texto": f"Sesión de historial {i} {uuid.uuid4().hex}", "modo_reporte": "rapido"}
+        )
+        ids.append(respuesta.json()["analisis_ia"]["id"])
+
+    primera = cliente.get("/historial", params={"limit": 2, "fields": "id,recomendaciones"})
+    assert primera.status_code == 200
+    assert [r["id"] for r in primera.json()] == ids[::-1][:2]
+    assert all(set(r) == {"id", "recomendaciones"} for r in primera.json())
+    assert isinstance(primera.json()[0]["recomendaciones"], list)
+
+    segunda = cliente.get("/historial", params={"limit": 1, "cursor": primera.headers["X-Siguiente-Cursor"]})
+    assert [r["id"] for r in segunda.json()] == [ids[0]]
+
+    assert cliente.get("/historial", params={"fields": "inventado"}).status_code == 400
+    assert cliente.get("/historial", params={"cursor": "roto"}).status_code == 400
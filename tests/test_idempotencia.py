@@ -0,0 +1,121 @@
+import uuid
+import asyncio
+
+import pytest
+
+from idempotencia import AnalisisUnicos, ClaveReutilizada, huella
+
+
+def test_pedidos_simultaneos_se_unen_al_primero():
+    async def escenario():
+        unicos = AnalisisUnicos()
+        llamadas = []
+
+        async def analizar():
+            llamadas.append(1)
+            await asyncio.sleep(0.05)
+            return {"id": 7}
+
+        resultados = await asyncio.gather(*[
+            unicos.ejecutar("analyze_text", "h1", analizar) for _ in range(3)
+        ])
+        return resultados, llamadas, unicos.en_curso()
+
+    resultados, llamadas, en_curso = asyncio.run(escenario())
+    assert len(llamadas) == 1
+    assert sorted(origen for _, origen in resultados) == ["original", "unida", "unida"]
+    assert all(r == {"id": 7} for r, _ in resultados)
+    assert en_curso == 0
+
+
+def test_resultado_reciente_se_repite_y_los_errores_no():
+    async def escenario():
+        unicos = AnalisisUnicos()
+        respuestas = iter([{"error": "falló"}, {"id": 1}, {"id": 2}])
+
+        async def analizar():
+            return next(respuestas)
+
+        return [await unicos.ejecutar("analyze_text", "h1", analizar) for _ in range(3)]
+
+    assert asyncio.run(escenario()) == [
+        ({"error": "falló"}, "original"),
+        ({"id": 1}, "original"),
+        ({"id": 1}, "repetida"),
+    ]
+
+
+def test_cancelar_un_pedido_unido_no_cancela_el_analisis():
+    async def escenario():
+        unicos = AnalisisUnicos()
+
+        async def analizar():
+            await asyncio.sleep(0.05)
+            return {"id": 3}
+
+        original = asyncio.create_task(unicos.ejecutar("analyze_text", "h1", analizar))
+        await asyncio.sleep(0)
+        unida = asyncio.create_task(unicos.ejecutar("analyze_text", "h1", analizar))
+        await asyncio.sleep(0.01)
+        unida.cancel()
+        return await original
+
+    assert asyncio.run(escenario()) == ({"id": 3}, "original")
+
+
+def test_clave_del_cliente_con_otro_contenido():
+    async def escenario():
+        unicos = AnalisisUnicos()
+
+        async def analizar():
+            return {"id": 1}
+
+        await unicos.ejecutar("analyze_text", "h1", analizar, "clave")
+        await unicos.ejecutar("analyze_text", "h2", analizar, "clave")
+
+    with pytest.raises(ClaveReutilizada):
+        asyncio.run(escenario())
+
+
+def test_sin_contenido_como_clave_solo_vale_la_del_cliente():
+    async def escenario():
+        unicos = AnalisisUnicos()
+        contador = iter(range(1, 10))
+
+        async def analizar():
+            return {"id": next(contador)}
+
+        sin_clave = [await unicos.ejecutar("a", "h1", analizar, por_contenido=False) for _ in range(2)]
+        con_clave = [await unicos.ejecutar("a", "h1", analizar, "k", por_contenido=False) for _ in range(2)]
+        return sin_clave + con_clave
+
+    assert asyncio.run(escenario()) == [
+        ({"id": 1}, "original"), ({"id": 2}, "original"), ({"id": 3}, "original"), ({"id": 3}, "repetida"),
+    ]
+
+
+def test_huella_depende_de_los_parametros():
+    assert huella("abc", True, "rapido") == huella("abc", True, "rapido")
+    assert huella("abc", True, "rapido") != huella("abc", True, "completo")
+
+
+def test_reintento_por_http_recibe_el_mismo_reporte(cliente):
+    consulta = {"texto": f"Sesión repetida {uuid.uuid4().hex}", "modo_reporte": "rapido"}
+    primera = cliente.post("/analyze_text", json=consulta)
+    segunda = cliente.post("/analyze_text", json=consulta)
+    assert (primera.headers["X-Idempotencia"], segunda.headers["X-Idempotencia"]) == ("original", "repetida")
+    assert segunda.json()["analisis_ia"]["id"] == primera.json()["analisis_ia"]["id"]
+
+
+def test_sin_cache_cada_pedido_es_un_reporte_nuevo(cliente):
+    consulta = {"texto": f"Sesión sin cache {uuid.uuid4().hex}", "usar_cache": False, "modo_reporte": "rapido"}
+    ids = [cliente.post("/analyze_text", json=consulta).json()["analisis_ia"]["id"] for _ in range(2)]
+    assert ids[0] != ids[1]
+
+    clave = {"Idempotency-Key": uuid.uuid4().hex}
+    respuestas = [cliente.post("/analyze_text", json=consulta, headers=clave) for _ in range(2)]
+    assert [r.headers["X-Idempotencia"] for r in respuestas] == ["original", "repetida"]
+    assert respuestas[0].json()["analisis_ia"]["id"] == respuestas[1].json()["analisis_ia"]["id"]
+
+    otra = cliente.post("/analyze_text", json={**consulta, "texto": "otro texto"}, headers=clave)
+    assert otra.status_code == 422
@@ -0,0 +1,84 @@
+import io
+import os
+import asyncio
+import hashlib
+
+import pytest
+from starlette.datastructures import UploadFile
+
+import ingesta
+from ingesta import ingerir_subida, ErrorIngesta
+
+
+def _subida(datos, size=None, nombre="sesion.mp3"):
+    return UploadFile(file=io.BytesIO(datos), filename=nombre, size=size)
+
+
+def test_audio_chico_queda_en_memoria():
+    datos = os.urandom(3000)
+    audio = asyncio.run(ingerir_subida(_subida(datos)))
+    try:
+        assert audio.en_memoria
+        assert audio.tamano == len(datos)
+        assert audio.sha256 == hashlib.sha256(datos).hexdigest()
+        assert audio.abrir().read() == datos
+    finally:
+        audio.cerrar()
+
+
+def test_audio_grande_pasa_a_un_tempfile_que_se_borra(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingesta, "INGESTA_MAX_MEMORIA", 1024)
+    monkeypatch.setattr(ingesta, "INGESTA_DIR", str(tmp_path))
+    monkeypatch.setattr(ingesta, "TAMANO_BLOQUE", 512)
+    datos = os.urandom(5000)
+    audio = asyncio.run(ingerir_subida(_subida(datos)))
+    assert not audio.en_memoria
+    assert os.path.dirname(audio.ruta) == str(tmp_path)
+    assert audio.abrir().read() == datos
+    assert audio.sha256 == hashlib.sha256(datos).hexdigest()
+    audio.cerrar()
+    assert os.listdir(tmp_path) == []
+
+
+def test_vacio_es_400():
+    with pytest.raises(ErrorIngesta) as error:
+        asyncio.run(ingerir_subida(_subida(b"")))
+    assert error.value.status_code == 400
+
+
+def test_tamano_declarado_excesivo_se_rechaza_sin_leer(monkeypatch):
+    monkeypatch.setattr(ingesta, "INGESTA_MAX_BYTES", 100)
+    subida = _subida(b"x" * 10, size=10**9)
+    with pytest.raises(ErrorIngesta) as error:
+        asyncio.run(ingerir_subida(subida))
+    assert error.value.status_code == 413
+    assert subida.file.tell() == 0
+
+
+def test_corta_al_pasar_el_maximo_y_borra_lo_leido(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingesta, "INGESTA_MAX_BYTES", 3000)
+    monkeypatch.setattr(ingesta, "INGESTA_MAX_MEMORIA", 1024)
+    monkeypatch.setattr(ingesta, "INGESTA_DIR", str(tmp_path))
+    monkeypatch.setattr(ingesta, "TAMANO_BLOQUE", 1000)
+    subida = _subida(os.urandom(10000))
+    with pytest.raises(ErrorIngesta) as error:
+        asyncio.run(ingerir_subida(subida))
+    assert error.value.status_code == 413
+    assert subida.file.tell() <= 4000
+    assert os.listdir(tmp_path) == []
+
+
+def test_duracion_excesiva_es_413(monkeypatch):
+    monkeypatch.setattr(ingesta, "_medir_duracion", lambda audio: 3 * 3600)
+    with pytest.raises(ErrorIngesta) as error:
+        asyncio.run(ingerir_subida(_subida(b"x" * 100)))
+    assert error.value.status_code == 413
+
+
+def test_endpoints_devuelven_el_codigo_de_la_ingesta(cliente, monkeypatch):
+    respuesta = cliente.post("/analyze_audio", files={"file": ("vacio.mp3", b"", "audio/mpeg")})
+    assert respuesta.status_code == 400
+
+    monkeypatch.setattr(ingesta, "INGESTA_MAX_BYTES", 100)
+    respuesta = cliente.post("/jobs/analyze_audio", files={"file": ("grande.mp3", b"x" * 1000, "audio/mpeg")})
+    assert respuesta.status_code == 413
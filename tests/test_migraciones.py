@@ -0,0 +1,121 @@
+import threading
+
+from sqlalchemy import create_engine, event, inspect, select, func, text
+
+import models
+from migraciones import aplicar_migraciones, version_esquema, tabla_version, VERSION_ESQUEMA
+
+
+def _engine(ruta):
+    return create_engine(f"sqlite:///{ruta}")
+
+
+def test_base_anterior_se_migra_sin_perder_datos(base_legada):
+    ruta, insertar = base_legada
+    insertar(
+        {"created_at": "2024-05-01 10:00:00", "motivo_consulta": "Insomnio", "emocion_base": "Miedo"},
+        {"created_at": "2024-05-02 10:00:00", "motivo_consulta": "Duelo", "emocion_base": "Tristeza"},
+    )
+    engine = _engine(ruta)
+    assert aplicar_migraciones(engine) == VERSION_ESQUEMA
+
+    with engine.connect() as conexion:
+        assert version_esquema(conexion) == VERSION_ESQUEMA
+        motivos = conexion.execute(text("SELECT motivo_consulta FROM reportes ORDER BY id")).scalars().all()
+        esquema = inspect(conexion)
+        tablas = set(esquema.get_table_names())
+        indices = {i["name"] for i in esquema.get_indexes("reportes")}
+        columnas_trabajos = {c["name"] for c in esquema.get_columns("trabajos")}
+        columnas_consumo = {c["name"] for c in esquema.get_columns("consumo_llamadas")}
+        conteos = conexion.execute(text(
+            "SELECT valor, conteo FROM conteos_semanales WHERE dimension = 'emocion_base' ORDER BY valor"
+        )).all()
+        encontrados = conexion.execute(text(
+            "SELECT rowid FROM reportes_fts WHERE reportes_fts MATCH 'insomnio'"
+        )).scalars().all()
+    assert motivos == ["Insomnio", "Duelo"]
+    assert {"trabajos", "cache_entradas", "conteos_semanales", "consumo_llamadas", "reportes_fts"} <= tablas
+    assert "ix_reportes_created_at_id" in indices
+    assert {"instancia", "latido"} <= columnas_trabajos
+    assert "id_interno" in columnas_consumo
+    # Los reportes que ya estaban entran en los conteos y en la búsqueda
+    assert [tuple(f) for f in conteos] == [("miedo", 1), ("tristeza", 1)]
+    assert encontrados == [1]
+
+
+def test_segunda_vez_no_toca_el_esquema(base_legada):
+    ruta, _ = base_legada
+    engine = _engine(ruta)
+    aplicar_migraciones(engine)
+    sentencias = []
+
+    def anotar(conexion, cursor, sentencia, *args):
+        sentencias.append(sentencia)
+
+    event.listen(engine, "before_cursor_execute", anotar)
+    assert aplicar_migraciones(engine) == VERSION_ESQUEMA
+    assert all(s.lstrip().upper().startswith(("SELECT", "PRAGMA")) for s in sentencias)
+    with engine.connect() as conexion:
+        versiones = conexion.execute(select(func.count()).select_from(tabla_version)).scalar()
+    assert versiones == VERSION_ESQUEMA
+
+
+def test_base_nueva_desde_cero(tmp_path):
+    engine = _engine(tmp_path / "nueva.db")
+    assert aplicar_migraciones(engine) == VERSION_ESQUEMA
+    with engine.connect() as conexion:
+        assert set(models.Base.metadata.tables) <= set(inspect(conexion).get_table_names())
+
+
+def test_varios_workers_arrancando_a_la_vez(base_legada):
+    ruta, insertar = base_legada
+    insertar({"created_at": "2024-05-01 10:00:00", "emocion_base": "Miedo"})
+    resultados, errores = [], []
+
+    def arrancar():
+        try:
+            resultados.append(aplicar_migraciones(_engine(ruta)))
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=arrancar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert errores == []
+    assert resultados == [VERSION_ESQUEMA] * 4
+    with _engine(ruta).connect() as conexion:
+        # Cada migración se aplicó una sola vez: el conteo no se duplicó
+        assert conexion.execute(text(
+            "SELECT conteo FROM conteos_semanales WHERE dimension = 'emocion_base'"
+        )).scalar() == 1
+        assert conexion.execute(select(func.count()).select_from(tabla_version)).scalar() == VERSION_ESQUEMA
+
+
+def test_ready_informa_la_version(cliente):
+    respuesta = cliente.get("/ready")
+    assert respuesta.status_code == 200
+    assert respuesta.json() == {"listo": True, "version_esquema": VERSION_ESQUEMA}
+
+
+def test_listas_viejas_en_texto_pasan_a_json(base_legada):
+    ruta, insertar = base_legada
+    insertar(
+        {"recomendaciones": '["Carta al padre", "Registro"]', "oportunidades_omitidas": "[]"},
+        {"recomendaciones": "", "oportunidades_omitidas": None},
+        {"recomendaciones": "Texto suelto de la IA", "oportunidades_omitidas": '{"a": 1}'},
+    )
+    engine = _engine(ruta)
+    aplicar_migraciones(engine)
+
+    with engine.connect() as conexion:
+        filas = conexion.execute(
+            select(models.Reporte.recomendaciones, models.Reporte.oportunidades_omitidas).order_by(models.Reporte.id)
+        ).all()
+    assert [tuple(f) for f in filas] == [
+        (["Carta al padre", "Registro"], []),
+        ([], None),
+        ("Texto suelto de la IA", {"a": 1}),
+    ]
@@ -0,0 +1,132 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import plazos
+from cache import generar_reporte_cacheado
+from plazos import llamar_con_plazo, plazo, repartir, restante, PlazoAgotado
+
+
+@pytest.fixture(autouse=True)
+def esperas_cortas(monkeypatch):
+    monkeypatch.setattr(plazos, "CHAT_ESPERA_BASE", 0.001)
+
+
+def _llamada(*resultados):
+    """llamar() que devuelve (o lanza) cada resultado en orden y cuenta los intentos."""
+    intentos = []
+
+    async def llamar():
+        intentos.append(time.monotonic())
+        resultado = resultados[min(len(intentos), len(resultados)) - 1]
+        if isinstance(resultado, BaseException):
+            raise resultado
+        if callable(resultado):
+            return await resultado()
+        return resultado
+
+    return llamar, intentos
+
+
+def test_repartir_por_peso_entre_las_etapas_que_faltan():
+    etapas = ["fase_1", "fase_2", "fase_3"]
+    assert repartir(etapas, 0, 100) == pytest.approx(30)
+    assert repartir(etapas, 1, 70) == pytest.approx(45)
+    assert repartir(etapas, 2, 25) == pytest.approx(25)
+    assert repartir(etapas, 0, -5) == 0
+
+
+def test_plazo_anidado():
+    with plazo(10):
+        assert 9 < restante() <= 10
+    assert restante() is None
+
+
+def test_reintenta_los_errores_transitorios():
+    llamar, intentos = _llamada(httpx.ConnectError("caído"), httpx.ConnectError("caído"), "ok")
+    assert asyncio.run(llamar_con_plazo(llamar, etapa="prueba")) == ("ok", 2)
+    assert len(intentos) == 3
+
+
+def test_no_reintenta_los_errores_definitivos():
+    llamar, intentos = _llamada(ValueError("respuesta inválida"), "ok")
+    with pytest.raises(ValueError):
+        asyncio.run(llamar_con_plazo(llamar, etapa="prueba"))
+    assert len(intentos) == 1
+
+
+def test_se_rinde_tras_los_reintentos(monkeypatch):
+    monkeypatch.setattr(plazos, "CHAT_REINTENTOS", 2)
+    llamar, intentos = _llamada(httpx.ConnectError("caído"))
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(llamar_con_plazo(llamar, etapa="prueba"))
+    assert len(intentos) == 3
+
+
+def test_no_reintenta_si_quien_llama_no_quiere():
+    llamar, intentos = _llamada(httpx.ConnectError("caído"), "ok")
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(llamar_con_plazo(llamar, etapa="prueba", reintentable=lambda: False))
+    assert len(intentos) == 1
+
+
+def test_la_llamada_lenta_se_corta_en_el_plazo():
+    async def lenta():
+        await asyncio.sleep(5)
+
+    llamar, _ = _llamada(lenta)
+
+    async def escenario():
+        with plazo(0.2):
+            await llamar_con_plazo(llamar, etapa="prueba")
+
+    inicio = time.monotonic()
+    with pytest.raises((asyncio.TimeoutError, PlazoAgotado)):
+        asyncio.run(escenario())
+    assert time.monotonic() - inicio < 1
+
+
+def test_sin_plazo_no_se_llama():
+    llamar, intentos = _llamada("ok")
+
+    async def escenario():
+        with plazo(0):
+            await llamar_con_plazo(llamar, etapa="prueba")
+
+    with pytest.raises(PlazoAgotado):
+        asyncio.run(escenario())
+    assert intentos == []
+
+
+def test_copia_de_cobertura_gana_a_la_original_lenta(monkeypatch):
+    monkeypatch.setattr(plazos, "CHAT_COBERTURA", True)
+    monkeypatch.setitem(plazos._latencias, "prueba_cobertura", plazos.deque([0.02] * 30))
+    estados = []
+
+    async def original():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            estados.append("original_cancelada")
+            raise
+
+    async def copia():
+        return "de la copia"
+
+    llamar, intentos = _llamada(original, copia)
+    inicio = time.monotonic()
+    assert asyncio.run(llamar_con_plazo(llamar, etapa="prueba_cobertura")) == ("de la copia", 0)
+    assert time.monotonic() - inicio < 1
+    assert len(intentos) == 2
+    assert estados == ["original_cancelada"]
+
+
+def test_reporte_sobrevive_a_un_5xx_de_deepseek(deepseek_falso):
+    deepseek_falso.fallar("ANÁLISIS DE INTERVENCIÓN", estado=503)
+    reporte, metadatos = asyncio.run(generar_reporte_cacheado("Sesión con un 503.", usar_cache=False, modo="completo"))
+    fase_2 = next(e for e in metadatos["etapas"] if e["etapa"] == "fase_2")
+    assert fase_2["reintentos"] == 1 and "error" not in fase_2
+    assert not metadatos["degradado"]
+    assert reporte["motivo_consulta"]
@@ -0,0 +1,46 @@
+import asyncio
+
+from sqlalchemy import select
+
+import models
+from cache import generar_reporte_cacheado
+from database import AsyncSessionLocal
+from historial import consultar_pagina
+from procesamiento import normalizar_reporte, guardar_reporte
+
+TEXTO = "Paciente: siento un nudo en el estómago cuando pienso en el trabajo."
+
+
+def test_modo_completo_usa_las_tres_fases(deepseek_falso):
+    reporte, metadatos = asyncio.run(generar_reporte_cacheado(TEXTO, usar_cache=False, modo="completo"))
+    assert [e["etapa"] for e in metadatos["etapas"]] == ["fase_1", "fase_2", "fase_3"]
+    assert (metadatos["modo"], metadatos["degradado"]) == ("completo", False)
+    assert (reporte["modo_reporte"], reporte["degradado"]) == ("completo", False)
+    assert len(deepseek_falso.peticiones) == 3
+
+
+def test_modo_rapido_es_una_llamada(deepseek_falso):
+    reporte, metadatos = asyncio.run(generar_reporte_cacheado(TEXTO, usar_cache=False, modo="rapido"))
+    assert [e["etapa"] for e in metadatos["etapas"]] == ["rapido"]
+    assert (metadatos["modo"], metadatos["degradado"]) == ("rapido", False)
+    assert reporte["motivo_consulta"]
+    assert len(deepseek_falso.peticiones) == 1
+
+
+def test_fase_2_fallida_marca_el_reporte_como_degradado(deepseek_falso, correr):
+    deepseek_falso.fallar("ANÁLISIS DE INTERVENCIÓN", estado=400)
+
+    async def escenario():
+        reporte, metadatos = await generar_reporte_cacheado(TEXTO, usar_cache=False, modo="completo")
+        reporte = normalizar_reporte(reporte)
+        async with AsyncSessionLocal() as db:
+            reporte_id = await guardar_reporte(db, reporte)
+            guardado = await db.get(models.Reporte, reporte_id)
+            pagina, _ = await consultar_pagina(db, limit=1, campos=("id", "modo_reporte", "degradado"))
+        return reporte, metadatos, guardado, pagina[0]
+
+    reporte, metadatos, guardado, en_historial = correr(escenario())
+    assert (metadatos["modo"], metadatos["degradado"]) == ("rapido", True)
+    assert (reporte["modo_reporte"], reporte["degradado"]) == ("rapido", True)
+    assert (guardado.modo_reporte, guardado.degradado) == ("rapido", True)
+    assert (en_historial.id, en_historial.modo_reporte, en_historial.degradado) == (guardado.id, "rapido", True)
@@ -0,0 +1,151 @@
+import os
+import asyncio
+
+import pytest
+
+import audio
+import cache
+import segmentacion
+from admision import Saturado
+from ingesta import AudioIngerido
+from segmentacion import planificar_cortes, segmentos_desde_cortes, unir_textos, SEGMENTOS_DESDE
+
+
+def test_corta_en_el_silencio_mas_cercano():
+    silencios = [(100, 110), (290, 310), (610, 620)]
+    assert planificar_cortes(1000, silencios, objetivo=300) == [300.0, 615.0]
+
+
+def test_sin_silencio_cerca_corta_en_seco():
+    assert planificar_cortes(700, [(10, 20)], objetivo=300) == [300.0]
+
+
+def test_audio_corto_no_se_corta():
+    assert planificar_cortes(350, [(170, 180)], objetivo=300) == []
+
+
+def test_segmentos_se_solapan():
+    assert segmentos_desde_cortes(1000, [300.0, 615.0], solape=3) == [
+        (0.0, 303.0), (297.0, 618.0), (612.0, 1000),
+    ]
+
+
+def test_unir_quita_el_solape():
+    anterior = "el paciente dice que su padre nunca lo escuchaba"
+    siguiente = "su padre nunca lo escuchaba cuando era niño"
+    assert unir_textos(anterior, siguiente) == (
+        "el paciente dice que su padre nunca lo escuchaba cuando era niño"
+    )
+
+
+def test_unir_ignora_mayusculas_y_puntuacion():
+    anterior = "Me duele la espalda desde el despido."
+    siguiente = "desde el despido, y no duermo bien"
+    assert unir_textos(anterior, siguiente) == "Me duele la espalda desde el despido. y no duermo bien"
+
+
+def test_unir_tolera_palabras_cortadas_en_el_borde():
+    anterior = "hablamos de la relación con su madre y de la escu"
+    siguiente = "ción con su madre y de la escuela primaria"
+    assert unir_textos(anterior, siguiente) == (
+        "hablamos de la relación con su madre y de la escuela primaria"
+    )
+
+
+@pytest.mark.parametrize("anterior, siguiente, esperado", [
+    ("hola que tal", "todo bien gracias", "hola que tal todo bien gracias"),
+    # Dos palabras en común no alcanzan para darlo por solape
+    ("uno dos tres", "dos tres cuatro", "uno dos tres dos tres cuatro"),
+    ("", "solo el segundo", "solo el segundo"),
+    ("solo el primero", "", "solo el primero"),
+])
+def test_unir_sin_solape_concatena(anterior, siguiente, esperado):
+    assert unir_textos(anterior, siguiente) == esperado
+
+
+# --- FFMPEG QUE NO PUEDE CON EL ARCHIVO ---
+
+def test_duracion_no_numerica_es_error_de_audio(monkeypatch):
+    async def ejecutar(*args):
+        return "N/A\n", ""
+
+    monkeypatch.setattr(audio, "FFMPEG", "ffmpeg")
+    monkeypatch.setattr(audio, "FFPROBE", "ffprobe")
+    monkeypatch.setattr(audio, "_ejecutar", ejecutar)
+    with pytest.raises(audio.ErrorAudio):
+        asyncio.run(audio.medir_duracion("grabacion.webm"))
+
+
+@pytest.fixture
+def whisper_falso(monkeypatch):
+    """ffmpeg 'instalado' y un Whisper que devuelve siempre el mismo texto."""
+    llamadas = []
+
+    async def transcribir(archivo, duracion=None):
+        llamadas.append(archivo)
+        return "texto completo"
+
+    monkeypatch.setattr(audio, "ffmpeg_disponible", lambda: True)
+    monkeypatch.setattr(cache, "transcribir_sesion_async", transcribir)
+    return llamadas
+
+
+def _fallar(*args, **kwargs):
+    async def falla():
+        raise audio.ErrorAudio("Invalid data found when processing input")
+    return falla()
+
+
+def _transcribir(modo, duracion=None):
+    ingerido = AudioIngerido("grabacion.webm")
+    ingerido.escribir(b"\0" * 1024)
+    ingerido.duracion = duracion
+    try:
+        return asyncio.run(cache._transcribir_normalizado(ingerido, modo))
+    finally:
+        ingerido.cerrar()
+
+
+@pytest.mark.parametrize("modo", ["auto", "segmentada"])
+def test_sin_duracion_se_transcribe_completo(monkeypatch, whisper_falso, modo):
+    monkeypatch.setattr(audio, "medir_duracion", _fallar)
+    texto, metadatos = _transcribir(modo)
+    assert texto == "texto completo"
+    assert metadatos["modo"] == "completa"
+    assert len(whisper_falso) == 1
+
+
+def test_si_no_se_puede_cortar_se_transcribe_completo(monkeypatch, whisper_falso):
+    monkeypatch.setattr(audio, "detectar_silencios", _fallar)
+    texto, metadatos = _transcribir("auto", duracion=2 * SEGMENTOS_DESDE)
+    assert (texto, metadatos["modo"]) == ("texto completo", "completa")
+
+
+def test_si_un_segmento_falla_se_cancelan_los_demas(monkeypatch):
+    estados = {}
+
+    async def silencios(ruta):
+        return []
+
+    async def recortar(ruta, inicio, fin, destino):
+        open(destino, "wb").close()
+        return destino
+
+    async def transcribir(ruta, duracion=None):
+        if ruta.endswith("segmento_000.flac"):
+            raise Saturado("whisper", 5, "presupuesto")
+        try:
+            await asyncio.sleep(5)
+            estados[ruta] = "terminada"
+        except asyncio.CancelledError:
+            estados[ruta] = "cancelada" if os.path.exists(ruta) else "sin_archivo"
+            raise
+
+    monkeypatch.setattr(audio, "detectar_silencios", silencios)
+    monkeypatch.setattr(audio, "recortar", recortar)
+    monkeypatch.setattr(segmentacion, "transcribir_sesion_async", transcribir)
+
+    with pytest.raises(Saturado):
+        asyncio.run(segmentacion.transcribir_segmentado("sesion.mp3", duracion=1000))
+    # Se cancelaron antes de borrar la carpeta, no quedaron corriendo
+    assert sorted(estados.values()) == ["cancelada", "cancelada"]
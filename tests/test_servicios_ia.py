@@ -0,0 +1,65 @@
+from servicios_ia import dividir_en_ventanas, fusionar_extracciones
+
+
+def _texto(frases):
+    return " ".join(f"Frase número {i} de la sesión con el paciente." for i in range(frases))
+
+
+def test_texto_corto_es_una_ventana():
+    texto = _texto(3)
+    assert dividir_en_ventanas(texto, max_tokens=1000) == [texto]
+
+
+def test_ventanas_respetan_el_tamano_y_cortan_en_fin_de_frase():
+    texto = _texto(200)
+    ventanas = dividir_en_ventanas(texto, max_tokens=100, solape_caracteres=50)
+    assert len(ventanas) > 1
+    for ventana in ventanas:
+        assert len(ventana) <= 400
+    for ventana in ventanas[:-1]:
+        assert ventana.endswith(".")
+
+
+def test_ventanas_cubren_todo_el_texto_con_solape():
+    texto = _texto(200)
+    ventanas = dividir_en_ventanas(texto, max_tokens=100, solape_caracteres=50)
+    for i in range(200):
+        assert any(f"Frase número {i} " in v for v in ventanas)
+    for anterior, siguiente in zip(ventanas, ventanas[1:]):
+        # Cada ventana empieza con un trozo del final de la anterior
+        assert siguiente[:20] in anterior
+
+
+def test_texto_sin_puntos_se_corta_en_seco():
+    texto = "palabra " * 500
+    ventanas = dividir_en_ventanas(texto, max_tokens=100, solape_caracteres=0)
+    assert "".join(ventanas).replace(" ", "") == texto.replace(" ", "")
+
+
+def test_fusionar_vacio():
+    assert fusionar_extracciones([]) == {}
+
+
+def test_fusionar_listas_sin_duplicados():
+    resultado = fusionar_extracciones([
+        {"sintomas": ["Dolor de espalda", "insomnio"]},
+        {"sintomas": ["dolor de espalda.", "Ansiedad"]},
+    ])
+    assert resultado == {"sintomas": ["Dolor de espalda", "insomnio", "Ansiedad"]}
+
+
+def test_fusionar_dicts_recursivo_y_primer_valor_gana():
+    resultado = fusionar_extracciones([
+        {"paciente": {"edad": "", "nombre": "Ana"}, "motivo": "duelo"},
+        {"paciente": {"edad": 40, "nombre": "Otra"}, "motivo": "trabajo"},
+        "no es un dict",
+    ])
+    assert resultado == {"paciente": {"edad": 40, "nombre": "Ana"}, "motivo": "duelo"}
+
+
+def test_fusionar_elementos_no_texto():
+    resultado = fusionar_extracciones([
+        {"citas": [{"t": 1, "texto": "a"}]},
+        {"citas": [{"texto": "a", "t": 1}, {"t": 2, "texto": "b"}]},
+    ])
+    assert resultado == {"citas": [{"t": 1, "texto": "a"}, {"t": 2, "texto": "b"}]}
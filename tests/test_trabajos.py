@@ -0,0 +1,133 @@
+import time
+import asyncio
+
+from sqlalchemy import select
+
+import models
+import trabajos
+from admision import Saturado
+from database import AsyncSessionLocal
+from ingesta import AudioIngerido
+from trabajos import GestorTrabajos, ColaLlena
+
+
+def _audio():
+    audio = AudioIngerido("sesion.mp3")
+    audio.escribir(b"\0" * 1024)
+    return audio
+
+
+async def _estados(*ids):
+    async with AsyncSessionLocal() as db:
+        filas = (await db.execute(
+            select(models.Trabajo.id, models.Trabajo.estado).where(models.Trabajo.id.in_(ids))
+        )).all()
+    return dict(filas)
+
+
+async def _crear(gestor, audio):
+    async with AsyncSessionLocal() as db:
+        return await gestor.crear(db, audio)
+
+
+def test_dos_subidas_con_un_solo_lugar(correr):
+    async def escenario():
+        gestor = GestorTrabajos(workers=0, max_cola=1)
+        await gestor.iniciar()
+        audios = [_audio(), _audio()]
+        resultados = await asyncio.gather(*[_crear(gestor, a) for a in audios], return_exceptions=True)
+        await gestor.detener()
+        return resultados, gestor.en_cola
+
+    resultados, en_cola = correr(escenario())
+    assert sorted(type(r).__name__ for r in resultados) == ["ColaLlena", "Trabajo"]
+    assert en_cola == 1
+
+
+def test_lugar_ocupado_durante_el_commit_marca_error(correr):
+    class SesionConIntruso:
+        """Mientras se hace el commit, un trabajo reencolado ocupa el último lugar."""
+
+        def __init__(self, db, gestor):
+            self.db, self.gestor = db, gestor
+
+        def add(self, objeto):
+            self.db.add(objeto)
+            self.objeto = objeto
+
+        async def commit(self):
+            self.gestor._cola.put_nowait(("otro", None, True, "auto", None, 0))
+            await self.db.commit()
+
+    async def escenario():
+        gestor = GestorTrabajos(workers=0, max_cola=1)
+        await gestor.iniciar()
+        async with AsyncSessionLocal() as db:
+            sesion = SesionConIntruso(db, gestor)
+            try:
+                await gestor.crear(sesion, _audio())
+                error = None
+            except ColaLlena as e:
+                error = e
+        await gestor.detener()
+        return error, await _estados(sesion.objeto.id), sesion.objeto.id
+
+    error, estados, trabajo_id = correr(escenario())
+    assert isinstance(error, ColaLlena)
+    assert estados == {trabajo_id: "error"}
+
+
+def test_saturado_vuelve_a_la_cola(correr, monkeypatch):
+    llamadas = []
+
+    async def procesar(trabajo_id, *_):
+        llamadas.append(trabajo_id)
+        if len(llamadas) == 1:
+            raise Saturado("whisper", 0.01, "presupuesto")
+        await trabajos._actualizar(trabajo_id, estado="completado")
+
+    monkeypatch.setattr(trabajos, "_procesar", procesar)
+
+    async def escenario():
+        gestor = GestorTrabajos(workers=1, max_cola=2)
+        await gestor.iniciar()
+        audio = _audio()
+        trabajo = await _crear(gestor, audio)
+        for _ in range(200):
+            if (await _estados(trabajo.id))[trabajo.id] == "completado":
+                break
+            await asyncio.sleep(0.01)
+        await gestor.detener()
+        return trabajo.id, await _estados(trabajo.id), audio
+
+    trabajo_id, estados, audio = correr(escenario())
+    assert llamadas == [trabajo_id, trabajo_id]
+    assert estados[trabajo_id] == "completado"
+    assert audio.archivo.closed
+
+
+def test_solo_se_marcan_los_trabajos_sin_latido(correr):
+    ahora = time.time()
+    filas = {
+        "propio": dict(instancia="yo", latido=ahora - 3600),
+        "ajeno_vivo": dict(instancia="otro", latido=ahora),
+        "ajeno_muerto": dict(instancia="otro", latido=ahora - 3600),
+        "anterior": dict(instancia=None, latido=None),
+    }
+
+    async def escenario():
+        async with AsyncSessionLocal() as db:
+            for nombre, campos in filas.items():
+                db.add(models.Trabajo(id=f"latido-{nombre}", estado="en_cola", **campos))
+            await db.commit()
+        gestor = GestorTrabajos(workers=0)
+        gestor.instancia = "yo"
+        await gestor._marcar_interrumpidos()
+        return await _estados(*[f"latido-{n}" for n in filas])
+
+    assert correr(escenario()) == {
+        "latido-propio": "en_cola",
+        "latido-ajeno_vivo": "en_cola",
+        "latido-ajeno_muerto": "error",
+        "latido-anterior": "error",
+    }
@@ -0,0 +1,90 @@
+import uuid
+import hashlib
+
+import pytest
+
+import audio
+import cache
+import servicios_ia
+from cache import clave_transcripcion, transcribir_cacheado
+from ingesta import AudioIngerido
+
+
+@pytest.fixture
+def whisper_contado(monkeypatch):
+    """Sin ffmpeg (una sola llamada) y un Whisper que cuenta cuántas veces lo llaman."""
+    llamadas = []
+
+    async def transcribir(archivo, duracion=None):
+        llamadas.append(archivo)
+        return f"transcripción {len(llamadas)}"
+
+    monkeypatch.setattr(audio, "FFMPEG", None)
+    monkeypatch.setattr(audio, "FFPROBE", None)
+    monkeypatch.setattr(cache, "transcribir_sesion_async", transcribir)
+    return llamadas
+
+
+def _audio(contenido):
+    ingerido = AudioIngerido("sesion.mp3")
+    ingerido.escribir(contenido)
+    ingerido.sha256 = hashlib.sha256(contenido).hexdigest()
+    return ingerido
+
+
+def test_mismo_audio_se_transcribe_una_vez(whisper_contado, correr):
+    contenido = uuid.uuid4().bytes * 100
+
+    async def escenario():
+        primero = await transcribir_cacheado(_audio(contenido))
+        segundo = await transcribir_cacheado(_audio(contenido), modo="auto")
+        return primero, segundo
+
+    (texto_1, meta_1), (texto_2, meta_2) = correr(escenario())
+    assert texto_1 == texto_2 == "transcripción 1"
+    assert (meta_1["desde_cache"], meta_2["desde_cache"]) == (False, True)
+    assert len(whisper_contado) == 1
+
+
+def test_otro_audio_vuelve_a_transcribir(whisper_contado, correr):
+    async def escenario():
+        await transcribir_cacheado(_audio(uuid.uuid4().bytes))
+        return await transcribir_cacheado(_audio(uuid.uuid4().bytes))
+
+    texto, _ = correr(escenario())
+    assert texto == "transcripción 2"
+
+
+def test_sin_cache_no_lee_ni_guarda(whisper_contado, correr):
+    contenido = uuid.uuid4().bytes
+
+    async def escenario():
+        await transcribir_cacheado(_audio(contenido), usar_cache=False)
+        await transcribir_cacheado(_audio(contenido), usar_cache=False)
+        return await transcribir_cacheado(_audio(contenido))
+
+    texto, metadatos = correr(escenario())
+    assert (texto, metadatos["desde_cache"]) == ("transcripción 3", False)
+
+
+def test_transcripcion_fallida_no_se_guarda(monkeypatch, whisper_contado, correr):
+    async def falla(archivo, duracion=None):
+        whisper_contado.append(archivo)
+        return None
+
+    monkeypatch.setattr(cache, "transcribir_sesion_async", falla)
+    contenido = uuid.uuid4().bytes
+
+    async def escenario():
+        await transcribir_cacheado(_audio(contenido))
+        return await transcribir_cacheado(_audio(contenido))
+
+    assert correr(escenario())[0] is None
+    assert len(whisper_contado) == 2
+
+
+def test_clave_cambia_con_los_parametros_de_whisper(monkeypatch):
+    sha = "a" * 64
+    antes = clave_transcripcion(sha)
+    monkeypatch.setitem(servicios_ia.PARAMETROS_WHISPER, "language", "en")
+    assert clave_transcripcion(sha) != antes
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+
+from sqlalchemy import update, or_
+
+from database import AsyncSessionLocal
+import models
+from procesamiento import normalizar_reporte, guardar_reporte
+from cache import generar_reporte_cacheado, transcribir_cacheado
+from admision import Saturado
+from metricas import asignar_id_peticion, asignar_id_interno, asignar_ruta_peticion
+
+# ==========================================
+# COLA DE TRABAJOS PARA /jobs/analyze_audio
+# ==========================================
+# El upload responde al instante con un ID y un pool acotado de workers
+# hace la transcripción y las fases del reporte en segundo plano.
+# El estado vive en la tabla 'trabajos' para que el cliente pueda consultar.
+#
+# La cola y el audio viven en memoria del proceso que recibió el upload.
+# Cada proceso marca sus trabajos activos con su instancia y renueva un
+# latido cada JOBS_LATIDO segundos; un trabajo activo sin latido reciente
+# quedó huérfano (su proceso murió) y se marca como error. Así varios
+# workers de uvicorn no se pisan los trabajos al reiniciar uno.
+
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", "2"))
+JOBS_MAX_COLA = int(os.environ.get("JOBS_MAX_COLA", "20"))
+# Veces que un trabajo vuelve a la cola cuando los modelos están saturados
+JOBS_REINTENTOS_SATURADO = int(os.environ.get("JOBS_REINTENTOS_SATURADO", "10"))
+JOBS_LATIDO = float(os.environ.get("JOBS_LATIDO", "30"))
+# Sin latido durante este tiempo, el proceso dueño se da por muerto
+JOBS_LATIDO_VENCIDO = float(os.environ.get("JOBS_LATIDO_VENCIDO", str(3 * JOBS_LATIDO)))
+
+ESTADOS_ACTIVOS = ("en_cola", "transcribiendo", "analizando")
+
+
+class ColaLlena(Exception):
+    """No hay lugar en la cola; el cliente debe reintentar más tarde."""
+
+
+def trabajo_a_dict(trabajo):
+    resultado = None
+    if trabajo.resultado:
+        try:
+            resultado = json.loads(trabajo.resultado)
+        except ValueError:
+            resultado = None
+
+    return {
+        "job_id": trabajo.id,
+        "estado": trabajo.estado,
+        "nombre_archivo": trabajo.nombre_archivo,
+        "creado": str(trabajo.created_at),
+        "actualizado": str(trabajo.updated_at),
+        "transcripcion": trabajo.transcripcion,
+        "analisis_ia": resultado,
+        "reporte_id": trabajo.reporte_id,
+        "error": trabajo.error,
+    }
+
+
+async def _actualizar(trabajo_id, **campos):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(models.Trabajo).where(models.Trabajo.id == trabajo_id).values(**campos))
+        await db.commit()
+
+
+async def _guardar(reporte_json):
+    async with AsyncSessionLocal() as db:
+        return await guardar_reporte(db, reporte_json)
+
+
+async def _procesar(trabajo_id, audio, usar_cache, modo_transcripcion, modo_reporte):
+    """Pipeline completo de un trabajo. Lo ejecuta un worker del pool."""
+    await _actualizar(trabajo_id, estado="transcribiendo")
+    texto_transcrito, _ = await transcribir_cacheado(audio, usar_cache, modo_transcripcion)
+    if not texto_transcrito:
+        await _actualizar(trabajo_id, estado="error", error="No se pudo transcribir el audio.")
+        return
+
+    await _actualizar(trabajo_id, estado="analizando", transcripcion=texto_transcrito)
+    reporte_json, _ = await generar_reporte_cacheado(texto_transcrito, usar_cache, modo_reporte)
+    reporte_json = normalizar_reporte(reporte_json)
+    reporte_id = await _guardar(reporte_json)
+
+    await _actualizar(
+        trabajo_id,
+        estado="completado",
+        resultado=json.dumps(reporte_json, ensure_ascii=False),
+        reporte_id=reporte_id,
+    )
+    print(f"✅ Trabajo {trabajo_id} completado.")
+
+
+class GestorTrabajos:
+    def __init__(self, workers=JOBS_WORKERS, max_cola=JOBS_MAX_COLA):
+        self.workers = workers
+        self.max_cola = max_cola
+        self._cola = None
+        self._tareas = []
+        self._reencolados = set()
+        self._reservados = 0    # lugares tomados por crear() mientras espera el commit
+        self._latidos = None
+        self.instancia = uuid.uuid4().hex[:12]
+
+    @property
+    def en_cola(self):
+        return self._cola.qsize() if self._cola else 0
+
+    async def iniciar(self):
+        self._cola = asyncio.Queue(maxsize=self.max_cola)
+        await self._marcar_interrumpidos()
+        self._tareas = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._latidos = asyncio.create_task(self._latir())
+        print(f"⚙️ Cola de trabajos lista ({self.workers} workers, máx {self.max_cola} en cola).")
+
+    async def detener(self):
+        tareas = [*self._tareas, *self._reencolados, *([self._latidos] if self._latidos else [])]
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        self._tareas = []
+        self._latidos = None
+
+    async def crear(self, db, audio, usar_cache=True, modo_transcripcion="auto", modo_reporte=None):
+        """Registra el trabajo y lo encola. Lanza ColaLlena si no hay lugar."""
+        # El lugar se reserva antes del commit: otro upload puede llegar mientras se espera la base
+        if self._cola is None or self._cola.qsize() + self._reservados >= self.max_cola:
+            raise ColaLlena()
+        self._reservados += 1
+        try:
+            trabajo = models.Trabajo(
+                id=uuid.uuid4().hex, estado="en_cola", nombre_archivo=audio.nombre,
+                instancia=self.instancia, latido=time.time(),
+            )
+            db.add(trabajo)
+            await db.commit()
+        finally:
+            self._reservados -= 1
+
+        try:
+            self._cola.put_nowait((trabajo.id, audio, usar_cache, modo_transcripcion, modo_reporte, 0))
+        except asyncio.QueueFull:
+            # Un trabajo reencolado ocupó el lugar durante el commit
+            await _actualizar(trabajo.id, estado="error", error="La cola de análisis estaba llena.")
+            raise ColaLlena()
+        return trabajo
+
+    async def _reencolar(self, item, espera):
+        """Devuelve el trabajo a la cola cuando pase 'espera' (el audio sigue abierto)."""
+        try:
+            await asyncio.sleep(espera)
+            await self._cola.put(item)
+        except asyncio.CancelledError:
+            item[1].cerrar()
+            raise
+
+    async def _worker(self, numero):
+        while True:
+            item = await self._cola.get()
+            trabajo_id, audio, usar_cache, modo_transcripcion, modo_reporte, saturaciones = item
+            print(f"🛠️ Worker {numero} tomó el trabajo {trabajo_id}")
+            # Los logs estructurados del trabajo llevan su ID en vez del de una petición
+            asignar_id_peticion(f"job-{trabajo_id}")
+            asignar_id_interno()
+            asignar_ruta_peticion("/jobs/analyze_audio")
+            cerrar_audio = True
+            try:
+                await _procesar(trabajo_id, audio, usar_cache, modo_transcripcion, modo_reporte)
+            except Saturado as e:
+                if saturaciones >= JOBS_REINTENTOS_SATURADO:
+                    print(f"❌ Trabajo {trabajo_id}: modelos saturados tras {saturaciones} reintentos.")
+                    await _actualizar(trabajo_id, estado="error", error=str(e))
+                else:
+                    # Un trabajo en segundo plano puede esperar capacidad en vez de fallar
+                    print(f"⏳ Trabajo {trabajo_id} vuelve a la cola en {e.reintentar_en} s ({e.recurso} saturado).")
+                    await _actualizar(trabajo_id, estado="en_cola")
+                    tarea = asyncio.create_task(self._reencolar((*item[:5], saturaciones + 1), e.reintentar_en))
+                    self._reencolados.add(tarea)
+                    tarea.add_done_callback(self._reencolados.discard)
+                    cerrar_audio = False
+            except Exception as e:
+                print(f"❌ Error en trabajo {trabajo_id}: {e}")
+                await _actualizar(trabajo_id, estado="error", error=str(e))
+            finally:
+                if cerrar_audio:
+                    audio.cerrar()
+                self._cola.task_done()
+
+    async def _latir(self):
+        while True:
+            await asyncio.sleep(JOBS_LATIDO)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(models.Trabajo)
+                        .where(models.Trabajo.instancia == self.instancia, models.Trabajo.estado.in_(ESTADOS_ACTIVOS))
+                        .values(latido=time.time())
+                    )
+                    await db.commit()
+                # También se recogen los huérfanos de procesos que murieron sin reiniciar
+                await self._marcar_interrumpidos()
+            except Exception as e:
+                print(f"⚠️ No se pudo renovar el latido de los trabajos: {e}")
+
+    async def _marcar_interrumpidos(self):
+        """Los trabajos activos cuyo proceso dejó de latir ya no tienen worker ni audio."""
+        vencido = time.time() - JOBS_LATIDO_VENCIDO
+        async with AsyncSessionLocal() as db:
+            resultado = await db.execute(
+                update(models.Trabajo)
+                .where(
+                    models.Trabajo.estado.in_(ESTADOS_ACTIVOS),
+                    models.Trabajo.instancia.is_distinct_from(self.instancia),
+                    # Los trabajos de antes de esta columna no tienen latido
+                    or_(models.Trabajo.latido.is_(None), models.Trabajo.latido < vencido),
+                )
+                .values(estado="error", error="Interrumpido por reinicio del servidor.")
+            )
+            await db.commit()
+        if resultado.rowcount:
+            print(f"⚠️ {resultado.rowcount} trabajos interrumpidos marcados como error.")
+
+
+gestor = GestorTrabajos()